@@ -1,37 +1,57 @@
 import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 import io
+import logging
 import os
-from openpyxl.utils import get_column_letter
-from openpyxl.styles import PatternFill, Font, Alignment
-from openpyxl.formatting.rule import ColorScaleRule, DataBarRule
-from openpyxl.chart import LineChart, Reference
-from openpyxl.chart.axis import DateAxis
-from openpyxl.chart.label import DataLabelList
-from openpyxl.chart.shapes import GraphicalProperties
-from openpyxl.drawing.line import LineProperties
-from openpyxl.drawing.colors import ColorChoice # Import ColorChoice
-from openpyxl.styles.colors import Color
 from datetime import datetime
 import config
+from instrumentation import StageTimings
+import presets
+from dataset_cache import combined_usage_key, content_hash, get_dataset_cache, target_key, usage_report_key
+from memory_guard import MemoryBudget, MemoryBudgetExceeded, estimate_ingest_bytes
+from progress import LoggingProgressSink, SocketIOProgressSink
+from result_cache import analysis_result_key, normalize_filters
 from rui_calculator import RUICalculator
+from usage_reader import UsageStore, filter_emails, iter_usage_report_chunks, read_usage_report
+
+
+logger = logging.getLogger(__name__)
 
 
 class CopilotAnalyzer:
-    def __init__(self, socketio, sid):
+    # Implementations of the per-user metrics step, by engine name (see config.ANALYSIS_ENGINES)
+    USER_METRICS_ENGINES = {'reference': '_user_metrics_reference'}
+
+    def __init__(self, socketio=None, sid=None, progress=None, cancel_check=None, engines=None):
+        """
+        Args:
+            socketio, sid: Report progress to this Socket.IO client (kept for the web app)
+            progress: A ProgressSink; overrides socketio/sid. Headless runs log progress by default.
+            cancel_check: Called at every status update; raises (e.g. JobCancelled) to stop the run
+            engines: Overrides of config.ANALYSIS_ENGINES, e.g. {'peer_groups': 'reference'}
+        """
         self.socketio = socketio
         self.sid = sid
+        if progress is None:
+            progress = SocketIOProgressSink(socketio, sid) if socketio is not None else LoggingProgressSink()
+        self.progress = progress
+        self.cancel_check = cancel_check
         self.full_usage_data = None
         self.utilized_metrics_df = None
         self.target_df = None
+        self.target_preset = None
+        self.memory_budget = MemoryBudget(config.ANALYSIS_MEMORY_BUDGET_MB)
+        self.dataset_cache = get_dataset_cache()
+        self.file_hashes = {}
+        self.timings = StageTimings()
+        self.engines = dict(config.ANALYSIS_ENGINES, **(engines or {}))
 
     def update_status(self, message):
-        self.socketio.emit('status_update', {'message': message}, to=self.sid)
-        self.socketio.sleep(0.1)
+        # Status updates mark stage boundaries, so they double as cancellation points
+        if self.cancel_check is not None:
+            self.cancel_check()
+        self.progress.publish(message)
 
     def detect_adoption_date(self, user_history_df, tool_cols):
         user_history_df = user_history_df.sort_values(by='Report Refresh Date')
@@ -81,231 +101,230 @@ class CopilotAnalyzer:
             return "User is active but inconsistent. Further coaching could help them maximize the tool's benefits."
         return ""
 
-    def execute_analysis(self, usage_file_paths, target_user_path, filters):
+    def ingest_email_filter(self, target_user_path):
+        """Lower-case target population used to drop other users' rows at ingest, if enabled"""
+        if not config.USAGE_INGEST_TARGET_ONLY or not target_user_path or not os.path.exists(target_user_path):
+            return None
+        try:
+            target_upns = pd.read_csv(target_user_path, usecols=['UserPrincipalName'], dtype=str, encoding='utf-8-sig')
+        except ValueError:
+            # No UserPrincipalName column - nothing to filter on
+            return None
+        return set(target_upns['UserPrincipalName'].dropna().str.lower())
+
+    def read_target_file(self, target_user_path):
+        """
+        Parsed target file: a preloaded preset with the same content, or from the dataset cache
+        when the same file was parsed before
+        """
+        try:
+            digest = content_hash(target_user_path, self.file_hashes)
+        except OSError:
+            digest = None  # read_csv below reports missing files as usual
+        preset = presets.preset_for_hash(digest)
+        self.target_preset = preset
+        if preset is not None:
+            # Shared with other jobs (copy-on-write in pool workers); filtering never modifies it
+            return preset.target_df
+        cache_key = target_key(digest) if digest and self.dataset_cache.enabled else None
+        target_df = self.dataset_cache.get(cache_key) if cache_key else None
+        if target_df is None:
+            target_df = pd.read_csv(target_user_path, encoding='utf-8-sig')
+            if cache_key:
+                self.dataset_cache.put(cache_key, target_df)
+        return target_df
+
+    def usage_cache_keys(self, usage_file_paths, emails):
+        """Per-report and combined cache keys, or None when caching does not apply"""
+        # Rows filtered to a target population at ingest are specific to that population
+        if not self.dataset_cache.enabled or emails is not None:
+            return None
+        try:
+            hashes = [content_hash(path, self.file_hashes) for path in usage_file_paths.values()]
+        except OSError:
+            return None
+        return [usage_report_key(h) for h in hashes], combined_usage_key(hashes)
+
+    def load_usage_reports(self, usage_file_paths, emails=None):
+        """Read every usage report into one frame (None if nothing could be read)"""
+        cache_keys = self.usage_cache_keys(usage_file_paths, emails)
+        if cache_keys:
+            cached = self.dataset_cache.get(cache_keys[1])
+            if cached is not None:
+                logger.info("Loaded %d usage reports from the dataset cache", len(usage_file_paths))
+                # Stores are cached rather than frames, which pickle with a copy of their dates
+                return cached if isinstance(cached, pd.DataFrame) else cached.to_frame()
+
+        chunk_rows = config.USAGE_INGEST_CHUNK_ROWS
+        if not chunk_rows:
+            self.memory_budget.check_estimate("1. Loading usage reports", estimate_ingest_bytes(usage_file_paths.values()))
+        store = UsageStore()
+        logger.info("Starting to process %d usage reports", len(usage_file_paths))
+        i = 0
+        for file_path in usage_file_paths.values():
+            i += 1
+            try:
+                cached = self.dataset_cache.get(cache_keys[0][i - 1]) if cache_keys else None
+                if isinstance(cached, pd.DataFrame):
+                    # Cached whole by earlier versions
+                    file_store = UsageStore()
+                    file_store.append(filter_emails(cached, None))
+                elif cached is not None:
+                    file_store = cached
+                else:
+                    # Only the UPN, report date and tool activity columns are read; dates are
+                    # parsed per report so each layout's detected formats can be reused. Reports
+                    # are stored compactly as they are read, chunk by chunk when chunk_rows is set
+                    file_store = UsageStore()
+                    if chunk_rows:
+                        for chunk in iter_usage_report_chunks(file_path, chunk_rows, emails):
+                            file_store.append(chunk)
+                            del chunk  # released before the next chunk is read
+                            self.memory_budget.check("1. Loading usage reports")
+                    else:
+                        report = read_usage_report(file_path, emails=emails)
+                        file_store.append(report if emails is not None else filter_emails(report, None))
+                        del report
+                    if cache_keys and len(file_store):
+                        self.dataset_cache.put(cache_keys[0][i - 1], file_store)
+                store.merge(file_store)
+                del file_store
+                source = "Loaded from dataset cache" if cached is not None else "Successfully loaded"
+                logger.debug("(%d/%d) %s: %s", i, len(usage_file_paths), source, file_path)
+            except MemoryBudgetExceeded:
+                raise
+            except Exception as e:
+                logger.warning("(%d/%d) Could not read file %s: %s", i, len(usage_file_paths), file_path, e)
+                continue
+            self.memory_budget.check("1. Loading usage reports")
+        logger.info("Finished processing usage reports. Total dataframes loaded: %d", len(store))
+        if not len(store):
+            return None
+        if cache_keys:
+            self.dataset_cache.put(cache_keys[1], store)
+        # Emails are lower-cased per report, so the frame needs no further pass
+        return store.to_frame()
+
+    def result_cache_key(self, usage_file_paths, target_user_path, filters):
+        """Memoization key for a whole analysis, or None when results should not be cached"""
+        if not config.RESULT_CACHE_ENABLED or not self.dataset_cache.enabled:
+            return None
+        try:
+            usage_hashes = [content_hash(path, self.file_hashes) for path in usage_file_paths.values()]
+            target_hash = content_hash(target_user_path, self.file_hashes) if target_user_path else None
+        except OSError:
+            return None
+        return analysis_result_key(usage_hashes, target_hash, normalize_filters(filters, bool(target_user_path)),
+                                   self.engines)
+
+    def execute_analysis(self, usage_file_paths, target_user_path, filters, file_hashes=None):
+        """Run an analysis, returning the memoized result when the same inputs were analyzed before"""
+        # Content hashes recorded at upload time, by path; missing ones are computed on demand
+        self.file_hashes = dict(file_hashes or {})
+        self.timings = StageTimings()
+        total = self.timings.start('total')
+        try:
+            with self.timings.stage('result_cache_lookup'):
+                cache_key = self.result_cache_key(usage_file_paths, target_user_path, filters)
+                cached = self.dataset_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                self.full_usage_data = cached['result']['deep_dive_data']['full_usage_data']
+                self.utilized_metrics_df = cached['result']['deep_dive_data']['utilized_metrics_df']
+                self.manager_summary_df = cached['manager_summary_df']
+                self.update_status("Loaded identical analysis from cache. Reports are ready for download.")
+                results = cached['result']
+            else:
+                results = self.run_analysis(usage_file_paths, target_user_path, filters)
+                if cache_key and 'error' not in results:
+                    self.dataset_cache.put(cache_key, {'result': results, 'manager_summary_df': getattr(self, 'manager_summary_df', None)})
+        except BaseException:
+            total.stop(error=True)
+            raise
+        # Added after caching so a replayed result reports its own (cache hit) timings
+        total.stop(rows=len(self.utilized_metrics_df) if self.utilized_metrics_df is not None and 'error' not in results else None)
+        results['timings'] = self.timings.to_list()
+        self.timings.log(cached=cached is not None, error=results.get('error'))
+        return results
+
+    def run_analysis(self, usage_file_paths, target_user_path, filters):
         try:
             self.update_status("1. Loading usage reports from server...")
-            all_reports = []
-            print(f"--- Starting to process {len(usage_file_paths)} usage reports ---")
-            i = 0
-            for file_path in usage_file_paths.values():
-                i += 1
-                try:
-                    df = pd.read_csv(file_path) if file_path.lower().endswith('.csv') else pd.read_excel(file_path)
-                    all_reports.append(df)
-                    print(f"({i}/{len(usage_file_paths)}) Successfully loaded: {file_path}")
-                except Exception as e:
-                    print(f"({i}/{len(usage_file_paths)}) Could not read file {file_path}: {e}")
-                    continue
-            print(f"--- Finished processing usage reports. Total dataframes loaded: {len(all_reports)} ---")
-            if not all_reports: return {'error': "No usage reports could be read or they were empty."}
-            usage_df = pd.concat(all_reports, ignore_index=True)
-            usage_df['User Principal Name'] = usage_df['User Principal Name'].str.lower()
-            date_cols = [col for col in usage_df.columns if 'date' in col.lower()]
-            for col in date_cols:
-                usage_df[col] = pd.to_datetime(usage_df[col], errors='coerce', format='mixed')
-            self.full_usage_data = usage_df.copy()
-            utilized_emails = set(usage_df['User Principal Name'].unique())
-            # Store the original count from usage files
-            original_usage_count = len(utilized_emails)
+            with self.timings.stage('load_usage_reports') as stage:
+                usage_df = self.load_usage_reports(usage_file_paths, self.ingest_email_filter(target_user_path))
+                stage.rows = len(usage_df) if usage_df is not None else None
+            if usage_df is None: return {'error': "No usage reports could be read or they were empty."}
+            with self.timings.stage('apply_filters') as stage:
+                self.full_usage_data = usage_df
+                self.memory_budget.check("1. Combining usage reports")
+                utilized_emails = set(usage_df['User Principal Name'].unique())
+                # Store the original count from usage files
+                original_usage_count = len(utilized_emails)
             
-            # Store target_df for later use with RUI
-            self.target_df = None
+                # Store target_df for later use with RUI
+                self.target_df = None
             
-            if target_user_path:
-                self.update_status("Applying filters...")
-                try:
-                    target_df = pd.read_csv(target_user_path, encoding='utf-8-sig')
-                    self.target_df = target_df.copy()  # Store for RUI calculation
+                if target_user_path:
+                    self.update_status("Applying filters...")
+                    try:
+                        target_df = self.read_target_file(target_user_path)
+                        self.target_df = target_df  # Store for RUI calculation; filters below never modify it in place
                     
-                    # Apply filters only if file was successfully loaded
-                    if filters.get('companies'):
-                        vals = set([v.lower() for v in filters['companies']])
-                        if 'Company' in target_df.columns:
-                            target_df = target_df[target_df['Company'].str.lower().isin(vals)]
-                    if filters.get('departments'):
-                        vals = set([v.lower() for v in filters['departments']])
-                        if 'Department' in target_df.columns:
-                            target_df = target_df[target_df['Department'].str.lower().isin(vals)]
-                    if filters.get('locations'):
-                        vals = set([v.lower() for v in filters['locations']])
-                        if 'City' in target_df.columns:
-                            target_df = target_df[target_df['City'].str.lower().isin(vals)]
-                    if filters.get('managers'):
-                        if 'ManagerLine' in target_df.columns:
-                            target_df['ManagerLine_lc'] = target_df['ManagerLine'].str.lower().fillna('')
-                            managers_lc = [m.strip().lower() for m in filters['managers']]
-                            target_df = target_df[target_df['ManagerLine_lc'].apply(lambda s: any(m == part.strip() for part in s.split('->') for m in managers_lc))]
+                        # Apply filters only if file was successfully loaded
+                        if filters.get('companies'):
+                            vals = set([v.lower() for v in filters['companies']])
+                            if 'Company' in target_df.columns:
+                                target_df = target_df[target_df['Company'].str.lower().isin(vals)]
+                        if filters.get('departments'):
+                            vals = set([v.lower() for v in filters['departments']])
+                            if 'Department' in target_df.columns:
+                                target_df = target_df[target_df['Department'].str.lower().isin(vals)]
+                        if filters.get('locations'):
+                            vals = set([v.lower() for v in filters['locations']])
+                            if 'City' in target_df.columns:
+                                target_df = target_df[target_df['City'].str.lower().isin(vals)]
+                        if filters.get('managers'):
+                            if 'ManagerLine' in target_df.columns:
+                                managers_lc = [m.strip().lower() for m in filters['managers']]
+                                if self.target_preset is not None and all(managers_lc):
+                                    # The preset's manager index replaces splitting every ManagerLine
+                                    target_df = target_df[target_df.index.isin(self.target_preset.rows_under(managers_lc))]
+                                else:
+                                    manager_lines_lc = target_df['ManagerLine'].str.lower().fillna('')
+                                    target_df = target_df[manager_lines_lc.apply(lambda s: any(m == part.strip() for part in s.split('->') for m in managers_lc))]
                     
-                    filtered_emails_before = len(utilized_emails)
-                    utilized_emails = utilized_emails.intersection(set(target_df['UserPrincipalName'].str.lower()))
-                    filtered_emails_after = len(utilized_emails)
+                        filtered_emails_before = len(utilized_emails)
+                        utilized_emails = utilized_emails.intersection(set(target_df['UserPrincipalName'].str.lower()))
+                        filtered_emails_after = len(utilized_emails)
                     
-                    # Log the filtering impact
-                    if filtered_emails_before != filtered_emails_after:
-                        self.update_status(f"Filtered from {filtered_emails_before} to {filtered_emails_after} users based on target file")
+                        # Log the filtering impact
+                        if filtered_emails_before != filtered_emails_after:
+                            self.update_status(f"Filtered from {filtered_emails_before} to {filtered_emails_after} users based on target file")
                     
-                except FileNotFoundError:
-                    print(f"Warning: Manager report file not found: {target_user_path}")
-                    print("Continuing without manager data - will use global peer groups for RUI calculation")
-                    self.target_df = None
-                    # Skip filtering since no target file exists - keep all utilized_emails
-            if not utilized_emails: return {'error': "No matching users found to analyze."}
-            # Validation: Log the filtering results
-            if target_user_path:
-                original_count = len(set(usage_df['User Principal Name'].unique()))
-                filtered_count = len(utilized_emails)
-                if original_count > filtered_count * 1.3:  # If more than 30% difference
-                    self.update_status(f"Warning: Large difference in user counts - {original_count} in usage data vs {filtered_count} after filtering")
+                    except FileNotFoundError:
+                        logger.warning("Manager report file not found: %s", target_user_path)
+                        logger.warning("Continuing without manager data - will use global peer groups for RUI calculation")
+                        self.target_df = None
+                        # Skip filtering since no target file exists - keep all utilized_emails
+                stage.rows = len(utilized_emails)
+                if not utilized_emails: return {'error': "No matching users found to analyze."}
+                # Validation: Log the filtering results
+                if target_user_path:
+                    original_count = len(set(usage_df['User Principal Name'].unique()))
+                    filtered_count = len(utilized_emails)
+                    if original_count > filtered_count * 1.3:  # If more than 30% difference
+                        self.update_status(f"Warning: Large difference in user counts - {original_count} in usage data vs {filtered_count} after filtering")
             self.update_status("2. Calculating user metrics...")
-            matched_users_df = usage_df[usage_df['User Principal Name'].isin(utilized_emails)].copy()
-            copilot_tool_cols = [col for col in matched_users_df.columns if 'Last activity date of' in col]
-            min_report_date, max_report_date = usage_df['Report Refresh Date'].min(), usage_df['Report Refresh Date'].max()
-            self.reference_date = max_report_date  # Set reference date for consistent calculations
-            total_months_in_period = (max_report_date.year - min_report_date.year) * 12 + max_report_date.month - min_report_date.month + 1
-            user_metrics = []
-            total_users = len(utilized_emails)
-            processed = 0
-            for email in utilized_emails:
-                processed += 1
-                if processed % 50 == 0 or processed == total_users:
-                    self.update_status(f"2b. Processing users: {processed} of {total_users} (filtered)...")
-                user_data = matched_users_df[matched_users_df['User Principal Name'] == email]
-                user_data_sorted = user_data.sort_values(by='Report Refresh Date')
-                user_data_sorted['Row Recency'] = user_data_sorted[copilot_tool_cols].max(axis=1)
-                adoption_date = self.detect_adoption_date(user_data_sorted.copy(), copilot_tool_cols)
-                is_reactivated = False
-                recency_series = user_data_sorted['Row Recency'].dropna()
-                if len(recency_series) >= 3:
-                    latest_date, prev_date_1, prev_date_2 = recency_series.iloc[-1], recency_series.iloc[-2], recency_series.iloc[-3]
-                    if pd.notna(latest_date) and pd.notna(prev_date_1) and pd.notna(prev_date_2):
-                        if prev_date_1 == prev_date_2 and latest_date > prev_date_1: is_reactivated = True
-                activity_dates = pd.to_datetime(user_data[copilot_tool_cols].stack().dropna().unique())
-                if len(activity_dates) == 0:
-                    first_activity, last_activity, active_months, complexity, avg_tools_per_month, trend = pd.NaT, pd.NaT, 0, 0, 0, "N/A"
-                    trend_details = {}
-                    report_dates = user_data['Report Refresh Date'].unique()
-                    if len(report_dates) > 0: first_activity = pd.to_datetime(report_dates).min()
-                else:
-                    # Ensure we're getting the absolute maximum date across all tools and reports
-                    all_tool_dates_raw = user_data[copilot_tool_cols].values.flatten()
-                    all_tool_dates_raw = pd.to_datetime(all_tool_dates_raw[pd.notna(all_tool_dates_raw)])
-                    # Filter out any dates that are in the future relative to the last report
-                    all_tool_dates = all_tool_dates_raw[all_tool_dates_raw <= self.reference_date]
-                    last_activity = all_tool_dates.max() if len(all_tool_dates) > 0 else self.reference_date
-                    first_activity = activity_dates.min()
-                    if pd.notna(adoption_date):
-                        first_activity = adoption_date
-                    active_months = len(pd.to_datetime(activity_dates).to_period('M').unique())
-                    complexity = user_data[copilot_tool_cols].notna().any().sum()
-                    monthly_activity = user_data.groupby(pd.to_datetime(user_data['Report Refresh Date']).dt.to_period('M'))[copilot_tool_cols].apply(lambda x: x.notna().sum()).reset_index()
-                    monthly_activity.columns = ['Month'] + copilot_tool_cols
-                    # Calculate average tools per report correctly
-                    tools_per_report = user_data.groupby('Report Refresh Date')[copilot_tool_cols].apply(lambda x: x.notna().sum(axis=1).sum())
-                    avg_tools_per_month = tools_per_report.mean() if len(tools_per_report) > 0 else 0.0
-                    # Improved trend analysis with recent momentum
-                    trend = "N/A"
-                    trend_details = {}
-                    
-                    trend_details = {}
-                    if len(activity_dates) > 1:
-                        # Get report-level activity
-                        report_activity = user_data.groupby('Report Refresh Date')[copilot_tool_cols].apply(
-                            lambda x: x.notna().sum(axis=1).sum()
-                        ).sort_index()
-                        
-                        if len(report_activity) >= 2:
-                            # Calculate different time windows
-                            last_30_days = self.reference_date - pd.Timedelta(days=30)
-                            last_60_days = self.reference_date - pd.Timedelta(days=60)
-                            last_90_days = self.reference_date - pd.Timedelta(days=90)
-                            
-                            # Get activity in different periods
-                            recent_activity = report_activity[report_activity.index > last_30_days]
-                            medium_activity = report_activity[(report_activity.index > last_60_days) & (report_activity.index <= last_30_days)]
-                            older_activity = report_activity[(report_activity.index > last_90_days) & (report_activity.index <= last_60_days)]
-                            
-                            # Calculate averages for each period
-                            recent_avg = recent_activity.mean() if len(recent_activity) > 0 else 0
-                            medium_avg = medium_activity.mean() if len(medium_activity) > 0 else 0
-                            older_avg = older_activity.mean() if len(older_activity) > 0 else 0
-                            
-                            # Determine trend based on momentum
-                            if recent_avg > 0:
-                                if medium_avg == 0 and older_avg == 0:
-                                    trend = "New Momentum"  # Just started using
-                                elif recent_avg > medium_avg * 1.2:
-                                    if medium_avg > older_avg * 1.2:
-                                        trend = "Accelerating"  # Increasing faster
-                                    else:
-                                        trend = "Recovering"  # Was declining, now increasing
-                                elif recent_avg < medium_avg * 0.8:
-                                    if medium_avg < older_avg * 0.8:
-                                        trend = "Declining"  # Decreasing consistently
-                                    else:
-                                        trend = "Cooling"  # Was increasing, now decreasing
-                                else:
-                                    trend = "Stable"
-                            elif medium_avg > 0:
-                                trend = "Dormant"  # Was active but stopped recently
-                            else:
-                                trend = "Inactive"  # No recent activity
-                            
-                            # Store detailed metrics for debugging
-                            trend_details = {
-                                'recent_avg': recent_avg,
-                                'medium_avg': medium_avg,
-                                'older_avg': older_avg
-                            }
-                consistency = (active_months / total_months_in_period) * 100 if total_months_in_period > 0 else 0
-                
-                # Calculate license-aware metrics with improved approach
-                license_start = adoption_date if pd.notna(adoption_date) else first_activity
-                tool_expansion_rate = 0
-                if pd.notna(license_start):
-                    days_since_license = (self.reference_date - license_start).days + 1  # Add 1 to include start day
-                    adoption_velocity = complexity / max(days_since_license, 1)  # Tools per day
-                    
-                    # Calculate tool expansion rate (tools adopted per month)
-                    if days_since_license > 30:  # Only calculate for users with at least 30 days
-                        months_since_start = max(1, days_since_license / 30)
-                        tool_expansion_rate = complexity / months_since_start
-                    
-                    # Improved consistency calculation with minimum evaluation period
-                    # Only adjust consistency for users with less than minimum period
-                    min_evaluation_days = 60  # Minimum 60 days for fair evaluation
-                    if days_since_license <= min_evaluation_days:
-                        # For new users, use a blended approach to prevent inflated scores
-                        adjusted_consistency = (consistency * 0.7) + (min(100, (active_months / max(1, days_since_license / 30)) * 100) * 0.3)
-                    else:
-                        # For established users, use a balanced approach that considers both overall and recent patterns
-                        months_since_license = (self.reference_date.year - license_start.year) * 12 + self.reference_date.month - license_start.month + 1
-                        months_since_license = max(1, months_since_license)
-                        raw_adjusted_consistency = (active_months / months_since_license) * 100 if months_since_license > 0 else 0
-                        # Blend overall consistency with adjusted consistency
-                        adjusted_consistency = (consistency * 0.6) + (raw_adjusted_consistency * 0.4)
-                else:
-                    adjusted_consistency = consistency
-                    adoption_velocity = 0
-                    days_since_license = 0
-                    tool_expansion_rate = 0                
-                user_metrics.append({
-                     'Email': email, 
-                     'Usage Consistency (%)': consistency,
-                     'Adjusted Consistency (%)': adjusted_consistency,
-                     'Overall Recency': last_activity, 
-                     'Usage Complexity': complexity, 
-                     'Avg Tools / Report': avg_tools_per_month, 
-                     'Adoption Velocity': adoption_velocity,
-                     'Tool Expansion Rate': tool_expansion_rate,
-                     'Days Since License': days_since_license,
-                     'Usage Trend': trend,
-                     'Trend Details': trend_details,
-                     'Appearances': user_data['Report Refresh Date'].nunique(), 
-                     'First Appearance': first_activity, 
-                     'Adoption Date': adoption_date, 
-                     'is_reactivated': is_reactivated
-                 })
-            self.utilized_metrics_df = pd.DataFrame(user_metrics)
+            with self.timings.stage('user_metrics') as stage:
+                matched_users_df = usage_df[usage_df['User Principal Name'].isin(utilized_emails)]
+                copilot_tool_cols = [col for col in matched_users_df.columns if 'Last activity date of' in col]
+                min_report_date, max_report_date = usage_df['Report Refresh Date'].min(), usage_df['Report Refresh Date'].max()
+                self.reference_date = max_report_date  # Set reference date for consistent calculations
+                total_months_in_period = (max_report_date.year - min_report_date.year) * 12 + max_report_date.month - min_report_date.month + 1
+                total_users = len(utilized_emails)
+                user_metrics = self.compute_user_metrics(matched_users_df, utilized_emails, copilot_tool_cols, total_months_in_period)
+                self.utilized_metrics_df = pd.DataFrame(user_metrics)
+                self.memory_budget.check("2. Calculating user metrics")
+                stage.rows = total_users
             if self.utilized_metrics_df.empty: return {'error': "No data available for the selected users."}
             # Ensure numeric dtype to avoid Series truth-value ambiguity
             self.utilized_metrics_df['Usage Consistency (%)'] = pd.to_numeric(self.utilized_metrics_df['Usage Consistency (%)'], errors='coerce').fillna(0)
@@ -383,14 +402,16 @@ class CopilotAnalyzer:
             ).reset_index(drop=True)
             self.utilized_metrics_df['Global Rank'] = self.utilized_metrics_df.index + 1
             self.update_status("3. Classifying users...")
-            self.utilized_metrics_df['Classification'] = self.utilized_metrics_df.apply(self.get_manager_classification, axis=1)
-            self.utilized_metrics_df['Justification'] = self.utilized_metrics_df.apply(self.get_justification, axis=1)
-            reallocation_df, under_utilized_df, top_utilizers_df = self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'For Reallocation'], self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'Under-Utilized'], self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'Top Utilizer']
+            with self.timings.stage('classify_users') as stage:
+                self.utilized_metrics_df['Classification'] = self.utilized_metrics_df.apply(self.get_manager_classification, axis=1)
+                self.utilized_metrics_df['Justification'] = self.utilized_metrics_df.apply(self.get_justification, axis=1)
+                reallocation_df, under_utilized_df, top_utilizers_df = self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'For Reallocation'], self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'Under-Utilized'], self.utilized_metrics_df[self.utilized_metrics_df['Classification'] == 'Top Utilizer']
+                stage.rows = len(self.utilized_metrics_df)
 
             # Calculate RUI scores if manager data is available
             try:
                 self.update_status("3a. Calculating Relative Use Index (RUI) scores...")
-                rui_calculator = RUICalculator(self.reference_date)
+                rui_calculator = RUICalculator(self.reference_date, timings=self.timings, engines=self.engines)
                 
                 # Use already loaded target_df instead of re-reading the file
                 # Handle case where no manager report is provided
@@ -412,18 +433,20 @@ class CopilotAnalyzer:
                 
             except Exception as e:
                 self.update_status(f"Error in RUI calculation: {str(e)}")
-                print(f"RUI calculation error: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("RUI calculation error: %s", e)
                 # Continue without RUI scores
                 pass
             
+            self.memory_budget.check("3a. Calculating RUI scores")
+            
             # Generate manager summary if we have RUI scores
             try:
                 self.update_status("3a3. Generating manager summary...")
                 self.manager_summary_df = None
                 if 'rui_score' in self.utilized_metrics_df.columns:
-                    self.manager_summary_df = rui_calculator.get_manager_summary(self.utilized_metrics_df)
+                    with self.timings.stage('manager_summary') as stage:
+                        stage.rows = len(self.utilized_metrics_df)
+                        self.manager_summary_df = rui_calculator.get_manager_summary(self.utilized_metrics_df)
                     if self.manager_summary_df is not None and not self.manager_summary_df.empty:
                         self.update_status(f"3a4. Manager summary created with {len(self.manager_summary_df)} groups")
                     else:
@@ -432,36 +455,37 @@ class CopilotAnalyzer:
                     self.update_status("3a4. No RUI scores available - skipping manager summary")
             except Exception as e:
                 self.update_status(f"Error generating manager summary: {str(e)}")
-                print(f"Manager summary error: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Manager summary error: %s", e)
                 self.manager_summary_df = None
 
             try:
                 self.update_status("4. Calculating usage complexity over time...")
-                usage_complexity_trend_df = self.calculate_usage_complexity_over_time(utilized_emails, filters, target_user_path)
+                with self.timings.stage('usage_complexity') as stage:
+                    stage.rows = len(matched_users_df)
+                    usage_complexity_trend_df = self.calculate_usage_complexity_over_time(utilized_emails, filters, target_user_path)
                 self.update_status("4a. Usage complexity calculation completed")
             except Exception as e:
                 self.update_status(f"Error calculating usage complexity: {str(e)}")
-                print(f"Usage complexity error: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Usage complexity error: %s", e)
                 # Create empty dataframe as fallback
                 usage_complexity_trend_df = pd.DataFrame()
 
+            self.memory_budget.check("4. Calculating usage complexity over time")
             try:
                 self.update_status("5. Generating reports in memory...")
                 self.update_status("5a. Creating Excel report structure...")
-                excel_bytes = self.create_excel_report(top_utilizers_df, under_utilized_df, reallocation_df, self.utilized_metrics_df, usage_complexity_trend_df, self.manager_summary_df)
+                with self.timings.stage('excel_report') as stage:
+                    stage.rows = len(self.utilized_metrics_df)
+                    excel_bytes = self.create_excel_report(top_utilizers_df, under_utilized_df, reallocation_df, self.utilized_metrics_df, usage_complexity_trend_df, self.manager_summary_df)
                 self.update_status("5b. Excel report generated successfully")
             except Exception as e:
                 self.update_status(f"Error generating Excel report: {str(e)}")
-                print(f"Excel report error: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.exception("Excel report error: %s", e)
                 return {'error': f'Failed to generate Excel report: {str(e)}'}
             self.update_status("5b. Generating leaderboard HTML...")
-            leaderboard_html = self.create_leaderboard_html(self.utilized_metrics_df)
+            with self.timings.stage('leaderboard_html') as stage:
+                stage.rows = len(self.utilized_metrics_df)
+                leaderboard_html = self.create_leaderboard_html(self.utilized_metrics_df)
             self.update_status("5c. Finalizing reports...")
             debug_files = {}
             try:
@@ -534,20 +558,177 @@ class CopilotAnalyzer:
                 inactive_total = cat_counts['30d']  # Most inclusive count
                 cat_counts['Recent'] = total_users - inactive_total
             return { 'status': 'success', 'dashboard': { 'total': len(self.utilized_metrics_df), 'categories': cat_counts }, 'reports': { 'excel_bytes': excel_bytes, 'html_string': leaderboard_html }, 'deep_dive_data': { 'full_usage_data': self.full_usage_data, 'utilized_metrics_df': self.utilized_metrics_df, 'debug': debug_files } }
+        except MemoryBudgetExceeded as e:
+            self.update_status(str(e))
+            return {'error': str(e)}
         except Exception as e:
-            import traceback
-            traceback.print_exc()
+            logger.exception("Analysis failed: %s", e)
             return {'error': f"An unexpected error occurred: {str(e)}"}
 
 
+    def compute_user_metrics(self, matched_users_df, utilized_emails, copilot_tool_cols, total_months_in_period):
+        """Per-user metric records, from the engine chosen in self.engines['user_metrics']"""
+        engine = self.engines.get('user_metrics', 'reference')
+        if engine not in self.USER_METRICS_ENGINES:
+            raise ValueError(f"Unknown user_metrics engine '{engine}'. Available: {', '.join(sorted(self.USER_METRICS_ENGINES))}")
+        implementation = getattr(self, self.USER_METRICS_ENGINES[engine])
+        return implementation(matched_users_df, utilized_emails, copilot_tool_cols, total_months_in_period)
+
+    def _user_metrics_reference(self, matched_users_df, utilized_emails, copilot_tool_cols, total_months_in_period):
+        """The original per-user loop; golden.py checks other engines against it"""
+        user_metrics = []
+        total_users = len(utilized_emails)
+        processed = 0
+        for email in utilized_emails:
+            processed += 1
+            if processed % 50 == 0 or processed == total_users:
+                self.update_status(f"2b. Processing users: {processed} of {total_users} (filtered)...")
+            user_data = matched_users_df[matched_users_df['User Principal Name'] == email]
+            user_data_sorted = user_data.sort_values(by='Report Refresh Date')
+            user_data_sorted['Row Recency'] = user_data_sorted[copilot_tool_cols].max(axis=1)
+            adoption_date = self.detect_adoption_date(user_data_sorted, copilot_tool_cols)
+            is_reactivated = False
+            recency_series = user_data_sorted['Row Recency'].dropna()
+            if len(recency_series) >= 3:
+                latest_date, prev_date_1, prev_date_2 = recency_series.iloc[-1], recency_series.iloc[-2], recency_series.iloc[-3]
+                if pd.notna(latest_date) and pd.notna(prev_date_1) and pd.notna(prev_date_2):
+                    if prev_date_1 == prev_date_2 and latest_date > prev_date_1: is_reactivated = True
+            activity_dates = pd.to_datetime(user_data[copilot_tool_cols].stack().dropna().unique())
+            if len(activity_dates) == 0:
+                first_activity, last_activity, active_months, complexity, avg_tools_per_month, trend = pd.NaT, pd.NaT, 0, 0, 0, "N/A"
+                trend_details = {}
+                report_dates = user_data['Report Refresh Date'].unique()
+                if len(report_dates) > 0: first_activity = pd.to_datetime(report_dates).min()
+            else:
+                # Ensure we're getting the absolute maximum date across all tools and reports
+                all_tool_dates_raw = user_data[copilot_tool_cols].values.flatten()
+                all_tool_dates_raw = pd.to_datetime(all_tool_dates_raw[pd.notna(all_tool_dates_raw)])
+                # Filter out any dates that are in the future relative to the last report
+                all_tool_dates = all_tool_dates_raw[all_tool_dates_raw <= self.reference_date]
+                last_activity = all_tool_dates.max() if len(all_tool_dates) > 0 else self.reference_date
+                first_activity = activity_dates.min()
+                if pd.notna(adoption_date):
+                    first_activity = adoption_date
+                active_months = len(pd.to_datetime(activity_dates).to_period('M').unique())
+                complexity = user_data[copilot_tool_cols].notna().any().sum()
+                monthly_activity = user_data.groupby(pd.to_datetime(user_data['Report Refresh Date']).dt.to_period('M'))[copilot_tool_cols].apply(lambda x: x.notna().sum()).reset_index()
+                monthly_activity.columns = ['Month'] + copilot_tool_cols
+                # Calculate average tools per report correctly
+                tools_per_report = user_data.groupby('Report Refresh Date')[copilot_tool_cols].apply(lambda x: x.notna().sum(axis=1).sum())
+                avg_tools_per_month = tools_per_report.mean() if len(tools_per_report) > 0 else 0.0
+                # Improved trend analysis with recent momentum
+                trend = "N/A"
+                trend_details = {}
+                
+                trend_details = {}
+                if len(activity_dates) > 1:
+                    # Get report-level activity
+                    report_activity = user_data.groupby('Report Refresh Date')[copilot_tool_cols].apply(
+                        lambda x: x.notna().sum(axis=1).sum()
+                    ).sort_index()
+                    
+                    if len(report_activity) >= 2:
+                        # Calculate different time windows
+                        last_30_days = self.reference_date - pd.Timedelta(days=30)
+                        last_60_days = self.reference_date - pd.Timedelta(days=60)
+                        last_90_days = self.reference_date - pd.Timedelta(days=90)
+                        
+                        # Get activity in different periods
+                        recent_activity = report_activity[report_activity.index > last_30_days]
+                        medium_activity = report_activity[(report_activity.index > last_60_days) & (report_activity.index <= last_30_days)]
+                        older_activity = report_activity[(report_activity.index > last_90_days) & (report_activity.index <= last_60_days)]
+                        
+                        # Calculate averages for each period
+                        recent_avg = recent_activity.mean() if len(recent_activity) > 0 else 0
+                        medium_avg = medium_activity.mean() if len(medium_activity) > 0 else 0
+                        older_avg = older_activity.mean() if len(older_activity) > 0 else 0
+                        
+                        # Determine trend based on momentum
+                        if recent_avg > 0:
+                            if medium_avg == 0 and older_avg == 0:
+                                trend = "New Momentum"  # Just started using
+                            elif recent_avg > medium_avg * 1.2:
+                                if medium_avg > older_avg * 1.2:
+                                    trend = "Accelerating"  # Increasing faster
+                                else:
+                                    trend = "Recovering"  # Was declining, now increasing
+                            elif recent_avg < medium_avg * 0.8:
+                                if medium_avg < older_avg * 0.8:
+                                    trend = "Declining"  # Decreasing consistently
+                                else:
+                                    trend = "Cooling"  # Was increasing, now decreasing
+                            else:
+                                trend = "Stable"
+                        elif medium_avg > 0:
+                            trend = "Dormant"  # Was active but stopped recently
+                        else:
+                            trend = "Inactive"  # No recent activity
+                        
+                        # Store detailed metrics for debugging
+                        trend_details = {
+                            'recent_avg': recent_avg,
+                            'medium_avg': medium_avg,
+                            'older_avg': older_avg
+                        }
+            consistency = (active_months / total_months_in_period) * 100 if total_months_in_period > 0 else 0
+            
+            # Calculate license-aware metrics with improved approach
+            license_start = adoption_date if pd.notna(adoption_date) else first_activity
+            tool_expansion_rate = 0
+            if pd.notna(license_start):
+                days_since_license = (self.reference_date - license_start).days + 1  # Add 1 to include start day
+                adoption_velocity = complexity / max(days_since_license, 1)  # Tools per day
+                
+                # Calculate tool expansion rate (tools adopted per month)
+                if days_since_license > 30:  # Only calculate for users with at least 30 days
+                    months_since_start = max(1, days_since_license / 30)
+                    tool_expansion_rate = complexity / months_since_start
+                
+                # Improved consistency calculation with minimum evaluation period
+                # Only adjust consistency for users with less than minimum period
+                min_evaluation_days = 60  # Minimum 60 days for fair evaluation
+                if days_since_license <= min_evaluation_days:
+                    # For new users, use a blended approach to prevent inflated scores
+                    adjusted_consistency = (consistency * 0.7) + (min(100, (active_months / max(1, days_since_license / 30)) * 100) * 0.3)
+                else:
+                    # For established users, use a balanced approach that considers both overall and recent patterns
+                    months_since_license = (self.reference_date.year - license_start.year) * 12 + self.reference_date.month - license_start.month + 1
+                    months_since_license = max(1, months_since_license)
+                    raw_adjusted_consistency = (active_months / months_since_license) * 100 if months_since_license > 0 else 0
+                    # Blend overall consistency with adjusted consistency
+                    adjusted_consistency = (consistency * 0.6) + (raw_adjusted_consistency * 0.4)
+            else:
+                adjusted_consistency = consistency
+                adoption_velocity = 0
+                days_since_license = 0
+                tool_expansion_rate = 0                
+            user_metrics.append({
+                 'Email': email, 
+                 'Usage Consistency (%)': consistency,
+                 'Adjusted Consistency (%)': adjusted_consistency,
+                 'Overall Recency': last_activity, 
+                 'Usage Complexity': complexity, 
+                 'Avg Tools / Report': avg_tools_per_month, 
+                 'Adoption Velocity': adoption_velocity,
+                 'Tool Expansion Rate': tool_expansion_rate,
+                 'Days Since License': days_since_license,
+                 'Usage Trend': trend,
+                 'Trend Details': trend_details,
+                 'Appearances': user_data['Report Refresh Date'].nunique(), 
+                 'First Appearance': first_activity, 
+                 'Adoption Date': adoption_date, 
+                 'is_reactivated': is_reactivated
+             })
+        return user_metrics
+
     def calculate_usage_complexity_over_time(self, utilized_emails, filters=None, target_user_path=None):
         self.update_status("Calculating usage complexity trend...")
         if self.full_usage_data is None or self.full_usage_data.empty:
             return pd.DataFrame()
 
-        # Ensure 'Report Refresh Date' is datetime
-        df = self.full_usage_data.copy()
-        df['Report Refresh Date'] = pd.to_datetime(df['Report Refresh Date'], errors='coerce')
+        # Work from column views of the shared usage table instead of copying it
+        df = self.full_usage_data
+        report_dates = pd.to_datetime(df['Report Refresh Date'], errors='coerce')
         
         # Determine if any meaningful filters are applied
         filters_applied = False
@@ -572,41 +753,29 @@ class CopilotAnalyzer:
             return pd.DataFrame()
 
         # Calculate average tools used per report (similar to recent_activity in deep dive)
-        df['avg_tools_per_report_recent'] = 0
         total_rows = len(df)
         self.update_status(f"Processing {total_rows} usage records for trend analysis...")
         
-        for idx, row in df.iterrows():
-            # Show progress every 1000 rows or at key milestones
-            if idx % 1000 == 0 or idx in [total_rows//4, total_rows//2, 3*total_rows//4]:
-                progress_pct = int((idx / total_rows) * 100)
-                self.update_status(f"Analyzing usage patterns... {progress_pct}% complete ({idx:,}/{total_rows:,} records)")
-            
-            recent_tools = 0
-            report_date = row['Report Refresh Date']
-            for col in copilot_tool_cols:
-                if pd.notna(row[col]):
-                    last_activity = row[col]
-                    # Consider tool "recently used" if within 30 days of report
-                    days_since_use = (report_date - last_activity).days
-                    if days_since_use <= 30:  # Tool used in last 30 days
-                        recent_tools += 1
-            df.at[idx, 'avg_tools_per_report_recent'] = recent_tools
+        # A tool counts as "recently used" if it was active within 30 days of the report
+        recent_tools = pd.Series(0, index=df.index)
+        for col in copilot_tool_cols:
+            days_since_use = (report_dates - df[col]).dt.days
+            recent_tools += (df[col].notna() & (days_since_use <= 30)).astype(int)
         
         self.update_status("Aggregating monthly usage trends...")
 
-        # Create month column for grouping
-        df['Month'] = df['Report Refresh Date'].dt.to_period('M').dt.to_timestamp()
+        # Month key for grouping
+        months = report_dates.dt.to_period('M').dt.to_timestamp().rename('Month')
         
         # Calculate average tools per month for all users
-        global_monthly = df.groupby('Month')['avg_tools_per_report_recent'].agg(['mean', 'count'])
+        global_monthly = recent_tools.groupby(months).agg(['mean', 'count'])
         global_complexity = global_monthly['mean'].to_frame(name='Global Average Tools Used')
         
         # Calculate average tools per month for target users only
         if filters_applied:
-            target_df = df[df['User Principal Name'].isin(utilized_emails)]
-            if not target_df.empty:
-                target_monthly = target_df.groupby('Month')['avg_tools_per_report_recent'].agg(['mean', 'count'])
+            target_mask = df['User Principal Name'].isin(utilized_emails)
+            if target_mask.any():
+                target_monthly = recent_tools[target_mask].groupby(months[target_mask]).agg(['mean', 'count'])
                 target_complexity = target_monthly['mean'].to_frame(name='Target Average Tools Used')
             else:
                 # If no target users, create empty frame with same index
@@ -678,53 +847,70 @@ class CopilotAnalyzer:
         if not df.empty:
             red, yellow, green = "F8696B", "FFEB84", "63BE7B"
             max_row = len(df) + 1  # Calculate max row once for consistency
-            print(f"Applying conditional formatting to sheet with {len(df)} data rows (max_row: {max_row})")
+            logger.debug("Applying conditional formatting to sheet with %d data rows (max_row: %d)", len(df), max_row)
             
             if 'Engagement Score' in df.columns:
                 col_letter = get_column_letter(df.columns.get_loc('Engagement Score') + 1)
                 cell_range = f"{col_letter}2:{col_letter}{max_row}"
-                print(f"  Engagement Score range: {cell_range}")
+                logger.debug("Engagement Score range: %s", cell_range)
                 worksheet.conditional_formatting.add(cell_range, ColorScaleRule(start_type='min', start_color=red, mid_type='percentile', mid_value=50, mid_color=yellow, end_type='max', end_color=green))
             if 'Adjusted Consistency (%)' in df.columns:
                 col_letter = get_column_letter(df.columns.get_loc('Adjusted Consistency (%)') + 1)
                 cell_range = f"{col_letter}2:{col_letter}{max_row}"
-                print(f"  Adjusted Consistency range: {cell_range}")
+                logger.debug("Adjusted Consistency range: %s", cell_range)
                 worksheet.conditional_formatting.add(cell_range, DataBarRule(start_type='min', end_type='max', color=green))
             if 'Adoption Velocity' in df.columns:
                 col_letter = get_column_letter(df.columns.get_loc('Adoption Velocity') + 1)
                 cell_range = f"{col_letter}2:{col_letter}{max_row}"
-                print(f"  Adoption Velocity range: {cell_range}")
+                logger.debug("Adoption Velocity range: %s", cell_range)
                 worksheet.conditional_formatting.add(cell_range, ColorScaleRule(start_type='min', start_color=yellow, mid_type='percentile', mid_value=50, mid_color=yellow, end_type='max', end_color=green))
 
     def create_excel_report(self, top_df, under_df, realloc_df, all_df=None, usage_complexity_trend_df=None, manager_summary_df=None):
+        # openpyxl is only loaded once a workbook is written, so the web process starts without it
+        from openpyxl.chart import LineChart, Reference
+        from openpyxl.formatting.rule import ColorScaleRule
+        from openpyxl.styles import Font
+        from openpyxl.utils import get_column_letter
         output = io.BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             self.update_status("5a1. Setting up Excel workbook...")
             # Define the columns we want in the Leaderboard (using actual column names from dataframe)
             cols = ['Global Rank', 'Email', 'Adjusted Consistency (%)', 'Overall Recency', 'Usage Complexity', 'Avg Tools / Report', 'Adoption Velocity', 'Tool Expansion Rate', 'Days Since License', 'Usage Trend', 'Engagement Score']
+            
+            # Define columns for No Use tabs (subset of main columns)
+            # Note: Using 'Usage Complexity' here since it hasn't been renamed yet
+            no_use_cols = ['Global Rank', 'Email', 'Overall Recency', 'Avg Tools / Report', 'Days Since License', 'Usage Trend']
+            
+            # Define columns for RUI Analysis tab (License Risk near front for visibility)
+            rui_cols = ['Email', 'license_risk', 'rui_score', 'peer_rank_display', 'Last Active', 
+                       'trend_arrow', 'immediate_manager', 'Department', 'peer_group_type']
+            
+            # Each sheet only materialises the columns it writes rather than a full copy of all_df
+            def project(frame, columns):
+                return frame[[c for c in columns if c in frame.columns]]
+            
             sheets = {
-                'Leaderboard': all_df.sort_values(by="Global Rank") if all_df is not None and not all_df.empty else pd.DataFrame(),
+                'Leaderboard': project(all_df, cols).sort_values(by="Global Rank") if all_df is not None and not all_df.empty else pd.DataFrame(),
             }
             if all_df is not None and not all_df.empty:
                 # Add No Use tabs based on days of inactivity
                 for days in [30, 45, 60, 90]:
                     # Calculate users with no activity in the last X days
-                    inactive_users = all_df[
+                    inactive_mask = (
                         (pd.to_datetime(all_df['Overall Recency']) < (self.reference_date - pd.Timedelta(days=days))) |
                         pd.isna(all_df['Overall Recency'])
-                    ]
+                    )
                     # Always create the tab, even if empty, for consistent structure
-                    if not inactive_users.empty:
-                        sheets[f'No Use {days}d'] = inactive_users.sort_values(by="Global Rank")
+                    if inactive_mask.any():
+                        sheets[f'No Use {days}d'] = project(all_df[inactive_mask], no_use_cols).sort_values(by="Global Rank")
                     else:
-                        # Create empty dataframe with same columns as all_df
-                        sheets[f'No Use {days}d'] = pd.DataFrame(columns=all_df.columns)
+                        # Create empty dataframe with the No Use columns
+                        sheets[f'No Use {days}d'] = pd.DataFrame(columns=[c for c in no_use_cols if c in all_df.columns])
             
             # Add RUI Analysis tabs if RUI data is available
             if all_df is not None and 'rui_score' in all_df.columns:
                 # RUI Analysis tab with individual scores
-                rui_df = all_df.copy()
-                rui_df['Last Active'] = pd.to_datetime(rui_df['Overall Recency']).apply(
+                last_active = pd.to_datetime(all_df['Overall Recency']).apply(
                     lambda x: f"{(self.reference_date - x).days} days ago" if pd.notna(x) else "Never"
                 )
                 
@@ -736,16 +922,18 @@ class CopilotAnalyzer:
                     'Low - New User (Grace Period)': 3
                 }
                 
-                # Add sort key column (will not be included in output)
-                rui_df['risk_sort_key'] = rui_df['license_risk'].map(
+                # Sort key (will not be included in output)
+                risk_sort_key = all_df['license_risk'].map(
                     lambda x: next((v for k, v in risk_order.items() if k in str(x)), 99)
                 )
                 
                 # Sort by License Risk (High → Medium → Low), then by RUI score within each group
-                sheets['RUI Analysis'] = rui_df.sort_values(
+                rui_order = pd.DataFrame({'risk_sort_key': risk_sort_key, 'rui_score': all_df['rui_score']}).sort_values(
                     ['risk_sort_key', 'rui_score'], 
                     ascending=[True, True]
-                ).drop('risk_sort_key', axis=1)
+                ).index
+                rui_df = project(all_df, rui_cols).assign(**{'Last Active': last_active})
+                sheets['RUI Analysis'] = rui_df.loc[rui_order]
                 
                 # Manager Summary tab if available
                 if manager_summary_df is not None and not manager_summary_df.empty:
@@ -759,25 +947,19 @@ class CopilotAnalyzer:
                 'Usage Complexity': 'Total Tools Used'
             }
             
-            # Define columns for No Use tabs (subset of main columns)
-            # Note: Using 'Usage Complexity' here since it hasn't been renamed yet
-            no_use_cols = ['Global Rank', 'Email', 'Overall Recency', 'Avg Tools / Report', 'Days Since License', 'Usage Trend']
-            
-            # Define columns for RUI Analysis tab (License Risk near front for visibility)
-            rui_cols = ['Email', 'license_risk', 'rui_score', 'peer_rank_display', 'Last Active', 
-                       'trend_arrow', 'immediate_manager', 'Department', 'peer_group_type']
-            
             # Manager Summary tab uses its own columns
             
+            # Checked once so the per-row formatting loops below pay nothing for logging at INFO
+            debug = logger.isEnabledFor(logging.DEBUG)
             for sheet_name, df in sheets.items():
-                print(f"DEBUG: Processing sheet '{sheet_name}' with {len(df)} rows")
-                df_local = df.copy()
+                logger.debug("Processing sheet '%s' with %d rows", sheet_name, len(df))
+                df_local = df
                 
                 # Remove any truly empty rows (all columns are NaN)
                 if not df_local.empty:
                     empty_mask = df_local.isna().all(axis=1)
                     if empty_mask.sum() > 0:
-                        print(f"INFO: Sheet '{sheet_name}' has {empty_mask.sum()} completely empty rows. Removing them...")
+                        logger.info("Sheet '%s' has %d completely empty rows. Removing them...", sheet_name, empty_mask.sum())
                         df_local = df_local[~empty_mask].reset_index(drop=True)
                 
                 # Rename columns for display
@@ -819,19 +1001,19 @@ class CopilotAnalyzer:
                     if 'Usage Complexity' in df_local.columns:
                         df_local = df_local.rename(columns={'Usage Complexity': 'Total Tools Used'})
                     else:
-                        print(f"ERROR: Neither 'Total Tools Used' nor 'Usage Complexity' found in sheet '{sheet_name}'")
+                        logger.error("Neither 'Total Tools Used' nor 'Usage Complexity' found in sheet '%s'", sheet_name)
                 
                 # Only add columns that are truly missing and essential
                 for c in target_cols:
                     if c not in df_local.columns:
-                        print(f"WARNING: Column '{c}' missing from sheet '{sheet_name}' - this may cause formatting issues")
+                        logger.warning("Column '%s' missing from sheet '%s' - this may cause formatting issues", c, sheet_name)
                         # Don't add missing columns - let pandas handle it in column selection
                 
                 # Select only the columns that exist in the dataframe
                 available_cols = [c for c in target_cols if c in df_local.columns]
                 if len(available_cols) != len(target_cols):
                     missing_cols = [c for c in target_cols if c not in df_local.columns]
-                    print(f"INFO: Sheet '{sheet_name}' missing columns: {missing_cols}")
+                    logger.info("Sheet '%s' missing columns: %s", sheet_name, missing_cols)
                 
                 # Create the final dataframe with available columns only
                 if not df_local.empty and available_cols:
@@ -850,20 +1032,15 @@ class CopilotAnalyzer:
                     df_to_write = pd.DataFrame(columns=available_cols)
                 
                 # Debug logging for Leaderboard sheet
-                if sheet_name == 'Leaderboard':
-                    print(f"DEBUG Leaderboard: Writing {len(df_to_write)} rows")
-                    if 'Overall Recency' in df_to_write.columns:
-                        non_null_recency = df_to_write['Overall Recency'].notna().sum()
-                        print(f"  Overall Recency: {non_null_recency} non-null values out of {len(df_to_write)}")
-                        if non_null_recency < len(df_to_write):
-                            print(f"    WARNING: {len(df_to_write) - non_null_recency} rows have null Overall Recency")
-                            print(f"    First 15 values: {df_to_write['Overall Recency'].head(15).tolist()}")
-                    if 'Total Tools Used' in df_to_write.columns:
-                        non_null_tools = df_to_write['Total Tools Used'].notna().sum()
-                        print(f"  Total Tools Used: {non_null_tools} non-null values out of {len(df_to_write)}")
-                        if non_null_tools < len(df_to_write):
-                            print(f"    WARNING: {len(df_to_write) - non_null_tools} rows have null Total Tools Used")
-                            print(f"    First 15 values: {df_to_write['Total Tools Used'].head(15).tolist()}")
+                if sheet_name == 'Leaderboard' and debug:
+                    logger.debug("Leaderboard: writing %d rows", len(df_to_write))
+                    for column in ('Overall Recency', 'Total Tools Used'):
+                        if column in df_to_write.columns:
+                            non_null = df_to_write[column].notna().sum()
+                            logger.debug("%s: %d non-null values out of %d", column, non_null, len(df_to_write))
+                            if non_null < len(df_to_write):
+                                logger.debug("%d rows have null %s; first 15 values: %s",
+                                             len(df_to_write) - non_null, column, df_to_write[column].head(15).tolist())
                 
                 df_to_write.to_excel(writer, sheet_name=sheet_name, index=False, float_format="%.2f")
                 
@@ -871,7 +1048,7 @@ class CopilotAnalyzer:
                 worksheet = writer.sheets[sheet_name]
                 if len(df_to_write.columns) >= 5:
                     col_5_header = worksheet.cell(row=1, column=5).value
-                    print(f"DEBUG: Sheet '{sheet_name}' column 5 header: '{col_5_header}'")
+                    logger.debug("Sheet '%s' column 5 header: '%s'", sheet_name, col_5_header)
                 
                 # For Leaderboard, apply styling AFTER adding disclaimer to get row positions right
                 if sheet_name != 'Leaderboard':
@@ -893,7 +1070,7 @@ class CopilotAnalyzer:
                 
                 # Add conditional formatting for RUI Analysis tab
                 if sheet_name == 'RUI Analysis' and 'RUI Score' in df_to_write.columns:
-                    print(f"DEBUG: Formatting RUI Analysis tab with {len(df_to_write)} rows")
+                    logger.debug("Formatting RUI Analysis tab with %d rows", len(df_to_write))
                     # Color scale for RUI Score (red-yellow-green)
                     rui_col_idx = df_to_write.columns.get_loc('RUI Score') + 1
                     rui_col_letter = get_column_letter(rui_col_idx)
@@ -916,35 +1093,35 @@ class CopilotAnalyzer:
                     # Apply color to License Risk column based on text - ONLY for RUI Analysis
                     if 'License Risk' in df_to_write.columns:
                         risk_col_idx = df_to_write.columns.get_loc('License Risk') + 1
-                        print(f"DEBUG: Applying License Risk formatting to RUI Analysis sheet '{worksheet.title}', column {risk_col_idx}")
+                        logger.debug("Applying License Risk formatting to RUI Analysis sheet '%s', column %d", worksheet.title, risk_col_idx)
                         
                         # SAFETY CHECK: Ensure we're on the right worksheet
                         if worksheet.title != 'RUI Analysis':
-                            print(f"ERROR: Attempting to apply RUI formatting to wrong sheet '{worksheet.title}' - SKIPPING")
+                            logger.error("Attempting to apply RUI formatting to wrong sheet '%s' - SKIPPING", worksheet.title)
                         else:
-                            # Apply color formatting to License Risk column without inserting separator rows
-                            for row in range(2, len(df_to_write) + 2):
-                                cell = worksheet.cell(row=row, column=risk_col_idx)
-                                current_risk = str(cell.value)
-                                
-                                # CRITICAL SAFETY CHECK: Never apply Font formatting to column 5 (Total Tools Used)
-                                if risk_col_idx == 5:
-                                    print(f"  CRITICAL ERROR: Attempting to apply Font formatting to column 5 (Total Tools Used) - SKIPPING ROW {row}")
-                                else:
+                            # CRITICAL SAFETY CHECK: Never apply Font formatting to column 5 (Total Tools Used)
+                            if risk_col_idx == 5:
+                                logger.warning("License Risk is in column 5 (Total Tools Used) on '%s' - skipping its highlighting", worksheet.title)
+                            else:
+                                # Apply color formatting to License Risk column without inserting separator rows
+                                for row in range(2, len(df_to_write) + 2):
+                                    cell = worksheet.cell(row=row, column=risk_col_idx)
+                                    current_risk = str(cell.value)
                                     # Apply color formatting to risk text
                                     if 'High' in current_risk:
                                         cell.font = Font(color='FF0000', bold=True)
-                                        print(f"  DEBUG: Applied RED BOLD to RUI Analysis row {row}, col {risk_col_idx}: '{current_risk}'")
+                                        if debug:
+                                            logger.debug("Applied RED BOLD to RUI Analysis row %d, col %d: '%s'", row, risk_col_idx, current_risk)
                                     elif 'Medium' in current_risk:
                                         cell.font = Font(color='FF8800', bold=True)
                                     elif 'Low' in current_risk:
                                         cell.font = Font(color='008800', bold=True)
                 elif sheet_name == 'Leaderboard':
-                    print(f"DEBUG: Processing Leaderboard - NOT applying any Font colors/bold formatting")
+                    logger.debug("Processing Leaderboard - NOT applying any Font colors/bold formatting")
                 
                 # Format Manager Summary tab
                 if sheet_name == 'Manager Summary':
-                    print(f"DEBUG: Formatting Manager Summary tab with {len(df_to_write)} rows")
+                    logger.debug("Formatting Manager Summary tab with %d rows", len(df_to_write))
                     # Color scale for Avg RUI
                     if 'Avg RUI' in df_to_write.columns:
                         try:
@@ -966,38 +1143,41 @@ class CopilotAnalyzer:
                     
                     # Highlight High Risk count - STRICTLY ONLY apply to Manager Summary sheet
                     if sheet_name == 'Manager Summary' and 'High Risk' in df_to_write.columns:
-                        print(f"DEBUG: About to apply High Risk formatting - sheet_name='{sheet_name}', worksheet.title='{worksheet.title}', has High Risk column: {'High Risk' in df_to_write.columns}")
+                        logger.debug("About to apply High Risk formatting - sheet_name='%s', worksheet.title='%s'", sheet_name, worksheet.title)
                         
                         # SAFETY CHECK: Ensure we're on the right worksheet
                         if worksheet.title != 'Manager Summary':
-                            print(f"ERROR: Attempting to apply Manager Summary formatting to wrong sheet '{worksheet.title}' - SKIPPING")
+                            logger.error("Attempting to apply Manager Summary formatting to wrong sheet '%s' - SKIPPING", worksheet.title)
                         else:
                             try:
                                 high_risk_col_idx = df_to_write.columns.get_loc('High Risk') + 1
-                                print(f"DEBUG: Applying High Risk formatting to Manager Summary sheet '{worksheet.title}', column {high_risk_col_idx}")
-                                for row in range(2, len(df_to_write) + 2):
+                                logger.debug("Applying High Risk formatting to Manager Summary sheet '%s', column %d", worksheet.title, high_risk_col_idx)
+                                # CRITICAL SAFETY CHECK: Never apply Font formatting to column 5 (Total Tools Used)
+                                if high_risk_col_idx == 5:
+                                    logger.warning("High Risk is in column 5 (Total Tools Used) on '%s' - skipping its highlighting", worksheet.title)
+                                    rows_to_highlight = range(0)
+                                else:
+                                    rows_to_highlight = range(2, len(df_to_write) + 2)
+                                for row in rows_to_highlight:
                                     cell = worksheet.cell(row=row, column=high_risk_col_idx)
                                     try:
-                                        # CRITICAL SAFETY CHECK: Never apply Font formatting to column 5 (Total Tools Used)
-                                        if high_risk_col_idx == 5:
-                                            print(f"  CRITICAL ERROR: Manager Summary attempting to apply Font formatting to column 5 (Total Tools Used) - SKIPPING ROW {row}")
-                                        else:
-                                            # Try to convert to int, skip if not possible
-                                            if cell.value is not None and pd.notna(cell.value):
-                                                value = int(float(str(cell.value)))
-                                                if value > 0:
-                                                    cell.font = Font(color='FF0000', bold=True)
-                                                    print(f"  DEBUG: Applied RED BOLD to Manager Summary row {row}, col {high_risk_col_idx}: value {value}")
+                                        # Try to convert to int, skip if not possible
+                                        if cell.value is not None and pd.notna(cell.value):
+                                            value = int(float(str(cell.value)))
+                                            if value > 0:
+                                                cell.font = Font(color='FF0000', bold=True)
+                                                if debug:
+                                                    logger.debug("Applied RED BOLD to Manager Summary row %d, col %d: value %s", row, high_risk_col_idx, value)
                                     except (ValueError, TypeError):
                                         # Skip non-numeric values
                                         pass
                             except Exception as e:
-                                print(f"DEBUG: Error applying High Risk formatting to Manager Summary: {e}")
+                                logger.debug("Error applying High Risk formatting to Manager Summary: %s", e)
                                 pass
                     elif sheet_name == 'Leaderboard':
-                        print(f"DEBUG: Skipping High Risk formatting for Leaderboard sheet - this should NOT apply red/bold to Column E")
+                        logger.debug("Skipping High Risk formatting for Leaderboard sheet - this should NOT apply red/bold to Column E")
                     elif 'High Risk' in df_to_write.columns:
-                        print(f"DEBUG: Sheet '{sheet_name}' has 'High Risk' column but is not Manager Summary - not applying formatting")
+                        logger.debug("Sheet '%s' has 'High Risk' column but is not Manager Summary - not applying formatting", sheet_name)
                 
                 wrote_any = wrote_any or not df_to_write.empty
             self.update_status("5a2. Writing data sheets...")
@@ -1106,9 +1286,7 @@ class CopilotAnalyzer:
 
                         wrote_any = True
                 except Exception as chart_error:
-                    print(f"Chart creation error: {chart_error}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception("Chart creation error: %s", chart_error)
                     # If chart fails, still mark as wrote_any since data was written
                     wrote_any = True
             self.update_status("5a4. Finalizing Excel formatting...")
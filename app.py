@@ -1,24 +1,81 @@
 import os
-import shutil
+import sqlite3
+import time
 import uuid
-from flask import Flask, render_template, request, session, jsonify
-from flask_socketio import SocketIO, emit
+from flask import Flask, Response, render_template, request, session, jsonify, send_file
+from flask_socketio import SocketIO, emit, join_room
 import pandas as pd
 import base64
 import io
-# removed unused matplotlib import
 from analysis_logic import CopilotAnalyzer
-import traceback
+from deep_dive import DeepDiveError, build_deep_dive
+from leaderboard_store import DEFAULT_SORT, LeaderboardQueryError, LeaderboardStore
+from jobs import DONE, FAILED, CANCELLED, JobCancelled, JobProgressSink, JobRegistry
+import presets
+import worker_pool
+from worker_pool import WorkerPool
+from progress import FanOutProgressSink, SocketIOProgressSink
+from profiling import profile_call, saved_profile
+import metrics
+from archive_ingest import ArchiveError, extract_usage_archive, is_archive
+from chunked_upload import ChunkedUploadManager, UploadError, file_sha256, save_stream
+from dataset_cache import get_dataset_cache, target_key, usage_report_key
+from temp_janitor import QuotaExceeded, TempJanitor
+from scheduler import JobScheduler, default_memory_budget_bytes, estimate_job, format_wait
+import logging
+import config
+from logging_config import configure_logging
 from config import TARGET_PRESETS
 
 async_mode = "eventlet"
 
+logger = logging.getLogger(__name__)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'a-different-secret-key-for-sure!'
 TEMP_FOLDER = 'temp_uploads'
 app.config['TEMP_FOLDER'] = TEMP_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_BYTES
 
 socketio = SocketIO(app, async_mode=async_mode)
+# Preset target files are parsed and indexed once; they are reloaded when their files change
+presets.preload()
+chunked_uploads = ChunkedUploadManager(config.MAX_UPLOAD_BYTES)
+job_registry = JobRegistry(config.JOB_RESULT_RETENTION_MINUTES * 60)
+leaderboard_store = LeaderboardStore(config.LEADERBOARD_DB)
+temp_janitor = TempJanitor(
+    TEMP_FOLDER,
+    ttl_seconds=config.TEMP_TTL_MINUTES * 60,
+    session_quota_bytes=config.TEMP_SESSION_QUOTA_MB * 1024 ** 2 if config.TEMP_SESSION_QUOTA_MB else None,
+    global_quota_bytes=config.TEMP_GLOBAL_QUOTA_MB * 1024 ** 2 if config.TEMP_GLOBAL_QUOTA_MB else None
+)
+
+def notify_queue_position(job_id, position, eta_seconds):
+    """Tell a queued job's clients where it stands, over the usual status channel"""
+    message = f"Queued: position {position}, expected to start in {format_wait(eta_seconds)}"
+    job = job_registry.get(job_id)
+    if job is not None:
+        job.message = message
+    socketio.emit('status_update', {'message': message, 'job_id': job_id, 'queue_position': position,
+                                    'expected_start_seconds': round(eta_seconds)}, to=job_room(job_id))
+
+job_scheduler = JobScheduler(
+    default_memory_budget_bytes(config.SCHEDULER_MEMORY_BUDGET_MB),
+    max_concurrent=config.SCHEDULER_MAX_CONCURRENT_JOBS,
+    on_queue_change=notify_queue_position
+)
+metrics.REGISTRY.gauge('copilot_jobs_queued', "Analysis jobs waiting for admission", function=job_scheduler.queued_count)
+metrics.REGISTRY.gauge('copilot_jobs_running', "Analysis jobs currently running", function=job_scheduler.running_count)
+
+# Pre-forked analysis workers (config.ANALYSIS_WORKERS > 0); started by __main__, otherwise
+# analyses run in this process as background tasks
+analysis_pool = WorkerPool(config.ANALYSIS_WORKERS, config.ANALYSIS_WORKER_MAX_JOBS,
+                           config.ANALYSIS_WORKER_MAX_RSS_MB) if config.ANALYSIS_WORKERS else None
+# Progress sinks of the jobs running in the pool, by job id
+pool_progress = {}
+if analysis_pool is not None:
+    metrics.REGISTRY.gauge('copilot_analysis_workers_recycled', "Analysis worker processes replaced so far",
+                           function=lambda: analysis_pool.recycled)
 
 @app.route('/')
 def index():
@@ -31,74 +88,165 @@ def index():
     preset_data = TARGET_PRESETS.get(target_preset_key, {})
     pre_selected_managers = preset_data.get('managers', [])
     
-    return render_template('index.html', pre_selected_managers=pre_selected_managers)
+    return render_template('index.html', pre_selected_managers=pre_selected_managers,
+                           upload_chunk_bytes=config.UPLOAD_CHUNK_BYTES)
 
-@app.route('/upload', methods=['POST'])
-def handle_upload():
-    if 'user_id' not in session:
-        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
-    
-    user_id = session['user_id']
-    session_folder = os.path.join(app.config['TEMP_FOLDER'], user_id)
+def _session_folder():
+    """Create and return the upload folder for the current session, initializing its file registry"""
+    session_folder = os.path.join(app.config['TEMP_FOLDER'], session['user_id'])
     os.makedirs(session_folder, exist_ok=True)
-
-    file = request.files.get('file')
-    file_type = request.form.get('file_type')
-    if not file or not file_type:
-        return jsonify({'status': 'error', 'message': 'Missing file or file type.'}), 400
-    
-    save_path = os.path.join(session_folder, file.filename)
-    file.save(save_path)
-
+    temp_janitor.touch(session['user_id'])
     if 'file_paths' not in session:
         session['file_paths'] = {'usage': {}, 'target': None}
+    if 'file_hashes' not in session:
+        session['file_hashes'] = {}
+    return session_folder
+
+def _quota_error(incoming_bytes):
+    """Error response if an upload of incoming_bytes would exceed the session's disk quota"""
+    try:
+        temp_janitor.check_session_quota(session['user_id'], incoming_bytes or 0)
+    except QuotaExceeded as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 413
+    return None
+
+def _register_usage_archive(stream, archive_name, session_folder):
+    # A ZIP of reports is streamed member by member into the session folder
+    try:
+        saved = extract_usage_archive(stream, session_folder)
+    except ArchiveError as e:
+        metrics.UPLOADS.inc(kind='archive', outcome='rejected')
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    metrics.UPLOADS.inc(kind='archive', outcome='success')
+    for filename, path in saved:
+        session['file_paths']['usage'][filename] = path
+        session['file_hashes'][path] = file_sha256(path)
+        metrics.UPLOAD_BYTES.observe(os.path.getsize(path), kind='usage')
+    session.modified = True
+    return jsonify({'status': 'success', 'type': 'usage', 'filename': archive_name, 'filenames': [filename for filename, _ in saved]})
+
+def _register_saved_upload(save_path, filename, file_type, content_hash):
+    """Register a file already saved in the session folder and build the upload response"""
+    # The content hash keys the shared dataset cache; 'cached' tells the client the parse is already done
+    session['file_hashes'][save_path] = content_hash
+    session.modified = True
+    metrics.UPLOADS.inc(kind=file_type if file_type in ('usage', 'target') else 'unknown', outcome='success')
+    metrics.UPLOAD_BYTES.observe(os.path.getsize(save_path), kind=file_type if file_type in ('usage', 'target') else 'unknown')
+    cache_key = target_key(content_hash) if file_type == 'target' else usage_report_key(content_hash)
+    cache_info = {'content_hash': content_hash, 'cached': get_dataset_cache().contains(cache_key)}
 
     if file_type == 'target':
         session['file_paths']['target'] = save_path
         session.modified = True
         try:
-            # First read to check available columns
-            df_check = pd.read_csv(save_path, nrows=0, encoding='utf-8-sig')
-            available_cols = df_check.columns.tolist()
-            
-            # Define columns we want to read if they exist
-            desired_cols = ['UserPrincipalName', 'Company', 'Department', 'City', 'ManagerLine']
-            cols_to_read = [col for col in desired_cols if col in available_cols]
-            
-            df = pd.read_csv(save_path, usecols=cols_to_read, dtype=str, encoding='utf-8-sig')
-            df.fillna('', inplace=True)
-
-            filters = {
-                'companies': sorted(df['Company'].unique().tolist()) if 'Company' in df.columns else [],
-                'departments': sorted(df['Department'].unique().tolist()) if 'Department' in df.columns else [],
-                'locations': sorted(df['City'].unique().tolist()) if 'City' in df.columns else []
-            }
-            
-            # Check if a preset was used to determine manager filter behavior
+            # If a preset is active, its managers fill the manager dropdown; otherwise everyone in
+            # the file's ManagerLine column does
             target_preset_key = request.args.get('target')
+            managers = None
             if target_preset_key and target_preset_key in TARGET_PRESETS:
-                # If a preset is active, use its managers for the filter dropdown
-                filters['managers'] = TARGET_PRESETS[target_preset_key].get('managers', [])
+                managers = TARGET_PRESETS[target_preset_key].get('managers', [])
+
+            # A copy of a preset file gets the lists built when the preset was loaded
+            preset = presets.preset_for_hash(content_hash)
+            if preset is not None:
+                filters = preset.filter_options(managers)
             else:
-                # Otherwise, extract all managers from the uploaded file if ManagerLine column exists
-                all_managers = set()
-                if 'ManagerLine' in df.columns:
-                    for chain in df['ManagerLine']:
-                        if pd.notna(chain) and chain.strip():
-                            all_managers.update([m.strip() for m in chain.split('->') if m.strip()])
-                filters['managers'] = sorted(list(all_managers))
-            
-            return jsonify({'status': 'success', 'type': 'target', 'filters': filters})
+                filters = presets.filter_options(presets.read_filter_frame(save_path), managers)
+            return jsonify({'status': 'success', 'type': 'target', 'filters': filters, **cache_info})
         except Exception as e:
-            traceback.print_exc()
+            logger.exception("Error parsing target file %s", save_path)
             return jsonify({'status': 'error', 'message': f'Error parsing CSV: {e}'}), 500
 
     elif file_type == 'usage':
-        session['file_paths']['usage'][file.filename] = save_path
+        session['file_paths']['usage'][filename] = save_path
         session.modified = True
-        return jsonify({'status': 'success', 'type': 'usage', 'filename': file.filename})
+        return jsonify({'status': 'success', 'type': 'usage', 'filename': filename, 'filenames': [filename], **cache_info})
 
-from werkzeug.exceptions import RequestTimeout
+    return jsonify({'status': 'error', 'message': f'Unknown file type: {file_type}'}), 400
+
+@app.route('/upload', methods=['POST'])
+def handle_upload():
+    if 'user_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
+    
+    session_folder = _session_folder()
+
+    file = request.files.get('file')
+    file_type = request.form.get('file_type')
+    if not file or not file_type:
+        return jsonify({'status': 'error', 'message': 'Missing file or file type.'}), 400
+
+    quota_error = _quota_error(request.content_length)
+    if quota_error:
+        return quota_error
+
+    if file_type == 'usage' and is_archive(file.filename):
+        return _register_usage_archive(file.stream, file.filename, session_folder)
+    
+    save_path = os.path.join(session_folder, file.filename)
+    content_hash = save_stream(file.stream, save_path)
+    return _register_saved_upload(save_path, file.filename, file_type, content_hash)
+
+# Resumable uploads: start, send chunks at an offset (resending after a failure), then complete.
+# The content hash is computed as chunks arrive and returned on completion.
+@app.route('/upload/chunked', methods=['POST'])
+def start_chunked_upload():
+    if 'user_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
+
+    data = request.get_json(silent=True) or {}
+    quota_error = _quota_error(data.get('total_size') if isinstance(data.get('total_size'), int) else 0)
+    if quota_error:
+        return quota_error
+    try:
+        upload = chunked_uploads.start(_session_folder(), data.get('filename'), data.get('file_type'),
+                                       int(data.get('total_size', -1)))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'Invalid file size.'}), 400
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    return jsonify({'status': 'success', 'chunk_size': config.UPLOAD_CHUNK_BYTES, **upload.to_dict()})
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET', 'PUT'])
+def chunked_upload_chunk(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
+
+    try:
+        upload = chunked_uploads.get(_session_folder(), upload_id)
+        if request.method == 'PUT':
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                return jsonify({'status': 'error', 'message': 'Missing chunk offset.'}), 400
+            chunked_uploads.write_chunk(upload, offset, request.get_data(cache=False),
+                                        request.headers.get('X-Chunk-Checksum'))
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+    return jsonify({'status': 'success', **upload.to_dict()})
+
+@app.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    if 'user_id' not in session:
+        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
+
+    session_folder = _session_folder()
+    try:
+        upload = chunked_uploads.get(session_folder, upload_id)
+        content_hash = chunked_uploads.complete(upload)
+    except UploadError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), e.status_code
+
+    if upload.file_type == 'usage' and is_archive(upload.filename):
+        with open(upload.part_path, 'rb') as stream:
+            response = _register_usage_archive(stream, upload.filename, session_folder)
+        os.remove(upload.part_path)
+        return response
+
+    save_path = os.path.join(session_folder, upload.filename)
+    os.replace(upload.part_path, save_path)
+    return _register_saved_upload(save_path, upload.filename, upload.file_type, content_hash)
+
+from werkzeug.exceptions import RequestEntityTooLarge, RequestTimeout
 
 @app.errorhandler(500)
 def handle_internal_error(error):
@@ -115,6 +263,13 @@ def handle_not_found(error):
         'message': 'Resource not found.'
     }), 404
 
+@app.errorhandler(RequestEntityTooLarge)
+def handle_too_large(error):
+    return jsonify({
+        'status': 'error',
+        'message': f'File too large. The limit is {config.MAX_UPLOAD_BYTES // 1024 ** 2} MB.'
+    }), 413
+
 @app.errorhandler(RequestTimeout)
 def handle_timeout(error):
     return jsonify({
@@ -123,35 +278,39 @@ def handle_timeout(error):
     }), 408
 
 @app.before_request
-def clear_stale_temp():
-    if getattr(app, "_temp_cleared", False):
+def start_temp_janitor():
+    # Session folders are expired by last access rather than wiped at startup, so work
+    # in progress survives a restart until its TTL runs out
+    if getattr(app, "_janitor_started", False):
         return
-    if os.path.exists(app.config['TEMP_FOLDER']):
-        for entry in os.listdir(app.config['TEMP_FOLDER']):
-            path = os.path.join(app.config['TEMP_FOLDER'], entry)
-            try:
-                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
-            except Exception:
-                pass
-    app._temp_cleared = True
+    app._janitor_started = True
+    temp_janitor.root = app.config['TEMP_FOLDER']
+    socketio.start_background_task(temp_janitor.run, socketio.sleep, config.TEMP_JANITOR_INTERVAL_SECONDS)
 
 @socketio.on('connect')
 def handle_connect():
-    print(f"Client connected: {request.sid}")
+    metrics.SOCKET_CONNECTIONS.inc()
+    logger.debug("Client connected: %s", request.sid)
 
 @socketio.on('disconnect')
 def handle_disconnect():
-    print(f"Client disconnected: {request.sid}")
+    metrics.SOCKET_CONNECTIONS.dec()
+    logger.debug("Client disconnected: %s", request.sid)
+    # Keep the session's files: the socket also drops on a page reload or a network blip,
+    # and the deep dive still needs them. The temp janitor expires them after the TTL.
     user_id = session.get('user_id')
     if user_id:
-        session_folder = os.path.join(app.config['TEMP_FOLDER'], user_id)
-        if os.path.exists(session_folder):
-            print(f"Cleaning up session folder: {session_folder}")
-            shutil.rmtree(session_folder)
+        temp_janitor.touch(user_id)
+
+@socketio.on('latency_probe')
+def handle_latency_probe(data=None):
+    # Acknowledged straight away, so the round trip measures how long events wait for the
+    # event loop (e.g. behind a CPU-bound analysis); used by load_test.py
+    return {'server_time': time.time()}
 
 @socketio.on('start_analysis')
 def handle_analysis_request(data):
-    print("Received start_analysis request from client.") # Diagnostic print
+    logger.info("Received start_analysis request from %s", request.sid)
     user_id = session.get('user_id')
     if not user_id:
         emit('analysis_error', {'message': 'User session not found. Please refresh the page.'})
@@ -175,15 +334,78 @@ def handle_analysis_request(data):
             return
 
     target_file = session.get('file_paths', {}).get('target')
-        
-    runner = CopilotAnalyzer(socketio, request.sid)
-    socketio.start_background_task(run_analysis_and_emit, runner, analysis_target_files, target_file, data['filters'], request.sid, user_id)
-
-def run_analysis_and_emit(runner, usage_file_paths, target_file_path, filters, sid, user_id):
-    results = runner.execute_analysis(usage_file_paths, target_file_path, filters)
+    file_hashes = dict(session.get('file_hashes', {}))
+    profile = bool(data.get('profile')) or config.PROFILE_ANALYSES
+
+    # Progress and results go to the job's room rather than this sid, so a client that
+    # reconnects can re-attach to the job and still receive them
+    job = job_registry.create(user_id, f"{len(analysis_target_files)} usage report(s)")
+    join_room(job_room(job.id))
+    progress = FanOutProgressSink([JobProgressSink(job), SocketIOProgressSink(socketio, job_room(job.id))])
+    runner = CopilotAnalyzer(progress=progress, cancel_check=job.check_cancelled)
+    temp_janitor.acquire(user_id)  # released when the background job finishes
+    estimate = estimate_job(analysis_target_files.values(), target_file)
+    metrics.JOBS_SUBMITTED.inc()
+    emit('job_created', {**job.to_dict(), 'estimate': estimate.to_dict()})
+    # Starts now if the job's estimated memory fits the budget, otherwise waits its turn
+    job_scheduler.submit(job.id, estimate, lambda: socketio.start_background_task(
+        run_analysis_and_emit, job, runner, analysis_target_files, target_file, data['filters'], user_id, file_hashes, profile))
+
+def job_room(job_id):
+    return f"job:{job_id}"
+
+def run_analysis_and_emit(job, runner, usage_file_paths, target_file_path, filters, user_id, file_hashes=None, profile=False):
+    room = job_room(job.id)
+    # The profile is kept with the session's other artifacts and served by /jobs/<id>/profile
+    stem = os.path.join(app.config['TEMP_FOLDER'], user_id, 'profiles', job.id) if profile else None
+    try:
+        job_registry.start(job)
+        metrics.JOB_QUEUE_WAIT.observe(job.started_at - job.created_at)
+        args = (runner, usage_file_paths, target_file_path, filters, user_id, file_hashes)
+        try:
+            if analysis_pool is not None and analysis_pool.started:
+                payload, error, _ = run_in_pool(job, *args, profile_stem=stem)
+            elif profile:
+                (payload, error), _ = profile_call(stem, build_analysis_payload, *args, job_id=job.id)
+            else:
+                payload, error = build_analysis_payload(*args, job_id=job.id)
+        finally:
+            # Picked up from disk, so a cancelled or failed run keeps the partial profile written as it unwound
+            profile_paths = saved_profile(stem) if stem else {}
+            if profile_paths:
+                job.artifacts['profile'] = profile_paths
+    except JobCancelled:
+        job_registry.mark_cancelled(job)
+        _record_job_metrics(job)
+        socketio.emit('analysis_cancelled', job.to_dict(), to=room)
+        return
+    except Exception as e:
+        logger.exception("Analysis job %s failed", job.id)
+        payload, error = None, f"An unexpected error occurred: {e}"
+    finally:
+        temp_janitor.release(user_id)
+        job_scheduler.finished(job.id)
+
+    if error:
+        job_registry.fail(job, error)
+        socketio.emit('analysis_error', {'message': error, 'job_id': job.id}, to=room)
+    else:
+        payload['job_id'] = job.id
+        job_registry.finish(job, payload)
+        socketio.emit('analysis_complete', payload, to=room)
+    _record_job_metrics(job)
+
+def _record_job_metrics(job):
+    metrics.JOBS_FINISHED.inc(state=job.state)
+    if job.started_at is not None:
+        metrics.JOB_DURATION.observe(job.finished_at - job.started_at, state=job.state)
+
+def build_analysis_payload(runner, usage_file_paths, target_file_path, filters, user_id, file_hashes=None, job_id=None):
+    """Run the analysis, store deep-dive data (and the job's leaderboard), and return (client payload, error message)"""
+    results = runner.execute_analysis(usage_file_paths, target_file_path, filters, file_hashes)
     
     if 'error' in results:
-        socketio.emit('analysis_error', {'message': results['error']}, to=sid)
+        return None, results['error']
     else:
         deep_dive_data = results.pop('deep_dive_data')
         deep_dive_data['filters_applied'] = filters # Store the filters that were applied
@@ -196,22 +418,186 @@ def run_analysis_and_emit(runner, usage_file_paths, target_file_path, filters, s
         if excel_bytes is None:
             excel_b64 = ''
         else:
-            try:
-                print(f"Excel bytes length: {len(excel_bytes)}")
-            except Exception:
-                print("Excel bytes length: <unavailable>")
+            logger.debug("Excel bytes length: %s", len(excel_bytes) if isinstance(excel_bytes, (bytes, bytearray)) else '<unavailable>')
             excel_b64 = base64.b64encode(excel_bytes).decode('ascii') if isinstance(excel_bytes, (bytes, bytearray)) else ''
         html_b64 = base64.b64encode(results['reports']['html_string'].encode('utf-8')).decode('ascii')
         payload = { 'dashboard': results['dashboard'], 'reports': { 'excel_b64': excel_b64, 'html_b64': html_b64 } }
-        socketio.emit('analysis_complete', payload, to=sid)
+        payload['timings'] = results.get('timings', [])
+        if job_id:
+            try:
+                leaderboard_store.prune(config.JOB_RESULT_RETENTION_MINUTES * 60)
+                payload['leaderboard'] = {'url': f"/jobs/{job_id}/leaderboard",
+                                          'users': leaderboard_store.save(job_id, deep_dive_data['utilized_metrics_df'])}
+            except sqlite3.Error:
+                # The full leaderboard is still in the HTML report
+                logger.exception("Could not store the leaderboard of job %s", job_id)
+        return payload, None
+
+def pooled_analysis(job_id, usage_file_paths, target_file_path, filters, user_id, file_hashes=None, profile_stem=None):
+    """build_analysis_payload inside a pool worker; returns (payload, error, profile paths or None)"""
+    def check_cancelled():
+        if worker_pool.cancel_requested():
+            raise JobCancelled(job_id)
+
+    runner = CopilotAnalyzer(progress=worker_pool.progress_sink(job_id), cancel_check=check_cancelled)
+    args = (runner, usage_file_paths, target_file_path, filters, user_id, file_hashes)
+    if profile_stem:
+        (payload, error), profile_paths = profile_call(profile_stem, build_analysis_payload, *args, job_id=job_id)
+        return payload, error, profile_paths
+    payload, error = build_analysis_payload(*args, job_id=job_id)
+    return payload, error, None
+
+def run_in_pool(job, runner, usage_file_paths, target_file_path, filters, user_id, file_hashes=None, profile_stem=None):
+    """
+    Run the analysis in a pool worker, relaying its progress to runner's sink and passing on
+    cancellation, while yielding to the event loop; returns pooled_analysis's result
+    """
+    pool_progress[job.id] = runner.progress
+    try:
+        future = analysis_pool.submit(pooled_analysis, job.id, usage_file_paths, target_file_path, filters,
+                                      user_id, file_hashes, profile_stem)
+        while not future.done():
+            if job.cancel_event.is_set():
+                analysis_pool.interrupt(future)
+            analysis_pool.relay_progress(pool_progress.get)
+            socketio.sleep(0.2)
+        analysis_pool.relay_progress(pool_progress.get)
+        if future.cancelled():
+            raise JobCancelled(job.id)
+        return future.result()
+    finally:
+        pool_progress.pop(job.id, None)
+
+def _current_job(job_id):
+    return job_registry.get(job_id or '', owner=session.get('user_id'))
+
+def _cancel(job):
+    """Request cancellation; a job still waiting in the scheduler queue is cancelled immediately"""
+    if not job_registry.cancel(job):
+        return False
+    if job_scheduler.remove(job.id):
+        job_registry.mark_cancelled(job)
+        _record_job_metrics(job)
+        temp_janitor.release(job.owner)
+        socketio.emit('analysis_cancelled', job.to_dict(), to=job_room(job.id))
+    return True
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({'status': 'error', 'message': 'Session not found. Please refresh the page.'}), 400
+    return jsonify({'status': 'success', 'jobs': [job.to_dict() for job in job_registry.for_owner(user_id)]})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = _current_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    return jsonify({'status': 'success', **job.to_dict()})
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = _current_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    if not _cancel(job):
+        return jsonify({'status': 'error', 'message': f'Job already {job.state}.', **job.to_dict()}), 409
+    return jsonify({'status': 'success', **job.to_dict()})
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = _current_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    if job.state == FAILED:
+        return jsonify({'status': 'error', 'message': job.error, **job.to_dict()}), 500
+    if job.state != DONE:
+        return jsonify({'status': 'error', 'message': f'Job is {job.state}.', **job.to_dict()}), 409
+    return jsonify({'status': 'success', **job.result})
+
+@app.route('/jobs/<job_id>/leaderboard', methods=['GET'])
+def get_job_leaderboard(job_id):
+    """
+    One page of a finished job's users: ?page, ?per_page, ?sort=<field>, ?order=asc|desc, and
+    repeatable ?classification, ?license_risk and ?manager filters plus ?q to search emails
+    """
+    job = _current_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    if job.state != DONE:
+        return jsonify({'status': 'error', 'message': f'Job is {job.state}.', **job.to_dict()}), 409
+    try:
+        result = leaderboard_store.page(
+            job.id,
+            sort=request.args.get('sort', DEFAULT_SORT),
+            order=request.args.get('order', 'asc').lower(),
+            page=request.args.get('page', 1, type=int),
+            per_page=min(request.args.get('per_page', config.LEADERBOARD_PAGE_SIZE, type=int), config.LEADERBOARD_MAX_PAGE_SIZE),
+            classifications=request.args.getlist('classification'),
+            license_risks=request.args.getlist('license_risk'),
+            managers=request.args.getlist('manager'),
+            search=request.args.get('q'),
+        )
+    except LeaderboardQueryError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    if result is None:
+        return jsonify({'status': 'error', 'message': 'No leaderboard was stored for this job.'}), 404
+    return jsonify({'status': 'success', **result})
+
+@app.route('/jobs/<job_id>/profile', methods=['GET'])
+def download_job_profile(job_id):
+    """The job's profile: ?format=prof (pstats, default) or ?format=collapsed (flamegraph stacks)"""
+    job = _current_job(job_id)
+    if job is None:
+        return jsonify({'status': 'error', 'message': 'Job not found or expired.'}), 404
+    profile_format = request.args.get('format', 'prof')
+    path = job.artifacts.get('profile', {}).get(profile_format)
+    if not path or not os.path.exists(path):
+        return jsonify({'status': 'error', 'message': 'No profile was captured for this job.'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=f"analysis-{job.id}.{profile_format}",
+                     mimetype='application/octet-stream' if profile_format == 'prof' else 'text/plain')
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Operational metrics in the Prometheus text exposition format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@socketio.on('attach_job')
+def handle_attach_job(data):
+    """Re-attach a (re)connected client to a job: join its room and replay its outcome if finished"""
+    job = _current_job((data or {}).get('job_id'))
+    if job is None:
+        emit('job_status', {'job_id': (data or {}).get('job_id'), 'state': 'unknown', 'message': 'Job not found or expired.'})
+        return
+    join_room(job_room(job.id))
+    emit('job_status', job.to_dict())
+    if job.state == DONE:
+        emit('analysis_complete', job.result)
+    elif job.state == FAILED:
+        emit('analysis_error', {'message': job.error, 'job_id': job.id})
+    elif job.state == CANCELLED:
+        emit('analysis_cancelled', job.to_dict())
+
+@socketio.on('cancel_job')
+def handle_cancel_job(data):
+    job = _current_job((data or {}).get('job_id'))
+    if job is not None and _cancel(job):
+        emit('job_status', job.to_dict())
 
 @socketio.on('perform_deep_dive')
 def handle_deep_dive(data):
     user_id = session.get('user_id')
+    if not user_id:
+        metrics.DEEP_DIVES.inc(outcome='error')
+        emit('deep_dive_error', {'message': 'User session not found. Please refresh the page.'})
+        return
+    temp_janitor.touch(user_id)
     session_folder = os.path.join(app.config['TEMP_FOLDER'], user_id)
     deep_dive_path = os.path.join(session_folder, 'deep_dive_data.pkl')
 
     if not os.path.exists(deep_dive_path):
+        metrics.DEEP_DIVES.inc(outcome='no_analysis')
         emit('deep_dive_error', {'message': 'No analysis data found.'})
         return
 
@@ -219,114 +605,30 @@ def handle_deep_dive(data):
     try:
         user_email = data['email'].strip().lower()
     except (KeyError, AttributeError):
+        metrics.DEEP_DIVES.inc(outcome='error')
         emit('deep_dive_error', {'message': 'Invalid email provided for deep dive.'})
         return
 
-    full_usage_data = deep_dive_data['full_usage_data']
-    utilized_metrics_df = deep_dive_data['utilized_metrics_df']
-    filters_applied = deep_dive_data.get('filters_applied', {}) # Retrieve stored filters
-
-    user_data = full_usage_data[full_usage_data['User Principal Name'] == user_email].copy()
-    user_metrics = utilized_metrics_df[utilized_metrics_df['Email'] == user_email]
-
-    if user_data.empty or user_metrics.empty:
-        emit('deep_dive_result', {'text': f"No records found for '{user_email}'.", 'chart_user': None, 'chart_group': None})
-        return
-
-    metrics = user_metrics.iloc[0]
-    text_result = f"--- Summary for {user_email} ---\nClassification: {metrics['Classification']}\nJustification: {metrics['Justification']}\n\nGlobal Rank: {int(metrics['Global Rank'])}\nAdjusted Consistency: {metrics['Adjusted Consistency (%)']:.1f}%\nOriginal Consistency: {metrics['Usage Consistency (%)']:.1f}%\nAdoption Date: {metrics['Adoption Date'].strftime('%Y-%m-%d') if pd.notna(metrics.get('Adoption Date')) else 'N/A'}\nFirst Seen: {metrics['First Appearance'].strftime('%Y-%m-%d') if pd.notna(metrics['First Appearance']) else 'N/A'}\nLast Seen: {metrics['Overall Recency'].strftime('%Y-%m-%d') if pd.notna(metrics['Overall Recency']) else 'N/A'}\nDays Since License: {int(metrics['Days Since License']) if pd.notna(metrics.get('Days Since License')) else 'N/A'}\nUsage Complexity (Total Tools): {int(metrics['Usage Complexity'])}\nAvg Tools per Report: {metrics['Avg Tools / Report']:.2f}\nAdoption Velocity: {metrics['Adoption Velocity']:.4f} tools/day\nEngagement Score: {metrics['Engagement Score']:.2f}\nUsage Trend: {metrics['Usage Trend']}\n\n"
-    tool_cols = [col for col in full_usage_data.columns if 'Last activity date of' in col]
-    if metrics['Usage Complexity'] > 0:
-        text_result += f"--- Detailed Records ---\n"
-        for _, row in user_data.sort_values(by="Report Refresh Date", ascending=False).iterrows():
-            text_result += f"\nReport Date: {row['Report Refresh Date'].strftime('%Y-%m-%d')}\n"
-            tools_used_in_report = [f"  - {col.replace('Last activity date of ', '').replace(' (UTC)', '')}: {row[col].strftime('%Y-%m-%d')}" for col in tool_cols if pd.notna(row[col])]
-            if tools_used_in_report:
-                text_result += "\n".join(tools_used_in_report) + "\n"
-            else:
-                text_result += "  - No specific tool activity recorded for this date.\n"
-    
-    # Prepare chart data
-    chart_data = {
-        'categories': [],
-        'series': [
-            {'name': 'User', 'data': []},
-            {'name': 'Sample Group', 'data': []},
-            {'name': 'Global', 'data': []}
-        ]
-    }
     try:
-        # Calculate actual recent activity for user
-        user_data['recent_activity'] = 0
-        for idx, row in user_data.iterrows():
-            recent_tools = 0
-            report_date = row['Report Refresh Date']
-            for col in tool_cols:
-                if pd.notna(row[col]):
-                    last_activity = row[col]
-                    # Consider tool "recently used" if within 30 days of report
-                    days_since_use = (report_date - last_activity).days
-                    if days_since_use <= 30:  # Tool used in last 30 days
-                        recent_tools += 1
-            user_data.at[idx, 'recent_activity'] = recent_tools
-
-        # Group by report date - use mean to show average activity level
-        graph_data_user = user_data.groupby('Report Refresh Date')['recent_activity'].mean().sort_index()
-
-        # Filtered group data - apply same logic
-        if not filters_applied or all(not v for v in filters_applied.values()):
-            filtered_group_usage_data = full_usage_data.copy()
-        else:
-            filtered_user_emails = utilized_metrics_df['Email'].str.lower().tolist()
-            filtered_group_usage_data = full_usage_data[full_usage_data['User Principal Name'].isin(filtered_user_emails)].copy()
-
-        # Calculate recent activity for group
-        filtered_group_usage_data['recent_activity'] = 0
-        for idx, row in filtered_group_usage_data.iterrows():
-            recent_tools = 0
-            report_date = row['Report Refresh Date']
-            for col in tool_cols:
-                if pd.notna(row[col]):
-                    last_activity = row[col]
-                    days_since_use = (report_date - last_activity).days
-                    if days_since_use <= 30:
-                        recent_tools += 1
-            filtered_group_usage_data.at[idx, 'recent_activity'] = recent_tools
-
-        graph_data_group = filtered_group_usage_data.groupby('Report Refresh Date')['recent_activity'].mean().sort_index()
-
-        # Global data - apply same logic
-        all_usage_data = full_usage_data.copy()
-        all_usage_data['recent_activity'] = 0
-        for idx, row in all_usage_data.iterrows():
-            recent_tools = 0
-            report_date = row['Report Refresh Date']
-            for col in tool_cols:
-                if pd.notna(row[col]):
-                    last_activity = row[col]
-                    days_since_use = (report_date - last_activity).days
-                    if days_since_use <= 30:
-                        recent_tools += 1
-            all_usage_data.at[idx, 'recent_activity'] = recent_tools
-
-        graph_data_global = all_usage_data.groupby('Report Refresh Date')['recent_activity'].mean().sort_index()
-
-        # Combine all date indexes
-        all_dates = sorted(list(set(graph_data_user.index) | set(graph_data_group.index) | set(graph_data_global.index)))
-        chart_data['categories'] = [d.strftime('%Y-%m-%d') for d in all_dates]
-
-        # Reindex and fill data - use float for accuracy, not int
-        chart_data['series'][0]['data'] = graph_data_user.reindex(all_dates, fill_value=0).round(2).tolist()
-        chart_data['series'][1]['data'] = graph_data_group.reindex(all_dates, fill_value=0).round(2).tolist()
-        chart_data['series'][2]['data'] = graph_data_global.reindex(all_dates, fill_value=0).round(2).tolist()
-
-    except Exception as e:
-        print(f"Error generating chart data: {e}")
+        result = build_deep_dive(deep_dive_data, user_email)
+    except DeepDiveError as e:
+        logger.exception("Error generating deep-dive chart data: %s", e)
+        metrics.DEEP_DIVES.inc(outcome='error')
         emit('deep_dive_error', {'message': 'Error preparing chart data.'})
         return
 
-    emit('deep_dive_result', {'text': text_result, 'chart_data': chart_data})
+    if result is None:
+        metrics.DEEP_DIVES.inc(outcome='not_found')
+        emit('deep_dive_result', {'text': f"No records found for '{user_email}'.", 'chart_user': None, 'chart_group': None})
+        return
+
+    metrics.DEEP_DIVES.inc(outcome='success')
+    emit('deep_dive_result', result)
 
 if __name__ == '__main__':
-    print("Starting server... Access from your network at http://<your-ip-address>:5000")
+    configure_logging()
+    # debug=True runs the server in a reloader child; the watching parent needs no workers
+    if analysis_pool is not None and os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        analysis_pool.start()
+    logger.info("Starting server... Access from your network at http://<your-ip-address>:5000")
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,93 @@
+"""
+Archive Ingest
+Unpacks bulk usage uploads (.zip of reports) into a session folder without buffering them in memory
+"""
+
+import gzip
+import os
+import shutil
+import zipfile
+from typing import BinaryIO, List, Tuple
+
+
+USAGE_REPORT_EXTENSIONS = ('.csv', '.csv.gz', '.xlsx', '.xls')
+
+# Guard against archives that expand far beyond what a usage export can plausibly be
+MAX_ARCHIVE_MEMBERS = 1000
+MAX_ARCHIVE_UNCOMPRESSED_BYTES = 20 * 1024 ** 3
+
+
+class ArchiveError(Exception):
+    """Raised when an uploaded archive cannot be used"""
+
+
+def is_archive(filename: str) -> bool:
+    return filename.lower().endswith('.zip')
+
+
+def is_usage_report_name(filename: str) -> bool:
+    """True for report files inside an archive, skipping folders and OS metadata entries"""
+    name = os.path.basename(filename)
+    if not name or name.startswith('.') or filename.startswith('__MACOSX/'):
+        return False
+    return name.lower().endswith(USAGE_REPORT_EXTENSIONS)
+
+
+def _unique_name(name: str, taken: set) -> str:
+    """Avoid collisions when reports in different archive folders share a file name"""
+    if name not in taken:
+        return name
+    stem, ext = (name[:-7], name[-7:]) if name.lower().endswith('.csv.gz') else os.path.splitext(name)
+    counter = 2
+    while f"{stem}_{counter}{ext}" in taken:
+        counter += 1
+    return f"{stem}_{counter}{ext}"
+
+
+def extract_usage_archive(stream: BinaryIO, dest_folder: str) -> List[Tuple[str, str]]:
+    """
+    Stream every usage report in a ZIP archive into dest_folder
+
+    CSV members are recompressed to .csv.gz on the way out so they stay small on disk;
+    the usage reader decompresses them transparently. Excel members are already
+    compressed and are copied as-is.
+
+    Returns:
+        List of (registered filename, saved path) tuples, in archive order
+    """
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile as e:
+        raise ArchiveError(f"Not a valid ZIP archive: {e}")
+
+    with archive:
+        members = [info for info in archive.infolist() if not info.is_dir() and is_usage_report_name(info.filename)]
+        if not members:
+            raise ArchiveError("The archive does not contain any CSV or Excel usage reports.")
+        if len(members) > MAX_ARCHIVE_MEMBERS:
+            raise ArchiveError(f"The archive contains {len(members)} reports; the limit is {MAX_ARCHIVE_MEMBERS}.")
+        if sum(info.file_size for info in members) > MAX_ARCHIVE_UNCOMPRESSED_BYTES:
+            raise ArchiveError("The archive is too large once uncompressed.")
+
+        saved = []
+        # Re-uploading an archive overwrites its reports, as re-uploading a single file does
+        taken = set()
+        for info in members:
+            name = os.path.basename(info.filename)
+            if name.lower().endswith('.csv'):
+                name += '.gz'
+            name = _unique_name(name, taken)
+            taken.add(name)
+            save_path = os.path.join(dest_folder, name)
+            with archive.open(info) as src:
+                if name.lower().endswith('.csv.gz') and not info.filename.lower().endswith('.gz'):
+                    # No name or timestamp in the gzip header, so the same report always
+                    # produces the same bytes (and content hash)
+                    with open(save_path, 'wb') as raw, \
+                            gzip.GzipFile(filename='', mode='wb', compresslevel=1, fileobj=raw, mtime=0) as dst:
+                        shutil.copyfileobj(src, dst)
+                else:
+                    with open(save_path, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+            saved.append((name, save_path))
+        return saved
@@ -0,0 +1,281 @@
+"""
+Benchmarks
+Times each analysis stage on generated datasets at several scales, appends the results to a
+JSON-lines history and fails when a stage regresses past the tolerance against a stored baseline
+
+Examples:
+    python benchmark.py                                  # compare with benchmarks/baseline.json
+    python benchmark.py --scales 1000 5000 --repeat 3 --tolerance 0.5
+    python benchmark.py --update-baseline                # accept the current numbers
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+import config
+from analysis_logic import CopilotAnalyzer
+from dataset_cache import DatasetCache
+from deep_dive import build_deep_dive
+from logging_config import configure_logging
+from rui_calculator import RUICalculator
+from synthetic_data import generate_dataset
+
+
+STAGES = (
+    'execute_analysis', 'calculate_rui_scores', 'assign_peer_groups', 'get_manager_summary',
+    'usage_complexity', 'create_excel_report', 'deep_dive',
+)
+NO_FILTERS = {'companies': [], 'departments': [], 'locations': [], 'managers': []}
+MIB = 1024 * 1024
+
+# Methods whose inputs are recorded during the first full run and replayed per stage
+_RECORDED = (
+    (RUICalculator, 'calculate_rui_scores'),
+    (RUICalculator, '_assign_peer_groups'),
+    (RUICalculator, 'get_manager_summary'),
+    (CopilotAnalyzer, 'calculate_usage_complexity_over_time'),
+    (CopilotAnalyzer, 'create_excel_report'),
+)
+
+
+def _snapshot(values):
+    """
+    Copies of the DataFrames in values, so stages that add columns in place start fresh;
+    progress callbacks are dropped so replayed stages run silently
+    """
+    return tuple(value.copy() if isinstance(value, pd.DataFrame) else None if callable(value) else value
+                 for value in values)
+
+
+@contextmanager
+def recording_calls(calls: Dict[str, Tuple]):
+    """Record (instance, args) of the first call to each _RECORDED method"""
+    originals = []
+    for cls, name in _RECORDED:
+        original = getattr(cls, name)
+        originals.append((cls, name, original))
+
+        def wrapper(self, *args, _name=name, _original=original, **kwargs):
+            calls.setdefault(_name, (self, _snapshot(args)))
+            return _original(self, *args, **kwargs)
+        setattr(cls, name, wrapper)
+    try:
+        yield calls
+    finally:
+        for cls, name, original in originals:
+            setattr(cls, name, original)
+
+
+def new_analyzer() -> CopilotAnalyzer:
+    """An analyzer that reads every input from disk, never from the dataset or result cache"""
+    analyzer = CopilotAnalyzer()
+    analyzer.dataset_cache = DatasetCache(None, 0)
+    return analyzer
+
+
+def measure(fn: Callable, make_args: Callable[[], Tuple], repeat: int, memory: bool = True) -> Dict:
+    """Best and mean wall time over `repeat` runs, plus the traced peak allocation of one more run"""
+    seconds = []
+    for _ in range(max(1, repeat)):
+        args = make_args()
+        gc.collect()
+        start = time.perf_counter()
+        fn(*args)
+        seconds.append(time.perf_counter() - start)
+    result = {'seconds': round(min(seconds), 4), 'mean_seconds': round(sum(seconds) / len(seconds), 4),
+              'runs': len(seconds)}
+    if memory:
+        # Separate run: tracing allocations slows the code down too much to time it
+        args = make_args()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            fn(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        result['peak_mb'] = round(peak / MIB, 2)
+    return result
+
+
+def ensure_dataset(users: int, seed: int = 0, weeks: int = 26, folder: Optional[str] = None) -> Dict:
+    """Generate (once) and return the synthetic dataset for this scale"""
+    out_dir = os.path.join(folder or os.path.join(config.BENCHMARK_FOLDER, 'data'), f"users-{users}-seed-{seed}-weeks-{weeks}")
+    manifest = os.path.join(out_dir, 'dataset.json')
+    if os.path.exists(manifest):
+        with open(manifest, encoding='utf-8') as f:
+            return json.load(f)
+    dataset = generate_dataset(out_dir, users=users, weeks=weeks, seed=seed)
+    with open(manifest, 'w', encoding='utf-8') as f:
+        json.dump(dataset, f)
+    return dataset
+
+
+def benchmark_scale(dataset: Dict, stages=STAGES, repeat: int = 2, memory: bool = True) -> Dict[str, Dict]:
+    """Run every requested stage on one dataset; returns {stage: measurement}"""
+    usage_files = {os.path.basename(path): path for path in dataset['usage']}
+    target = dataset['target']
+
+    # First run: warms imports and records the inputs each stage is replayed with
+    calls: Dict[str, Tuple] = {}
+    with recording_calls(calls):
+        results = new_analyzer().execute_analysis(usage_files, target, NO_FILTERS)
+    if 'error' in results:
+        raise RuntimeError(f"Benchmark analysis failed: {results['error']}")
+
+    def replay(name):
+        instance, args = calls[name]
+        return getattr(instance, name), lambda: _snapshot(args)
+
+    deep_dive_data = dict(results['deep_dive_data'], filters_applied=NO_FILTERS)
+    deep_dive_email = deep_dive_data['utilized_metrics_df']['Email'].iloc[0]
+
+    runners = {
+        'execute_analysis': lambda: (lambda: new_analyzer().execute_analysis(usage_files, target, NO_FILTERS), tuple),
+        'calculate_rui_scores': lambda: replay('calculate_rui_scores'),
+        'assign_peer_groups': lambda: replay('_assign_peer_groups'),
+        'get_manager_summary': lambda: replay('get_manager_summary'),
+        'usage_complexity': lambda: replay('calculate_usage_complexity_over_time'),
+        'create_excel_report': lambda: replay('create_excel_report'),
+        'deep_dive': lambda: (build_deep_dive, lambda: (deep_dive_data, deep_dive_email)),
+    }
+    measurements = {}
+    for stage in stages:
+        fn, make_args = runners[stage]()
+        measurements[stage] = measure(fn, make_args, repeat, memory)
+        measurements[stage]['users'] = len(results['deep_dive_data']['utilized_metrics_df'])
+    return measurements
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float = None, min_seconds: float = None,
+            min_mb: float = None) -> List[str]:
+    """Regressions of current against baseline ({scale: {stage: measurement}}), as messages"""
+    tolerance = config.BENCHMARK_TOLERANCE if tolerance is None else tolerance
+    min_seconds = config.BENCHMARK_MIN_SECONDS if min_seconds is None else min_seconds
+    min_mb = config.BENCHMARK_MIN_MB if min_mb is None else min_mb
+    regressions = []
+    for scale, stages in sorted(current.items()):
+        for stage, result in stages.items():
+            base = baseline.get(scale, {}).get(stage)
+            if not base:
+                continue
+            checks = [('seconds', 's', min_seconds), ('peak_mb', ' MB', min_mb)]
+            for key, unit, slack in checks:
+                if key not in result or key not in base:
+                    continue
+                limit = base[key] * (1 + tolerance)
+                if result[key] > limit and result[key] - base[key] > slack:
+                    regressions.append(f"{stage} @ {scale} users: {key} {result[key]}{unit} vs baseline "
+                                       f"{base[key]}{unit} (+{(result[key] / base[key] - 1) * 100 if base[key] else float('inf'):.0f}%)")
+    return regressions
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def append_history(path: str, record: Dict) -> None:
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def load_baseline(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def format_table(results: Dict) -> str:
+    lines = [f"{'users':>8}  {'stage':<22} {'best s':>9} {'mean s':>9} {'peak MB':>9}"]
+    for scale, stages in results.items():
+        for stage, result in stages.items():
+            peak = f"{result['peak_mb']:.1f}" if 'peak_mb' in result else '-'
+            lines.append(f"{scale:>8}  {stage:<22} {result['seconds']:>9.3f} {result['mean_seconds']:>9.3f} {peak:>9}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis stages and check for regressions.")
+    parser.add_argument('--scales', type=int, nargs='+', default=config.BENCHMARK_SCALES, help="User counts to benchmark")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help="Stages to run")
+    parser.add_argument('--repeat', type=int, default=2, help="Timed runs per stage; the best one is compared")
+    parser.add_argument('--weeks', type=int, default=26, help="Weekly reports per dataset")
+    parser.add_argument('--seed', type=int, default=0, help="Dataset seed")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the traced peak-memory run")
+    parser.add_argument('--tolerance', type=float, default=config.BENCHMARK_TOLERANCE,
+                        help="Allowed slowdown / memory growth as a fraction of the baseline")
+    parser.add_argument('--folder', default=config.BENCHMARK_FOLDER, help="Datasets, history and baseline folder")
+    parser.add_argument('--baseline', help="Baseline file (default <folder>/baseline.json)")
+    parser.add_argument('--update-baseline', action='store_true', help="Store this run as the baseline")
+    parser.add_argument('--log-level', default='ERROR', help="Log level of the analysis while benchmarking")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_logging(level=args.log_level, fmt='%(name)s: %(message)s')
+    baseline_path = args.baseline or os.path.join(args.folder, 'baseline.json')
+
+    results = {}
+    for users in args.scales:
+        dataset = ensure_dataset(users, args.seed, args.weeks, os.path.join(args.folder, 'data'))
+        print(f"Benchmarking {users} users ({dataset['rows']} report rows)...", flush=True)
+        results[str(users)] = benchmark_scale(dataset, args.stages, args.repeat, not args.no_memory)
+    print(format_table(results))
+
+    record = {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'repeat': args.repeat,
+        'weeks': args.weeks,
+        'seed': args.seed,
+        'results': results,
+    }
+    append_history(os.path.join(args.folder, 'history.jsonl'), record)
+
+    if args.update_baseline:
+        baseline = load_baseline(baseline_path) or {}
+        scales = baseline.get('results', {})
+        scales.update(results)  # scales not benchmarked this time keep their old baseline
+        with open(baseline_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(record, results=scales), f, indent=2, sort_keys=True)
+        print(f"Baseline written to {baseline_path}")
+        return 0
+
+    baseline = load_baseline(baseline_path)
+    if baseline is None:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to store one")
+        return 0
+    regressions = compare(results, baseline['results'], args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against the baseline from {baseline.get('commit') or baseline.get('timestamp')}:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} against the baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Chunked Uploads
+Resumable upload protocol: files arrive in checksummed chunks that are streamed to disk,
+with a SHA-256 content hash computed as they arrive
+"""
+
+import hashlib
+import json
+import os
+import threading
+import uuid
+import zlib
+from typing import Dict, Optional
+
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class UploadError(Exception):
+    """Raised when a chunk or upload request cannot be accepted"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def chunk_checksum(data: bytes) -> str:
+    """CRC32 of a chunk as 8 lower-case hex digits (cheap to compute in the browser too)"""
+    return format(zlib.crc32(data) & 0xFFFFFFFF, '08x')
+
+
+def file_sha256(path: str) -> str:
+    """Streaming SHA-256 of a file on disk"""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def save_stream(stream, path: str) -> str:
+    """Write a stream to path, returning the SHA-256 of what was written"""
+    hasher = hashlib.sha256()
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+            f.write(block)
+    return hasher.hexdigest()
+
+
+class ChunkedUpload:
+    """State of one in-progress upload"""
+
+    def __init__(self, upload_id: str, folder: str, filename: str, file_type: str, total_size: int):
+        self.upload_id = upload_id
+        self.folder = folder
+        self.filename = filename
+        self.file_type = file_type
+        self.total_size = total_size
+        self.received = 0
+        self.hasher = hashlib.sha256()
+        self.lock = threading.Lock()
+
+    @property
+    def part_path(self) -> str:
+        return os.path.join(self.folder, f".upload-{self.upload_id}.part")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.folder, f".upload-{self.upload_id}.json")
+
+    def to_dict(self) -> Dict:
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'file_type': self.file_type,
+            'total_size': self.total_size,
+            'received': self.received,
+        }
+
+
+class ChunkedUploadManager:
+    """Tracks resumable uploads; state survives a restart through a metadata file per upload"""
+
+    def __init__(self, max_upload_bytes: int):
+        self.max_upload_bytes = max_upload_bytes
+        self._uploads: Dict[str, ChunkedUpload] = {}
+        self._lock = threading.Lock()
+
+    def start(self, folder: str, filename: str, file_type: str, total_size: int) -> ChunkedUpload:
+        filename = os.path.basename(filename or '')
+        if not filename or file_type not in ('usage', 'target'):
+            raise UploadError('Missing file name or file type.')
+        if total_size < 0:
+            raise UploadError('Invalid file size.')
+        if total_size > self.max_upload_bytes:
+            raise UploadError(
+                f"File is {total_size / 1024 ** 2:.0f} MB; the limit is {self.max_upload_bytes / 1024 ** 2:.0f} MB.", 413
+            )
+
+        os.makedirs(folder, exist_ok=True)
+        upload = ChunkedUpload(uuid.uuid4().hex, folder, filename, file_type, total_size)
+        open(upload.part_path, 'wb').close()
+        with open(upload.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({k: v for k, v in upload.to_dict().items() if k != 'received'}, f)
+        with self._lock:
+            self._uploads[upload.upload_id] = upload
+        return upload
+
+    def get(self, folder: str, upload_id: str) -> ChunkedUpload:
+        """Look up an upload, reloading it from disk if this process hasn't seen it"""
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is not None and upload.folder == folder:
+                return upload
+
+            upload = ChunkedUpload(upload_id, folder, '', '', 0)
+            if not upload_id.isalnum() or not os.path.exists(upload.meta_path) or not os.path.exists(upload.part_path):
+                raise UploadError('Upload not found. Please start the upload again.', 404)
+            with open(upload.meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            upload.filename, upload.file_type, upload.total_size = meta['filename'], meta['file_type'], meta['total_size']
+            # Rebuild the running hash from what already reached the disk
+            with open(upload.part_path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    upload.hasher.update(block)
+                    upload.received += len(block)
+            self._uploads[upload_id] = upload
+            return upload
+
+    def write_chunk(self, upload: ChunkedUpload, offset: int, data: bytes, checksum: Optional[str]) -> int:
+        """Append a chunk at offset; returns the number of bytes received so far"""
+        with upload.lock:
+            if offset != upload.received:
+                raise UploadError(f"Expected offset {upload.received}, got {offset}.", 409)
+            if checksum is not None and checksum.lower() != chunk_checksum(data):
+                raise UploadError('Chunk checksum mismatch. Please resend the chunk.', 422)
+            if upload.received + len(data) > upload.total_size:
+                raise UploadError('Chunk extends past the declared file size.', 413)
+            with open(upload.part_path, 'ab') as f:
+                f.write(data)
+            upload.hasher.update(data)
+            upload.received += len(data)
+            return upload.received
+
+    def complete(self, upload: ChunkedUpload) -> str:
+        """Check the upload is whole and return its SHA-256; the caller then takes the part file"""
+        with upload.lock:
+            if upload.received != upload.total_size:
+                raise UploadError(f"Upload incomplete: {upload.received} of {upload.total_size} bytes received.", 409)
+            content_hash = upload.hasher.hexdigest()
+        with self._lock:
+            self._uploads.pop(upload.upload_id, None)
+        if os.path.exists(upload.meta_path):
+            os.remove(upload.meta_path)
+        return content_hash
@@ -0,0 +1,249 @@
+"""
+Command-line runner
+Runs the full analysis without the web app, for scheduled or batch runs
+
+Examples:
+    python cli.py --usage reports/ --target manager_report.csv --out out/
+    python cli.py --usage reports/ --preset qsc --preset test --workers 2 --out out/
+    python cli.py --usage reports.zip --target targets.csv --manager "Sarah Docker" --name sarah
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+import config
+from analysis_logic import CopilotAnalyzer
+from logging_config import configure_logging
+from profiling import profile_call
+from progress import LoggingProgressSink, QueueProgressSink, relay_queue
+from archive_ingest import ArchiveError, extract_usage_archive, is_archive, is_usage_report_name
+from usage_reader import HAS_PYARROW
+
+
+def collect_usage_files(inputs: List[str], extract_dir: str, exclude=()) -> Dict[str, str]:
+    """Expand files, directories and ZIP archives into the {name: path} mapping the analyzer takes"""
+    # Target files kept next to the reports are not usage reports
+    excluded = {os.path.abspath(path) for path in exclude if path}
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for name in sorted(os.listdir(item)):
+                full = os.path.join(item, name)
+                if os.path.abspath(full) in excluded:
+                    continue
+                if os.path.isfile(full) and (is_usage_report_name(name) or is_archive(name)):
+                    paths.append(full)
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            raise FileNotFoundError(f"Usage input not found: {item}")
+
+    usage_files = {}
+    for path in paths:
+        if is_archive(path):
+            target_dir = os.path.join(extract_dir, f"archive_{len(usage_files)}")
+            os.makedirs(target_dir, exist_ok=True)
+            with open(path, 'rb') as stream:
+                members = extract_usage_archive(stream, target_dir)
+        else:
+            members = [(os.path.basename(path), path)]
+        for name, member_path in members:
+            key = name
+            while key in usage_files:
+                key = f"{len(usage_files)}_{name}"
+            usage_files[key] = member_path
+    return usage_files
+
+
+def build_runs(args) -> List[Dict]:
+    """One run per preset, per entry in --runs, or a single run from the command-line filters"""
+    cli_filters = {
+        'companies': args.company or [],
+        'departments': args.department or [],
+        'locations': args.location or [],
+        'managers': args.manager or [],
+    }
+    runs = []
+    for preset in args.preset or []:
+        if preset not in config.TARGET_PRESETS:
+            raise ValueError(f"Unknown preset '{preset}'. Available: {', '.join(sorted(config.TARGET_PRESETS))}")
+        preset_data = config.TARGET_PRESETS[preset]
+        filters = dict(cli_filters)
+        filters['managers'] = list(preset_data.get('managers', []))
+        runs.append({'name': preset, 'target': preset_data.get('file_path') or args.target, 'filters': filters})
+
+    if args.runs:
+        with open(args.runs, encoding='utf-8') as f:
+            for i, entry in enumerate(json.load(f)):
+                runs.append({
+                    'name': entry.get('name') or f"run_{i + 1}",
+                    'target': entry.get('target') or args.target,
+                    'filters': {key: entry.get('filters', {}).get(key, []) for key in cli_filters},
+                })
+
+    if not runs:
+        runs.append({'name': args.name, 'target': args.target, 'filters': cli_filters})
+    return runs
+
+
+def safe_name(name: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('_') or 'run'
+
+
+def write_table(df: Optional[pd.DataFrame], path_stem: str) -> Optional[str]:
+    """Write a frame as Parquet when pyarrow is available, otherwise CSV; returns the path"""
+    if df is None or df.empty:
+        return None
+    # Nested values (e.g. 'Trend Details') are stored as JSON text so the table stays flat
+    nested = [col for col in df.columns if df[col].map(lambda v: isinstance(v, (dict, list))).any()]
+    if nested:
+        df = df.assign(**{col: df[col].map(lambda v: json.dumps(v, default=str) if isinstance(v, (dict, list)) else v)
+                          for col in nested})
+    if HAS_PYARROW:
+        path = path_stem + '.parquet'
+        df.to_parquet(path, index=False)
+    else:
+        path = path_stem + '.csv'
+        df.to_csv(path, index=False)
+    return path
+
+
+def run_progress_sink(name: Optional[str]) -> LoggingProgressSink:
+    return LoggingProgressSink(logging.getLogger(f"cli.{safe_name(name or 'run')}"))
+
+
+def run_one(run: Dict, usage_files: Dict[str, str], out_dir: str, progress_queue=None, profile: bool = False) -> Dict:
+    """Run one configuration and write its outputs; executed in a worker process"""
+    run_dir = os.path.join(out_dir, safe_name(run['name']))
+    os.makedirs(run_dir, exist_ok=True)
+    # Workers send progress back to the parent, which logs it in one ordered stream
+    if progress_queue is not None:
+        progress = QueueProgressSink(progress_queue, run['name'])
+    else:
+        progress = run_progress_sink(run['name'])
+    runner = CopilotAnalyzer(progress=progress)
+    outputs = []
+    if profile:
+        results, profile_paths = profile_call(os.path.join(run_dir, 'profile'), runner.execute_analysis,
+                                              usage_files, run['target'], run['filters'])
+        outputs.extend(profile_paths.values())
+    else:
+        results = runner.execute_analysis(usage_files, run['target'], run['filters'])
+    if 'error' in results:
+        return {'name': run['name'], 'status': 'error', 'error': results['error']}
+
+    excel_bytes = results['reports']['excel_bytes']
+    if excel_bytes is None:
+        logging.getLogger(f"cli.{safe_name(run['name'])}").error("Excel report could not be generated")
+    else:
+        excel_path = os.path.join(run_dir, 'copilot_usage_report.xlsx')
+        with open(excel_path, 'wb') as f:
+            f.write(excel_bytes)
+        outputs.append(excel_path)
+    html_path = os.path.join(run_dir, 'leaderboard.html')
+    with open(html_path, 'w', encoding='utf-8') as f:
+        f.write(results['reports']['html_string'])
+    outputs.append(html_path)
+    for stem, df in [('user_metrics', results['deep_dive_data']['utilized_metrics_df']),
+                     ('manager_summary', getattr(runner, 'manager_summary_df', None))]:
+        path = write_table(df, os.path.join(run_dir, stem))
+        if path:
+            outputs.append(path)
+    with open(os.path.join(run_dir, 'dashboard.json'), 'w', encoding='utf-8') as f:
+        json.dump({'name': run['name'], 'filters': run['filters'], 'dashboard': results['dashboard'],
+                   'timings': results.get('timings', [])}, f, indent=2)
+    if excel_bytes is None:
+        # The other outputs are still written, but the run counts as failed
+        return {'name': run['name'], 'status': 'error', 'error': 'Excel report could not be generated',
+                'outputs': outputs}
+    return {'name': run['name'], 'status': 'success', 'users': results['dashboard']['total'], 'outputs': outputs}
+
+
+def warm_inputs(usage_files: Dict[str, str], runs: List[Dict]) -> None:
+    """Parse the shared inputs once so every worker loads them from the dataset cache"""
+    runner = CopilotAnalyzer(progress=run_progress_sink('inputs'))
+    if not runner.dataset_cache.enabled:
+        return
+    runner.load_usage_reports(usage_files)
+    for target in sorted({run['target'] for run in runs if run['target']}):
+        if os.path.exists(target):
+            runner.read_target_file(target)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Copilot usage analysis without the web app.")
+    parser.add_argument('--usage', nargs='+', required=True,
+                        help="Usage report files, directories of reports, or ZIP archives")
+    parser.add_argument('--target', help="Target users / manager report CSV")
+    parser.add_argument('--preset', action='append', choices=sorted(config.TARGET_PRESETS),
+                        help="Run with a preset from config.TARGET_PRESETS (repeatable)")
+    parser.add_argument('--runs', help="JSON file with a list of {name, target, filters} configurations")
+    parser.add_argument('--company', action='append', help="Company filter (repeatable)")
+    parser.add_argument('--department', action='append', help="Department filter (repeatable)")
+    parser.add_argument('--location', action='append', help="City filter (repeatable)")
+    parser.add_argument('--manager', action='append', help="Manager filter (repeatable)")
+    parser.add_argument('--name', default='analysis', help="Output folder name for a single run")
+    parser.add_argument('--out', default='analysis_output', help="Output directory")
+    parser.add_argument('--workers', type=int, default=1, help="Parallel worker processes for multiple runs")
+    parser.add_argument('--log-level', default=config.LOG_LEVEL, help="Log level, e.g. DEBUG for per-sheet report details")
+    parser.add_argument('--profile', action='store_true', default=config.PROFILE_ANALYSES,
+                        help="Run under cProfile and write profile.prof and profile.collapsed per run")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_logging(level=args.log_level, fmt='%(name)s: %(message)s')
+    try:
+        runs = build_runs(args)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix='copilot_cli_') as extract_dir:
+        try:
+            usage_files = collect_usage_files(args.usage, extract_dir, exclude=[run['target'] for run in runs])
+        except (ArchiveError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 2
+        if not usage_files:
+            print("Error: no usage reports found", file=sys.stderr)
+            return 2
+        print(f"Found {len(usage_files)} usage reports; running {len(runs)} configuration(s)")
+
+        workers = max(1, min(args.workers, len(runs)))
+        if workers == 1:
+            summaries = [run_one(run, usage_files, args.out, profile=args.profile) for run in runs]
+        else:
+            warm_inputs(usage_files, runs)
+            with multiprocessing.Manager() as manager, ProcessPoolExecutor(max_workers=workers) as pool:
+                progress_queue = manager.Queue()
+                futures = [pool.submit(run_one, run, usage_files, args.out, progress_queue, args.profile) for run in runs]
+                while not all(future.done() for future in futures):
+                    relay_queue(progress_queue, run_progress_sink, timeout=0.5)
+                relay_queue(progress_queue, run_progress_sink)
+                summaries = [future.result() for future in futures]
+
+    failed = 0
+    for summary in summaries:
+        if summary['status'] == 'success':
+            print(f"[ok]    {summary['name']}: {summary['users']} users -> {', '.join(summary['outputs'])}")
+        else:
+            failed += 1
+            print(f"[error] {summary['name']}: {summary['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
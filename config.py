@@ -12,3 +12,93 @@ TARGET_PRESETS = {
         'managers': ['Nathalie Gerschtein']
     }
 }
+
+
+# Memory budget for a single analysis in MB; the analysis stops with an error once the
+# worker process would exceed it. None disables the check.
+ANALYSIS_MEMORY_BUDGET_MB = None
+
+# Stream usage reports in chunks of this many rows instead of reading each file whole.
+# None reads each report in one pass.
+USAGE_INGEST_CHUNK_ROWS = None
+
+# Drop usage rows for users outside the uploaded target file while ingesting. This bounds
+# memory by the target population, but global averages then cover the target file only.
+USAGE_INGEST_TARGET_ONLY = False
+
+# Largest file accepted by /upload or the chunked upload endpoints, in bytes
+MAX_UPLOAD_BYTES = 2 * 1024 ** 3
+
+# Chunk size the browser uses for resumable uploads; files above this size are sent in chunks
+UPLOAD_CHUNK_BYTES = 8 * 1024 ** 2
+
+# Shared cache of parsed uploads keyed by content hash, so identical files uploaded in
+# different sessions are parsed once. Least-recently-used entries are evicted above the cap;
+# a cap of 0 or None disables the cache.
+DATASET_CACHE_FOLDER = 'dataset_cache'
+DATASET_CACHE_MAX_MB = 2048
+
+# Memoize complete analysis results in the dataset cache, keyed by the uploaded files'
+# content, the filters and the engine version, so identical re-runs return immediately
+RESULT_CACHE_ENABLED = True
+
+# Temp upload housekeeping: session folders are deleted once unused for TEMP_TTL_MINUTES,
+# each session may store at most TEMP_SESSION_QUOTA_MB, and least recently used sessions are
+# evicted while temp_uploads exceeds TEMP_GLOBAL_QUOTA_MB. Folders with running jobs are kept.
+TEMP_TTL_MINUTES = 240
+TEMP_SESSION_QUOTA_MB = 4096
+TEMP_GLOBAL_QUOTA_MB = 20480
+TEMP_JANITOR_INTERVAL_SECONDS = 300
+
+# How long finished analysis jobs (and their report payloads) stay available for
+# re-attaching clients and the /jobs API
+JOB_RESULT_RETENTION_MINUTES = 60
+
+# Admission control: analyses start only while their estimated peak memory fits this
+# budget (None = 75% of physical memory); the rest wait in a queue
+SCHEDULER_MEMORY_BUDGET_MB = None
+# Upper bound on analyses running at the same time, regardless of memory
+SCHEDULER_MAX_CONCURRENT_JOBS = 2
+
+# Run analyses in this many pre-forked worker processes, which import the analysis stack and
+# share the preloaded preset hierarchies copy-on-write; 0 runs them in the server process
+ANALYSIS_WORKERS = 0
+# Replace a worker after this many jobs, or once its resident memory exceeds this size in MB
+# after a job (None disables either limit)
+ANALYSIS_WORKER_MAX_JOBS = 20
+ANALYSIS_WORKER_MAX_RSS_MB = 2048
+
+# Final user metrics of finished jobs are kept in this SQLite file (for as long as the job is
+# retained) and served a page at a time by /jobs/<id>/leaderboard
+LEADERBOARD_DB = 'leaderboard.sqlite3'
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_MAX_PAGE_SIZE = 500
+
+# Run every analysis under cProfile (a single run can also opt in with the 'profile' flag of
+# start_analysis or cli.py --profile); profiles are downloadable from /jobs/<id>/profile.
+# A process profiles one analysis at a time, so with ANALYSIS_WORKERS = 0 a job started while
+# another is being profiled runs unprofiled, and a profile can include requests served while
+# the analysis yields; pool workers run one job each and give clean profiles
+PROFILE_ANALYSES = False
+
+# Logging: root level, per-module overrides (e.g. {'analysis_logic': 'DEBUG'} to see the
+# per-sheet and per-row Excel formatting details), and whether records are written by a
+# background thread (QueueHandler) instead of the calling thread
+LOG_LEVEL = 'INFO'
+LOG_MODULE_LEVELS = {}
+LOG_QUEUED = False
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+# Benchmark suite (benchmark.py): generated datasets, the JSON-lines history and the stored
+# baseline live under this folder; user counts benchmarked when --scales is not given
+BENCHMARK_FOLDER = 'benchmarks'
+BENCHMARK_SCALES = [250, 1000]
+# A stage regresses when it is this fraction slower (or uses this fraction more memory) than
+# the baseline, and by more than the absolute slack, so millisecond stages ignore timer noise
+BENCHMARK_TOLERANCE = 0.25
+BENCHMARK_MIN_SECONDS = 0.05
+BENCHMARK_MIN_MB = 1.0
+
+# Implementation used for each hot analysis step; 'reference' is the original code. Any other
+# engine must match the reference within golden.py's tolerances before it is switched on here
+ANALYSIS_ENGINES = {'user_metrics': 'reference', 'peer_groups': 'reference', 'manager_summary': 'reference'}
@@ -0,0 +1,160 @@
+"""
+Dataset Cache
+Shared on-disk cache of parsed usage/target data and derived frames, keyed by upload content hash
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import uuid
+from typing import Any, Iterable, Optional
+
+import pandas as pd
+
+import config
+from chunked_upload import file_sha256
+from metrics import CACHE_REQUESTS
+
+
+logger = logging.getLogger(__name__)
+
+# Bump when a change to parsing alters what a cached frame contains
+CACHE_FORMAT_VERSION = 1
+
+CACHE_SUFFIX = '.pkl'
+
+
+def dataset_key(kind: str, hashes: Iterable[str]) -> str:
+    """Cache key for a kind of dataset built from the given content hashes (order matters)"""
+    digest = hashlib.sha256('|'.join([kind, str(CACHE_FORMAT_VERSION), *hashes]).encode('utf-8')).hexdigest()
+    return f"{kind}-{digest[:40]}"
+
+
+def usage_report_key(content_hash: str) -> str:
+    return dataset_key('usage', [content_hash])
+
+
+def target_key(content_hash: str) -> str:
+    return dataset_key('target', [content_hash])
+
+
+def combined_usage_key(content_hashes: Iterable[str]) -> str:
+    """Key for the combined, lower-cased usage frame built from several reports"""
+    return dataset_key('usage-combined', content_hashes)
+
+
+class DatasetCache:
+    """
+    Pickled frames in one folder, evicted least-recently-used once the folder exceeds max_bytes
+
+    Reads touch the entry's mtime, so mtime order is recency order. Writes go to a temporary
+    file first and are renamed into place, so concurrent readers never see a partial entry.
+    """
+
+    def __init__(self, folder: Optional[str], max_bytes: int):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._evict_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.folder) and self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, key + CACHE_SUFFIX)
+
+    def contains(self, key: str) -> bool:
+        return self.enabled and os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        kind = key.rsplit('-', 1)[0]
+        try:
+            value = pd.read_pickle(path)
+            os.utime(path)
+        except FileNotFoundError:
+            CACHE_REQUESTS.inc(kind=kind, result='miss')
+            return None
+        except Exception as e:
+            logger.warning("Discarding unreadable cache entry %s: %s", path, e)
+            self._remove(path)
+            CACHE_REQUESTS.inc(kind=kind, result='miss')
+            return None
+        CACHE_REQUESTS.inc(kind=kind, result='hit')
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            pd.to_pickle(value, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not write cache entry %s: %s", path, e)
+            self._remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove least-recently-used entries until the cache fits in max_bytes"""
+        with self._evict_lock:
+            entries = []
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith(CACHE_SUFFIX):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    def size_bytes(self) -> int:
+        if not self.enabled or not os.path.isdir(self.folder):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.name.endswith(CACHE_SUFFIX))
+
+    def clear(self) -> None:
+        if self.folder and os.path.isdir(self.folder):
+            for entry in os.scandir(self.folder):
+                self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_shared_cache = None
+
+
+def get_dataset_cache() -> DatasetCache:
+    """Process-wide cache configured from config.DATASET_CACHE_FOLDER / DATASET_CACHE_MAX_MB"""
+    global _shared_cache
+    if _shared_cache is None:
+        max_mb = config.DATASET_CACHE_MAX_MB or 0
+        _shared_cache = DatasetCache(config.DATASET_CACHE_FOLDER, int(max_mb * 1024 ** 2))
+    return _shared_cache
+
+
+def content_hash(path: str, known_hashes: Optional[dict] = None) -> str:
+    """SHA-256 of a file, reusing the hash recorded at upload time when there is one"""
+    if known_hashes and path in known_hashes:
+        return known_hashes[path]
+    digest = file_sha256(path)
+    if known_hashes is not None:
+        known_hashes[path] = digest
+    return digest
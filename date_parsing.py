@@ -0,0 +1,120 @@
+"""
+Date Parsing
+Detects the exact date format of usage report columns so they can be parsed with a fixed format
+instead of pandas' slow mixed-format inference
+"""
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import pandas as pd
+
+
+# Formats tried in order; month-first precedes day-first to match pandas' default interpretation
+CANDIDATE_DATE_FORMATS = [
+    '%Y-%m-%d',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%d/%m/%Y',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y %H:%M:%S',
+    '%Y/%m/%d',
+    '%d.%m.%Y',
+]
+
+# Recorded for columns whose values don't share a single format
+MIXED_FORMAT = 'mixed'
+
+SNIFF_SAMPLE_SIZE = 200
+
+# Detected formats per report layout: {layout: {column: format}}
+_layout_formats: Dict[Tuple[str, ...], Dict[str, Optional[str]]] = {}
+
+
+def report_layout(columns: Iterable[str]) -> Tuple[str, ...]:
+    """Key identifying a report layout by its column names"""
+    return tuple(columns)
+
+
+def sniff_date_format(values: pd.Series, sample_size: int = SNIFF_SAMPLE_SIZE) -> Optional[str]:
+    """Return the first candidate format that parses every sampled value, or None"""
+    sample = values.dropna()
+    if sample.empty:
+        return None
+    sample = pd.Series(sample.astype(str).unique()[:sample_size])
+    for fmt in CANDIDATE_DATE_FORMATS:
+        if pd.to_datetime(sample, format=fmt, errors='coerce').notna().all():
+            return fmt
+    return None
+
+
+def _parse_with_format(values: pd.Series, fmt: Optional[str]) -> Optional[pd.Series]:
+    """Parse with a fixed format; None if any non-null value does not match it"""
+    if fmt is None or fmt == MIXED_FORMAT:
+        return None
+    parsed = pd.to_datetime(values, format=fmt, errors='coerce')
+    if parsed.isna().sum() > values.isna().sum():
+        return None
+    return parsed
+
+
+def parse_date_column(values: pd.Series, known_format: Optional[str] = None) -> Tuple[pd.Series, Optional[str]]:
+    """
+    Parse a column of date strings
+
+    Args:
+        values: Raw column values
+        known_format: Format previously detected for this column, if any
+
+    Returns:
+        Tuple of (parsed datetime Series, format used)
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values, known_format
+
+    if known_format == MIXED_FORMAT:
+        # Known not to share one format; sniffing again would only fail again
+        return pd.to_datetime(values, errors='coerce', format='mixed'), MIXED_FORMAT
+
+    parsed = _parse_with_format(values, known_format)
+    if parsed is not None:
+        return parsed, known_format
+
+    if values.notna().any():
+        # No format known yet, or the remembered one no longer fits - sniff this column again
+        fmt = sniff_date_format(values)
+        parsed = _parse_with_format(values, fmt)
+        if parsed is not None:
+            return parsed, fmt
+        return pd.to_datetime(values, errors='coerce', format='mixed'), MIXED_FORMAT
+
+    # Nothing to detect from an empty column; keep whatever was known before
+    return pd.to_datetime(values, errors='coerce', format='mixed'), known_format
+
+
+def parse_date_columns(df: pd.DataFrame, date_cols: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Parse the date columns of one usage report in place
+
+    Formats are detected from a sample of each column and remembered per report layout, so
+    later reports with the same columns skip detection. Columns whose values don't share a
+    single format fall back to mixed-format parsing, and keep using it for that layout.
+    """
+    if date_cols is None:
+        date_cols = [col for col in df.columns if 'date' in col.lower()]
+    formats = _layout_formats.setdefault(report_layout(df.columns), {})
+    for col in date_cols:
+        df[col], formats[col] = parse_date_column(df[col], formats.get(col))
+    return df
+
+
+def detected_formats(columns: Iterable[str]) -> Dict[str, Optional[str]]:
+    """Formats remembered for a report layout (empty if the layout hasn't been seen)"""
+    return dict(_layout_formats.get(report_layout(columns), {}))
+
+
+def clear_format_cache() -> None:
+    """Forget all remembered formats"""
+    _layout_formats.clear()
@@ -0,0 +1,104 @@
+"""
+Deep Dive
+Per-user summary text and activity chart data, built from a finished analysis's deep-dive data
+"""
+
+from typing import Dict, Optional
+
+import pandas as pd
+
+
+class DeepDiveError(Exception):
+    """The user was found but their chart data could not be prepared"""
+
+
+def _recent_activity(usage_df: pd.DataFrame, tool_cols) -> pd.Series:
+    """Tools used within 30 days of each report, by report date (mean over the rows of that date)"""
+    usage_df['recent_activity'] = 0
+    for idx, row in usage_df.iterrows():
+        recent_tools = 0
+        report_date = row['Report Refresh Date']
+        for col in tool_cols:
+            if pd.notna(row[col]):
+                last_activity = row[col]
+                # Consider tool "recently used" if within 30 days of report
+                days_since_use = (report_date - last_activity).days
+                if days_since_use <= 30:  # Tool used in last 30 days
+                    recent_tools += 1
+        usage_df.at[idx, 'recent_activity'] = recent_tools
+    # Group by report date - use mean to show average activity level
+    return usage_df.groupby('Report Refresh Date')['recent_activity'].mean().sort_index()
+
+
+def summary_text(user_email: str, metrics: pd.Series, user_data: pd.DataFrame, tool_cols) -> str:
+    text_result = f"--- Summary for {user_email} ---\nClassification: {metrics['Classification']}\nJustification: {metrics['Justification']}\n\nGlobal Rank: {int(metrics['Global Rank'])}\nAdjusted Consistency: {metrics['Adjusted Consistency (%)']:.1f}%\nOriginal Consistency: {metrics['Usage Consistency (%)']:.1f}%\nAdoption Date: {metrics['Adoption Date'].strftime('%Y-%m-%d') if pd.notna(metrics.get('Adoption Date')) else 'N/A'}\nFirst Seen: {metrics['First Appearance'].strftime('%Y-%m-%d') if pd.notna(metrics['First Appearance']) else 'N/A'}\nLast Seen: {metrics['Overall Recency'].strftime('%Y-%m-%d') if pd.notna(metrics['Overall Recency']) else 'N/A'}\nDays Since License: {int(metrics['Days Since License']) if pd.notna(metrics.get('Days Since License')) else 'N/A'}\nUsage Complexity (Total Tools): {int(metrics['Usage Complexity'])}\nAvg Tools per Report: {metrics['Avg Tools / Report']:.2f}\nAdoption Velocity: {metrics['Adoption Velocity']:.4f} tools/day\nEngagement Score: {metrics['Engagement Score']:.2f}\nUsage Trend: {metrics['Usage Trend']}\n\n"
+    if metrics['Usage Complexity'] > 0:
+        text_result += f"--- Detailed Records ---\n"
+        for _, row in user_data.sort_values(by="Report Refresh Date", ascending=False).iterrows():
+            text_result += f"\nReport Date: {row['Report Refresh Date'].strftime('%Y-%m-%d')}\n"
+            tools_used_in_report = [f"  - {col.replace('Last activity date of ', '').replace(' (UTC)', '')}: {row[col].strftime('%Y-%m-%d')}" for col in tool_cols if pd.notna(row[col])]
+            if tools_used_in_report:
+                text_result += "\n".join(tools_used_in_report) + "\n"
+            else:
+                text_result += "  - No specific tool activity recorded for this date.\n"
+    return text_result
+
+
+def chart_data(user_data: pd.DataFrame, full_usage_data: pd.DataFrame, utilized_metrics_df: pd.DataFrame,
+               filters_applied: Dict, tool_cols) -> Dict:
+    """User, filtered group and global recent-activity series over the report dates"""
+    chart = {
+        'categories': [],
+        'series': [
+            {'name': 'User', 'data': []},
+            {'name': 'Sample Group', 'data': []},
+            {'name': 'Global', 'data': []}
+        ]
+    }
+    # Calculate actual recent activity for user
+    graph_data_user = _recent_activity(user_data, tool_cols)
+
+    # Filtered group data - apply same logic
+    if not filters_applied or all(not v for v in filters_applied.values()):
+        filtered_group_usage_data = full_usage_data.copy()
+    else:
+        filtered_user_emails = utilized_metrics_df['Email'].str.lower().tolist()
+        filtered_group_usage_data = full_usage_data[full_usage_data['User Principal Name'].isin(filtered_user_emails)].copy()
+    graph_data_group = _recent_activity(filtered_group_usage_data, tool_cols)
+
+    # Global data - apply same logic
+    graph_data_global = _recent_activity(full_usage_data.copy(), tool_cols)
+
+    # Combine all date indexes
+    all_dates = sorted(list(set(graph_data_user.index) | set(graph_data_group.index) | set(graph_data_global.index)))
+    chart['categories'] = [d.strftime('%Y-%m-%d') for d in all_dates]
+
+    # Reindex and fill data - use float for accuracy, not int
+    chart['series'][0]['data'] = graph_data_user.reindex(all_dates, fill_value=0).round(2).tolist()
+    chart['series'][1]['data'] = graph_data_group.reindex(all_dates, fill_value=0).round(2).tolist()
+    chart['series'][2]['data'] = graph_data_global.reindex(all_dates, fill_value=0).round(2).tolist()
+    return chart
+
+
+def build_deep_dive(deep_dive_data: Dict, user_email: str) -> Optional[Dict]:
+    """
+    {'text', 'chart_data'} for one user, or None when the user has no records
+
+    Raises DeepDiveError when the chart data cannot be prepared.
+    """
+    full_usage_data = deep_dive_data['full_usage_data']
+    utilized_metrics_df = deep_dive_data['utilized_metrics_df']
+    filters_applied = deep_dive_data.get('filters_applied', {})  # Retrieve stored filters
+
+    user_data = full_usage_data[full_usage_data['User Principal Name'] == user_email].copy()
+    user_metrics = utilized_metrics_df[utilized_metrics_df['Email'] == user_email]
+    if user_data.empty or user_metrics.empty:
+        return None
+
+    tool_cols = [col for col in full_usage_data.columns if 'Last activity date of' in col]
+    text_result = summary_text(user_email, user_metrics.iloc[0], user_data, tool_cols)
+    try:
+        chart = chart_data(user_data, full_usage_data, utilized_metrics_df, filters_applied, tool_cols)
+    except Exception as e:
+        raise DeepDiveError(f"Error preparing chart data: {e}") from e
+    return {'text': text_result, 'chart_data': chart}
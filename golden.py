@@ -0,0 +1,225 @@
+"""
+Golden Outputs
+Runs the reference engines and a candidate engine configuration on the same inputs and diffs
+every column of the user metrics, the manager summary and every sheet of the Excel report
+
+Examples:
+    python golden.py --engine user_metrics=vectorized --users 300 2000
+    python golden.py --usage reports/ --target manager_report.csv     # config.ANALYSIS_ENGINES
+"""
+
+import argparse
+import io
+import math
+import numbers
+import os
+import sys
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+import config
+from analysis_logic import CopilotAnalyzer
+from dataset_cache import DatasetCache
+from logging_config import configure_logging
+from progress import NullProgressSink
+from synthetic_data import generate_dataset
+
+
+REFERENCE_ENGINES = {step: 'reference' for step in config.ANALYSIS_ENGINES}
+NO_FILTERS = {'companies': [], 'departments': [], 'locations': [], 'managers': []}
+# Floating-point differences allowed between engines, e.g. from a different summation order
+DEFAULT_RTOL = 1e-9
+DEFAULT_ATOL = 1e-9
+MAX_EXAMPLES = 3
+
+
+def run_engines(usage_files: Dict[str, str], target: Optional[str], filters: Dict, engines: Dict) -> Dict:
+    """One uncached analysis with the given engines; returns the outputs that are compared"""
+    analyzer = CopilotAnalyzer(progress=NullProgressSink(), engines=engines)
+    analyzer.dataset_cache = DatasetCache(None, 0)
+    results = analyzer.execute_analysis(usage_files, target, filters)
+    if 'error' in results:
+        return {'error': results['error']}
+    excel_bytes = results['reports']['excel_bytes']
+    return {
+        'dashboard': results['dashboard'],
+        'utilized_metrics_df': analyzer.utilized_metrics_df,
+        'manager_summary_df': getattr(analyzer, 'manager_summary_df', None),
+        'excel_sheets': pd.read_excel(io.BytesIO(excel_bytes), sheet_name=None),
+    }
+
+
+def values_equal(expected, actual, rtol: float = DEFAULT_RTOL, atol: float = DEFAULT_ATOL) -> bool:
+    """Equality with a float tolerance, recursing into dicts and lists (e.g. 'Trend Details')"""
+    expected_missing = pd.api.types.is_scalar(expected) and pd.isna(expected)
+    actual_missing = pd.api.types.is_scalar(actual) and pd.isna(actual)
+    if expected_missing or actual_missing:
+        return expected_missing and actual_missing
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        return expected.keys() == actual.keys() and all(values_equal(expected[k], actual[k], rtol, atol) for k in expected)
+    if isinstance(expected, (list, tuple)) and isinstance(actual, (list, tuple)):
+        return len(expected) == len(actual) and all(values_equal(e, a, rtol, atol) for e, a in zip(expected, actual))
+    if (isinstance(expected, numbers.Number) and isinstance(actual, numbers.Number)
+            and not isinstance(expected, (bool, np.bool_)) and not isinstance(actual, (bool, np.bool_))):
+        return math.isclose(float(expected), float(actual), rel_tol=rtol, abs_tol=atol)
+    try:
+        return bool(expected == actual)
+    except (TypeError, ValueError):
+        return False
+
+
+def column_mismatches(expected: pd.Series, actual: pd.Series, rtol: float = DEFAULT_RTOL,
+                      atol: float = DEFAULT_ATOL) -> np.ndarray:
+    """Boolean mask of the rows where two aligned columns differ"""
+    numeric = (pd.api.types.is_numeric_dtype(expected) and pd.api.types.is_numeric_dtype(actual)
+               and not pd.api.types.is_bool_dtype(expected) and not pd.api.types.is_bool_dtype(actual))
+    if numeric:
+        e, a = expected.to_numpy(dtype=float), actual.to_numpy(dtype=float)
+        return ~np.isclose(e, a, rtol=rtol, atol=atol, equal_nan=True)
+    if pd.api.types.is_datetime64_any_dtype(expected) and pd.api.types.is_datetime64_any_dtype(actual):
+        e, a = expected.reset_index(drop=True), actual.reset_index(drop=True)
+        return ~((e == a) | (e.isna() & a.isna())).to_numpy()
+    return np.array([not values_equal(e, a, rtol, atol) for e, a in zip(expected, actual)], dtype=bool)
+
+
+def _show(value) -> str:
+    return repr(value.item() if isinstance(value, np.generic) else value)
+
+
+def diff_frames(expected: Optional[pd.DataFrame], actual: Optional[pd.DataFrame], name: str,
+                rtol: float = DEFAULT_RTOL, atol: float = DEFAULT_ATOL) -> List[str]:
+    """Differences between two frames, compared row by row in order, as messages"""
+    expected_empty = expected is None or expected.empty
+    actual_empty = actual is None or actual.empty
+    if expected_empty or actual_empty:
+        if expected_empty != actual_empty:
+            return [f"{name}: expected {'no rows' if expected_empty else f'{len(expected)} rows'}, "
+                    f"got {'no rows' if actual_empty else f'{len(actual)} rows'}"]
+        return []
+
+    diffs = []
+    missing = [col for col in expected.columns if col not in actual.columns]
+    extra = [col for col in actual.columns if col not in expected.columns]
+    if missing:
+        diffs.append(f"{name}: missing columns {missing}")
+    if extra:
+        diffs.append(f"{name}: unexpected columns {extra}")
+    if len(expected) != len(actual):
+        diffs.append(f"{name}: expected {len(expected)} rows, got {len(actual)}")
+        return diffs
+
+    row_ids = expected['Email'].tolist() if 'Email' in expected.columns else list(range(len(expected)))
+    for col in expected.columns:
+        if col in missing:
+            continue
+        mask = column_mismatches(expected[col], actual[col], rtol, atol)
+        if not mask.any():
+            continue
+        positions = np.flatnonzero(mask)
+        examples = ', '.join(f"{row_ids[i]}: {_show(expected[col].iloc[i])} != {_show(actual[col].iloc[i])}"
+                             for i in positions[:MAX_EXAMPLES])
+        diffs.append(f"{name}[{col!r}]: {len(positions)} of {len(expected)} rows differ ({examples})")
+    return diffs
+
+
+def compare_runs(reference: Dict, candidate: Dict, rtol: float = DEFAULT_RTOL, atol: float = DEFAULT_ATOL) -> List[str]:
+    """Every difference between a reference run and a candidate run of run_engines"""
+    if 'error' in reference or 'error' in candidate:
+        if reference.get('error') != candidate.get('error'):
+            return [f"error: expected {reference.get('error')!r}, got {candidate.get('error')!r}"]
+        return []
+    diffs = []
+    if reference['dashboard'] != candidate['dashboard']:
+        diffs.append(f"dashboard: expected {reference['dashboard']}, got {candidate['dashboard']}")
+    diffs += diff_frames(reference['utilized_metrics_df'], candidate['utilized_metrics_df'], 'utilized_metrics_df', rtol, atol)
+    diffs += diff_frames(reference['manager_summary_df'], candidate['manager_summary_df'], 'manager_summary_df', rtol, atol)
+    reference_sheets, candidate_sheets = reference['excel_sheets'], candidate['excel_sheets']
+    if list(reference_sheets) != list(candidate_sheets):
+        diffs.append(f"excel: expected sheets {list(reference_sheets)}, got {list(candidate_sheets)}")
+    for sheet in reference_sheets:
+        if sheet in candidate_sheets:
+            diffs += diff_frames(reference_sheets[sheet], candidate_sheets[sheet], f"excel[{sheet!r}]", rtol, atol)
+    return diffs
+
+
+def check_engines(usage_files: Dict[str, str], target: Optional[str], engines: Dict, filters: Optional[Dict] = None,
+                  rtol: float = DEFAULT_RTOL, atol: float = DEFAULT_ATOL) -> List[str]:
+    """Run the reference engines and `engines` on the same inputs and diff the outputs"""
+    filters = filters or NO_FILTERS
+    reference = run_engines(usage_files, target, filters, REFERENCE_ENGINES)
+    candidate = run_engines(usage_files, target, filters, dict(REFERENCE_ENGINES, **engines))
+    return compare_runs(reference, candidate, rtol, atol)
+
+
+def check_generated(users: int, engines: Dict, seed: int = 0, weeks: int = 26,
+                    rtol: float = DEFAULT_RTOL, atol: float = DEFAULT_ATOL) -> Dict[str, List[str]]:
+    """check_engines on a generated dataset, unfiltered and filtered to one department"""
+    with tempfile.TemporaryDirectory() as out_dir:
+        dataset = generate_dataset(out_dir, users=users, weeks=weeks, seed=seed)
+        usage_files = {os.path.basename(path): path for path in dataset['usage']}
+        return {
+            'all users': check_engines(usage_files, dataset['target'], engines, NO_FILTERS, rtol, atol),
+            'Department 02': check_engines(usage_files, dataset['target'], engines,
+                                           dict(NO_FILTERS, departments=['Department 02']), rtol, atol),
+        }
+
+
+def parse_engines(values: List[str]) -> Dict[str, str]:
+    engines = {}
+    for value in values or []:
+        step, sep, name = value.partition('=')
+        if not sep or step not in REFERENCE_ENGINES:
+            raise ValueError(f"--engine expects step=name with step one of {', '.join(REFERENCE_ENGINES)}")
+        engines[step] = name
+    return engines
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Check that analysis engines match the reference implementation.")
+    parser.add_argument('--engine', action='append', metavar='STEP=NAME',
+                        help="Candidate engine for a step (repeatable); default: config.ANALYSIS_ENGINES")
+    parser.add_argument('--users', type=int, nargs='+', default=[300], help="Generated dataset sizes")
+    parser.add_argument('--weeks', type=int, default=26, help="Weekly reports per generated dataset")
+    parser.add_argument('--seed', type=int, default=0, help="Generated dataset seed")
+    parser.add_argument('--usage', nargs='+', help="Real usage report files or folders instead of generated data")
+    parser.add_argument('--target', help="Target (manager) file for --usage")
+    parser.add_argument('--rtol', type=float, default=DEFAULT_RTOL, help="Relative tolerance for numbers")
+    parser.add_argument('--atol', type=float, default=DEFAULT_ATOL, help="Absolute tolerance for numbers")
+    parser.add_argument('--log-level', default='ERROR', help="Log level of the analyses")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    configure_logging(level=args.log_level, fmt='%(name)s: %(message)s')
+    engines = parse_engines(args.engine) if args.engine else dict(config.ANALYSIS_ENGINES)
+    label = ', '.join(f"{step}={name}" for step, name in sorted(engines.items()))
+
+    checks = {}
+    if args.usage:
+        from cli import collect_usage_files
+        with tempfile.TemporaryDirectory() as extract_dir:
+            usage_files = collect_usage_files(args.usage, extract_dir, exclude=[args.target])
+            checks['given inputs'] = check_engines(usage_files, args.target, engines, rtol=args.rtol, atol=args.atol)
+    else:
+        for users in args.users:
+            for name, diffs in check_generated(users, engines, args.seed, args.weeks, args.rtol, args.atol).items():
+                checks[f"{users} users, {name}"] = diffs
+
+    failed = False
+    for name, diffs in checks.items():
+        if diffs:
+            failed = True
+            print(f"{name}: {len(diffs)} difference(s) from the reference ({label})")
+            for message in diffs:
+                print(f"  {message}")
+        else:
+            print(f"{name}: identical to the reference within rtol={args.rtol}, atol={args.atol} ({label})")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Instrumentation
+Per-stage wall time, CPU time, rows processed and memory for an analysis run
+"""
+
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from memory_guard import current_rss_bytes
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between resident memory samples taken while any stage is running
+RSS_SAMPLE_INTERVAL = 0.05
+
+
+def _to_mb(num_bytes: int) -> float:
+    return round(num_bytes / (1024 * 1024), 1)
+
+
+class Stage:
+    """One timed stage; call stop() (or use StageTimings.stage) to record it"""
+
+    def __init__(self, timings: 'StageTimings', name: str):
+        self.timings = timings
+        self.name = name
+        self.rows: Optional[int] = None
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._rss = current_rss_bytes()
+        self._peak = self._rss
+        self.record: Optional[Dict] = None
+        timings._opened(self)
+
+    def stop(self, rows: Optional[int] = None, error: bool = False) -> Dict:
+        if self.record is not None:
+            return self.record
+        if rows is not None:
+            self.rows = rows
+        rss = current_rss_bytes()
+        self.timings._closed(self)
+        self.record = {
+            'stage': self.name,
+            'wall_seconds': round(time.perf_counter() - self._wall, 4),
+            'cpu_seconds': round(time.process_time() - self._cpu, 4),
+            'rows': self.rows,
+            'rss_mb': _to_mb(rss),
+            'rss_delta_mb': _to_mb(rss - self._rss),
+            # Highest resident memory seen while the stage ran (sampled, so brief spikes can be missed)
+            'peak_rss_mb': _to_mb(max(self._peak, rss)),
+        }
+        if error:
+            self.record['error'] = True
+        self.timings.stages.append(self.record)
+        return self.record
+
+
+class StageTimings:
+    """Collects Stage records in the order the stages finish, sampling memory while any is running"""
+
+    def __init__(self):
+        self.stages: List[Dict] = []
+        self._running: List[Stage] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+
+    def _opened(self, stage: Stage) -> None:
+        with self._lock:
+            self._running.append(stage)
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='stage-rss-sampler', daemon=True)
+                self._sampler.start()
+
+    def _closed(self, stage: Stage) -> None:
+        with self._lock:
+            if stage in self._running:
+                self._running.remove(stage)
+
+    def _sample(self) -> None:
+        """Raise each running stage's peak to the current RSS until no stage is left running"""
+        while True:
+            time.sleep(RSS_SAMPLE_INTERVAL)
+            rss = current_rss_bytes()
+            with self._lock:
+                if not self._running:
+                    self._sampler = None
+                    return
+                for stage in self._running:
+                    stage._peak = max(stage._peak, rss)
+
+    def start(self, name: str) -> Stage:
+        return Stage(self, name)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block; set `.rows` on the yielded Stage to record rows processed"""
+        stage = self.start(name)
+        try:
+            yield stage
+        except BaseException:
+            stage.stop(error=True)
+            raise
+        stage.stop()
+
+    def to_list(self) -> List[Dict]:
+        return list(self.stages)
+
+    def log(self, log: Optional[logging.Logger] = None, **context) -> None:
+        """Emit the breakdown as one structured JSON log line"""
+        log = log or logger
+        if not log.isEnabledFor(logging.INFO):
+            return
+        log.info("%s", json.dumps({'event': 'analysis_timings', **context, 'stages': self.stages}, default=str))
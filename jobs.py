@@ -0,0 +1,156 @@
+"""
+Jobs
+Registry of analysis jobs with IDs, states, cooperative cancellation and retained results
+"""
+
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from progress import ProgressSink
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(BaseException):
+    """
+    Raised inside a running analysis once cancellation was requested
+
+    Derives from BaseException so the pipeline's per-stage `except Exception` fallbacks
+    do not swallow it.
+    """
+
+
+class Job:
+    """One analysis request and, once finished, its result or error"""
+
+    def __init__(self, owner: Optional[str], description: str = ''):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.description = description
+        self.state = QUEUED
+        self.message = 'Queued'
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.artifacts: Dict[str, Dict[str, str]] = {}  # e.g. {'profile': {'prof': path, 'collapsed': path}}
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def check_cancelled(self) -> None:
+        """Cancellation point: raises JobCancelled if cancel() was called"""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+    def to_dict(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'message': self.message,
+            'description': self.description,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+            'has_result': self.result is not None,
+            'artifacts': sorted(self.artifacts),
+        }
+
+
+class JobProgressSink(ProgressSink):
+    """Records the latest status message on the job, so polling clients see progress"""
+
+    def __init__(self, job: Job):
+        self.job = job
+
+    def publish(self, message: str) -> None:
+        self.job.message = message
+
+
+class JobRegistry:
+    """In-process job table; finished jobs and their results are dropped after retention_seconds"""
+
+    def __init__(self, retention_seconds: float):
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def create(self, owner: Optional[str], description: str = '') -> Job:
+        self.expire()
+        job = Job(owner, description)
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """The job, or None if unknown, expired or (when owner is given) owned by someone else"""
+        self.expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def for_owner(self, owner: str) -> List[Job]:
+        self.expire()
+        with self._lock:
+            return sorted((job for job in self._jobs.values() if job.owner == owner), key=lambda job: job.created_at)
+
+    def active_jobs(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def start(self, job: Job) -> None:
+        job.check_cancelled()
+        job.state = RUNNING
+        job.started_at = time.time()
+        job.message = 'Starting analysis...'
+
+    def finish(self, job: Job, result: Any) -> None:
+        job.result = result
+        job.message = 'Done'
+        self._close(job, DONE)
+
+    def fail(self, job: Job, error: str) -> None:
+        job.error = error
+        job.message = error
+        self._close(job, FAILED)
+
+    def mark_cancelled(self, job: Job) -> None:
+        job.message = 'Cancelled'
+        self._close(job, CANCELLED)
+
+    def cancel(self, job: Job) -> bool:
+        """Request cancellation; queued jobs stop before starting, running ones at the next stage"""
+        if job.finished:
+            return False
+        job.cancel_event.set()
+        job.message = 'Cancelling...'
+        return True
+
+    def _close(self, job: Job, state: str) -> None:
+        job.state = state
+        job.finished_at = time.time()
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Forget finished jobs older than the retention period; returns how many were dropped"""
+        now = time.time() if now is None else now
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and now - job.finished_at > self.retention_seconds]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
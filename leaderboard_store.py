@@ -0,0 +1,208 @@
+"""
+Leaderboard Store
+The final per-user metrics of each finished job in an indexed SQLite file, so the leaderboard can
+be served a page at a time: sorted by any metric, filtered and searched without loading the job
+"""
+
+import math
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from presets import split_manager_line
+
+
+# API field -> column of the analysis's utilized_metrics_df (None: derived while saving)
+FIELDS = {
+    'email': 'Email',
+    'global_rank': 'Global Rank',
+    'classification': 'Classification',
+    'engagement_score': 'Engagement Score',
+    'adjusted_consistency': 'Adjusted Consistency (%)',
+    'usage_consistency': 'Usage Consistency (%)',
+    'usage_complexity': 'Usage Complexity',
+    'avg_tools_per_report': 'Avg Tools / Report',
+    'adoption_velocity': 'Adoption Velocity',
+    'tool_expansion_rate': 'Tool Expansion Rate',
+    'days_since_license': 'Days Since License',
+    'appearances': 'Appearances',
+    'last_active': 'Overall Recency',
+    'usage_trend': 'Usage Trend',
+    'rui_score': 'rui_score',
+    'license_risk': 'license_risk',
+    'peer_rank': 'peer_rank',
+    'peer_rank_display': 'peer_rank_display',
+    'peer_percentile': 'peer_percentile',
+    'peer_group_type': 'peer_group_type',
+    'manager': None,
+    'department': 'Department',
+}
+TEXT_FIELDS = {'email', 'classification', 'last_active', 'usage_trend', 'license_risk', 'peer_rank_display',
+               'peer_group_type', 'manager', 'department'}
+INTEGER_FIELDS = {'global_rank', 'usage_complexity', 'days_since_license', 'appearances', 'peer_rank'}
+# Fields with their own (job, field) index, so sorting a page of a large job reads only that page
+INDEXED_FIELDS = ('global_rank', 'engagement_score', 'adjusted_consistency', 'usage_complexity',
+                  'rui_score', 'classification', 'license_risk', 'email')
+DEFAULT_SORT = 'global_rank'
+
+
+class LeaderboardQueryError(ValueError):
+    """A leaderboard request with an unknown sort field, order or page"""
+
+
+def _column_values(series: pd.Series) -> List:
+    """A metrics column as SQLite values: NULL for missing values, ISO text for dates"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime('%Y-%m-%d').where(series.notna(), None).tolist()
+    values = series.astype(object).where(series.notna(), None).tolist()
+    if series.dtype == object:
+        values = [v if v is None or isinstance(v, (int, float, str)) else str(v) for v in values]
+    return values
+
+
+class LeaderboardStore:
+    """
+    SQLite file shared by the server and its pool workers; every call opens its own connection,
+    so a store can be used from any thread or forked process
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            if not self._ready:
+                self._create(conn)
+            with conn:  # one transaction per call
+                yield conn
+
+    def _create(self, conn) -> None:
+        conn.execute("PRAGMA journal_mode=WAL")  # pages are read while other jobs are written
+        # Text compares and sorts case-insensitively, so filters can still use the indexes
+        columns = ', '.join(f"{field} {'TEXT COLLATE NOCASE' if field in TEXT_FIELDS else 'INTEGER' if field in INTEGER_FIELDS else 'REAL'}"
+                            for field in FIELDS)
+        conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS leaderboard_jobs (job_id TEXT PRIMARY KEY, saved_at REAL, users INTEGER,
+                                                         first_row INTEGER, last_row INTEGER);
+            CREATE TABLE IF NOT EXISTS leaderboard (job_id TEXT NOT NULL, email_lc TEXT, {columns});
+            CREATE TABLE IF NOT EXISTS leaderboard_managers (job_id TEXT NOT NULL, manager_lc TEXT NOT NULL,
+                                                             email_lc TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS leaderboard_managers_lookup ON leaderboard_managers (job_id, manager_lc);
+            CREATE INDEX IF NOT EXISTS leaderboard_email_lc ON leaderboard (job_id, email_lc);
+        """)
+        for field in INDEXED_FIELDS:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS leaderboard_{field} ON leaderboard (job_id, {field})")
+        self._ready = True
+
+    def save(self, job_id: str, metrics_df: pd.DataFrame) -> int:
+        """Store (or replace) a job's final user metrics; returns the number of users stored"""
+        users = len(metrics_df)
+        columns = {field: _column_values(metrics_df[column]) if column in metrics_df.columns else [None] * users
+                   for field, column in FIELDS.items() if column is not None}
+        chains = (metrics_df['ManagerLine'].map(split_manager_line).tolist() if 'ManagerLine' in metrics_df.columns
+                  else [[]] * users)
+        columns['manager'] = [chain[0] if chain else None for chain in chains]
+        emails_lc = [email.lower() if isinstance(email, str) else '' for email in columns['email']]
+
+        fields = list(FIELDS)
+        with self._connect() as conn:
+            self._delete(conn, job_id)
+            conn.executemany(
+                f"INSERT INTO leaderboard (job_id, email_lc, {', '.join(fields)}) VALUES ({', '.join('?' * (len(fields) + 2))})",
+                ([job_id, emails_lc[i]] + [columns[field][i] for field in fields] for i in range(users)))
+            # Every manager in a user's chain, so a manager filter finds their whole organisation
+            conn.executemany("INSERT INTO leaderboard_managers (job_id, manager_lc, email_lc) VALUES (?, ?, ?)",
+                             ((job_id, manager, emails_lc[i]) for i, chain in enumerate(chains)
+                              for manager in {name.lower() for name in chain}))
+            # A job's rows are inserted in one transaction, so their row ids are contiguous
+            first_row, last_row = conn.execute("SELECT MIN(rowid), MAX(rowid) FROM leaderboard WHERE job_id = ?",
+                                               (job_id,)).fetchone()
+            conn.execute("INSERT INTO leaderboard_jobs (job_id, saved_at, users, first_row, last_row) VALUES (?, ?, ?, ?, ?)",
+                         (job_id, time.time(), users, first_row, last_row))
+        return users
+
+    @staticmethod
+    def _delete(conn, job_id: str) -> None:
+        for table in ('leaderboard', 'leaderboard_managers', 'leaderboard_jobs'):
+            conn.execute(f"DELETE FROM {table} WHERE job_id = ?", (job_id,))
+
+    def delete(self, job_id: str) -> None:
+        with self._connect() as conn:
+            self._delete(conn, job_id)
+
+    def prune(self, max_age_seconds: float, now: Optional[float] = None) -> int:
+        """Drop jobs saved more than max_age_seconds ago; returns how many were dropped"""
+        cutoff = (time.time() if now is None else now) - max_age_seconds
+        with self._connect() as conn:
+            expired = [job_id for (job_id,) in conn.execute("SELECT job_id FROM leaderboard_jobs WHERE saved_at < ?", (cutoff,))]
+            for job_id in expired:
+                self._delete(conn, job_id)
+        return len(expired)
+
+    def page(self, job_id: str, sort: str = DEFAULT_SORT, order: str = 'asc', page: int = 1, per_page: int = 50,
+             classifications: Iterable[str] = (), license_risks: Iterable[str] = (), managers: Iterable[str] = (),
+             search: Optional[str] = None) -> Optional[Dict]:
+        """
+        One page of a job's leaderboard (None if the job is not stored). Filters of the same kind
+        are alternatives (OR); managers match anywhere in a user's management chain; search matches
+        part of the email.
+        """
+        if sort not in FIELDS:
+            raise LeaderboardQueryError(f"Unknown sort field '{sort}'. Available: {', '.join(FIELDS)}")
+        if order not in ('asc', 'desc'):
+            raise LeaderboardQueryError("order must be 'asc' or 'desc'")
+        if page < 1 or per_page < 1:
+            raise LeaderboardQueryError("page and per_page must be positive")
+
+        with self._connect() as conn:
+            rows_range = conn.execute("SELECT first_row, last_row FROM leaderboard_jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if rows_range is None:
+                return None
+            if sort in INDEXED_FIELDS:
+                where, params = ["job_id = ?"], [job_id]  # the (job, sort field) index returns rows in order
+            else:
+                # Scan the job's rows in storage order; walking another index would visit them at random
+                where, params = ["rowid BETWEEN ? AND ?"], list(rows_range)
+            for field, values in (('classification', classifications), ('license_risk', license_risks)):
+                values = [value for value in values if value]
+                if values:
+                    where.append(f"{field} IN ({', '.join('?' * len(values))})")
+                    params += values
+            managers = [manager.strip().lower() for manager in managers if manager and manager.strip()]
+            if managers:
+                where.append(f"email_lc IN (SELECT email_lc FROM leaderboard_managers WHERE job_id = ? "
+                             f"AND manager_lc IN ({', '.join('?' * len(managers))}))")
+                params += [job_id] + managers
+            if search:
+                escaped = search.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                where.append("email_lc LIKE ? ESCAPE '\\'")
+                params.append(f"%{escaped}%")
+            condition = ' AND '.join(where)
+
+            total = conn.execute(f"SELECT COUNT(*) FROM leaderboard WHERE {condition}", params).fetchone()[0]
+            # Sorting just the row ids keeps unindexed sorts of large jobs fast; the page's rows
+            # are fetched afterwards
+            ordering = f"ORDER BY {sort} {order.upper()}, global_rank, email"
+            cursor = conn.execute(
+                f"SELECT {', '.join(FIELDS)} FROM leaderboard WHERE rowid IN "
+                f"(SELECT rowid FROM leaderboard WHERE {condition} {ordering} LIMIT ? OFFSET ?) {ordering}",
+                params + [per_page, (page - 1) * per_page])
+            rows = [dict(zip(FIELDS, values)) for values in cursor]
+        return {
+            'job_id': job_id,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'pages': max(1, math.ceil(total / per_page)),
+            'sort': sort,
+            'order': order,
+            'rows': rows,
+        }
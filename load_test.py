@@ -0,0 +1,381 @@
+"""
+Load Test
+Simulates concurrent analysts against a running server over HTTP and Socket.IO: upload the
+reports, start_analysis, wait for analysis_complete, then repeated perform_deep_dive requests.
+Reports throughput, latency percentiles per event type, event-loop stalls and failures.
+
+Needs the Socket.IO client extras: pip install "python-socketio[client]"
+
+Examples:
+    python load_test.py --start-server --users 8 --deep-dives 5
+    python load_test.py --url http://localhost:5000 --data data/1k --users 20 --ramp-seconds 10 --json load.json
+"""
+
+import argparse
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import requests
+    import socketio
+    HAS_SOCKETIO_CLIENT = True
+except ImportError:
+    HAS_SOCKETIO_CLIENT = False
+
+
+NO_FILTERS = {'companies': [], 'departments': [], 'locations': [], 'managers': []}
+PERCENTILES = (50, 90, 95, 99)
+# Events the simulated users wait for; everything else (status updates) is ignored
+CLIENT_EVENTS = ('job_created', 'analysis_complete', 'analysis_error', 'analysis_cancelled',
+                 'deep_dive_result', 'deep_dive_error')
+SERVER_SCRIPT = """
+import config
+from logging_config import configure_logging
+if {no_cache}:
+    config.RESULT_CACHE_ENABLED = False
+    config.DATASET_CACHE_MAX_MB = 0
+config.ANALYSIS_WORKERS = {workers}
+configure_logging(level='WARNING')
+import app
+if app.analysis_pool is not None:
+    app.analysis_pool.start()
+app.socketio.run(app.app, host='127.0.0.1', port={port}, log_output=False)
+"""
+
+
+class LoadStats:
+    """Latencies and failures recorded by all simulated users"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.failures: Dict[tuple, int] = {}
+
+    def record(self, event: str, seconds: float) -> None:
+        with self._lock:
+            self.latencies.setdefault(event, []).append(seconds)
+
+    def fail(self, event: str, message: str) -> None:
+        with self._lock:
+            key = (event, str(message)[:200])
+            self.failures[key] = self.failures.get(key, 0) + 1
+
+    @contextmanager
+    def timed(self, event: str):
+        start = time.perf_counter()
+        yield
+        self.record(event, time.perf_counter() - start)
+
+    def count(self, event: str) -> int:
+        return len(self.latencies.get(event, []))
+
+
+def latency_summary(values: List[float]) -> Dict:
+    summary = {'count': len(values)}
+    if values:
+        array = np.asarray(values)
+        summary['mean'] = round(float(array.mean()), 4)
+        for q in PERCENTILES:
+            summary[f'p{q}'] = round(float(np.percentile(array, q)), 4)
+        summary['max'] = round(float(array.max()), 4)
+    return summary
+
+
+def wait_for(events: queue.Queue, names, timeout: float):
+    """Next (name, received_at, data) whose name is in names; others are discarded"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            raise TimeoutError(f"No {'/'.join(sorted(names))} within {timeout:.0f}s")
+        try:
+            name, received_at, data = events.get(timeout=remaining)
+        except queue.Empty:
+            continue
+        if name in names:
+            return name, received_at, data
+
+
+def simulate_user(url: str, dataset: Dict, emails: List[str], stats: LoadStats, deep_dives: int = 5,
+                  timeout: float = 60, analysis_timeout: float = 1800, seed: int = 0) -> bool:
+    """One analyst's session, start to finish; returns True when every step succeeded"""
+    rng = random.Random(seed)
+    http = requests.Session()
+    client = socketio.Client(reconnection=False)
+    events = queue.Queue()
+    for name in CLIENT_EVENTS:
+        client.on(name, handler=lambda data=None, _name=name: events.put((_name, time.perf_counter(), data)))
+
+    step = 'page'
+    try:
+        with stats.timed('page'):
+            http.get(url + '/', timeout=timeout).raise_for_status()
+
+        step = 'upload'
+        usage_names = []
+        uploads = [(path, 'usage') for path in dataset['usage']]
+        if dataset.get('target'):
+            uploads.append((dataset['target'], 'target'))
+        for path, file_type in uploads:
+            with stats.timed('upload'), open(path, 'rb') as f:
+                response = http.post(url + '/upload', files={'file': (os.path.basename(path), f)},
+                                     data={'file_type': file_type}, timeout=timeout)
+            body = response.json()
+            if response.status_code != 200 or body.get('status') != 'success':
+                raise RuntimeError(body.get('message') or f"HTTP {response.status_code}")
+            if file_type == 'usage':
+                usage_names.append(os.path.basename(path))
+
+        step = 'connect'
+        # The Flask session cookie (set by the page and updated by the uploads) identifies the user
+        cookie = '; '.join(f"{c.name}={c.value}" for c in http.cookies)
+        with stats.timed('connect'):
+            client.connect(url, headers={'Cookie': cookie}, transports=['websocket'], wait_timeout=timeout)
+
+        step = 'analysis'
+        start = time.perf_counter()
+        client.emit('start_analysis', {'filters': NO_FILTERS, 'usage_filenames': usage_names})
+        name, received_at, data = wait_for(events, {'job_created', 'analysis_error'}, timeout)
+        if name != 'job_created':
+            raise RuntimeError((data or {}).get('message', name))
+        stats.record('job_created', received_at - start)
+        name, received_at, data = wait_for(events, {'analysis_complete', 'analysis_error', 'analysis_cancelled'},
+                                           analysis_timeout)
+        if name != 'analysis_complete':
+            raise RuntimeError((data or {}).get('message', name))
+        stats.record('analysis', received_at - start)
+
+        step = 'deep_dive'
+        ok = True
+        for _ in range(deep_dives):
+            start = time.perf_counter()
+            client.emit('perform_deep_dive', {'email': rng.choice(emails)})
+            name, received_at, data = wait_for(events, {'deep_dive_result', 'deep_dive_error'}, timeout)
+            if name == 'deep_dive_error':
+                stats.fail('deep_dive', (data or {}).get('message', name))
+                ok = False
+            else:
+                stats.record('deep_dive', received_at - start)
+        return ok
+    except Exception as e:
+        stats.fail(step, f"{type(e).__name__}: {e}")
+        return False
+    finally:
+        if client.connected:
+            client.disconnect()
+        http.close()
+
+
+class LatencyProbe(threading.Thread):
+    """Acknowledged 'latency_probe' round trips on a separate connection, every `interval` seconds"""
+
+    def __init__(self, url: str, stats: LoadStats, interval: float = 0.25, timeout: float = 30):
+        super().__init__(daemon=True)
+        self.url = url
+        self.stats = stats
+        self.interval = interval
+        self.timeout = timeout
+        self._stop_event = threading.Event()
+
+    def run(self):
+        client = socketio.Client(reconnection=False)
+        try:
+            client.connect(self.url, transports=['websocket'], wait_timeout=self.timeout)
+        except Exception as e:
+            self.stats.fail('latency_probe', f"{type(e).__name__}: {e}")
+            return
+        try:
+            while not self._stop_event.is_set():
+                start = time.perf_counter()
+                try:
+                    client.call('latency_probe', {}, timeout=self.timeout)
+                    self.stats.record('event_loop_stall', time.perf_counter() - start)
+                except Exception as e:
+                    self.stats.record('event_loop_stall', time.perf_counter() - start)
+                    self.stats.fail('latency_probe', f"{type(e).__name__}: {e}")
+                self._stop_event.wait(self.interval)
+        finally:
+            client.disconnect()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def dataset_emails(dataset: Dict, limit: int = 1000) -> List[str]:
+    """Users to deep-dive into: from the target file, or the first usage report without one"""
+    import pandas as pd
+    from usage_reader import UPN_COLUMN, read_usage_report
+    if dataset.get('target'):
+        reader = pd.read_excel if dataset['target'].lower().endswith(('.xlsx', '.xls')) else pd.read_csv
+        emails = reader(dataset['target'], usecols=['UserPrincipalName'])['UserPrincipalName']
+    else:
+        emails = read_usage_report(dataset['usage'][0], parse_dates=False)[UPN_COLUMN]
+    return emails.dropna().str.strip().str.lower().drop_duplicates().head(limit).tolist()
+
+
+def run_load_test(url: str, dataset: Dict, users: int = 4, deep_dives: int = 5, ramp_seconds: float = 0,
+                  timeout: float = 60, analysis_timeout: float = 1800, probe_interval: float = 0.25,
+                  stall_threshold: float = 0.1, seed: int = 0) -> Dict:
+    """Run `users` simulated analysts concurrently and summarize what they saw"""
+    emails = dataset_emails(dataset)
+    stats = LoadStats()
+    probe = LatencyProbe(url, stats, probe_interval, timeout)
+    probe.start()
+    threads = []
+    started = time.perf_counter()
+    for index in range(users):
+        thread = threading.Thread(target=simulate_user, daemon=True,
+                                  args=(url, dataset, emails, stats, deep_dives, timeout, analysis_timeout, seed + index))
+        thread.start()
+        threads.append(thread)
+        if ramp_seconds and index < users - 1:
+            time.sleep(ramp_seconds / (users - 1))
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started
+    probe.stop()
+
+    stalls = stats.latencies.get('event_loop_stall', [])
+    return {
+        'url': url,
+        'users': users,
+        'deep_dives_per_user': deep_dives,
+        'wall_seconds': round(wall_seconds, 2),
+        'analyses_completed': stats.count('analysis'),
+        'analyses_per_minute': round(stats.count('analysis') / wall_seconds * 60, 2),
+        'deep_dives_completed': stats.count('deep_dive'),
+        'deep_dives_per_second': round(stats.count('deep_dive') / wall_seconds, 2),
+        'latency': {event: latency_summary(values) for event, values in sorted(stats.latencies.items())},
+        'stalls': {'threshold_seconds': stall_threshold, 'probes': len(stalls),
+                   'over_threshold': sum(1 for value in stalls if value > stall_threshold),
+                   'stalled_seconds': round(sum(value for value in stalls if value > stall_threshold), 2)},
+        'failures': [{'event': event, 'message': message, 'count': count}
+                     for (event, message), count in sorted(stats.failures.items())],
+    }
+
+
+def format_report(summary: Dict) -> str:
+    lines = [
+        f"{summary['users']} users against {summary['url']} in {summary['wall_seconds']}s: "
+        f"{summary['analyses_completed']} analyses ({summary['analyses_per_minute']}/min), "
+        f"{summary['deep_dives_completed']} deep dives ({summary['deep_dives_per_second']}/s)",
+        f"{'event':<18} {'count':>6} {'mean':>8} " + ' '.join(f"{'p' + str(q):>8}" for q in PERCENTILES) + f" {'max':>8}",
+    ]
+    for event, latency in summary['latency'].items():
+        if not latency['count']:
+            continue
+        lines.append(f"{event:<18} {latency['count']:>6} {latency['mean']:>8.3f} "
+                     + ' '.join(f"{latency[f'p{q}']:>8.3f}" for q in PERCENTILES) + f" {latency['max']:>8.3f}")
+    stalls = summary['stalls']
+    lines.append(f"Event loop: {stalls['over_threshold']} of {stalls['probes']} probes waited longer than "
+                 f"{stalls['threshold_seconds']}s ({stalls['stalled_seconds']}s in total)")
+    if summary['failures']:
+        lines.append("Failures:")
+        lines += [f"  {f['count']} x {f['event']}: {f['message']}" for f in summary['failures']]
+    else:
+        lines.append("No failures")
+    return '\n'.join(lines)
+
+
+def start_local_server(port: int, no_cache: bool = False, log_path: Optional[str] = None,
+                       workers: int = 0) -> subprocess.Popen:
+    """The app in a child process (no reloader), logging to log_path; workers > 0 enables the worker pool"""
+    log = open(log_path, 'ab') if log_path else subprocess.DEVNULL
+    script = SERVER_SCRIPT.format(no_cache=bool(no_cache), port=int(port), workers=int(workers))
+    return subprocess.Popen([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=log, stderr=subprocess.STDOUT)
+
+
+def wait_until_ready(url: str, process: Optional[subprocess.Popen] = None, timeout: float = 60) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(url + '/metrics', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"Server at {url} did not come up within {timeout:.0f}s")
+
+
+def load_dataset(args, work_dir: str) -> Dict:
+    if args.data:
+        names = sorted(os.listdir(args.data))
+        target = next((os.path.join(args.data, n) for n in names if n.lower().startswith(('manager', 'target'))), None)
+        usage = [os.path.join(args.data, n) for n in names if os.path.join(args.data, n) != target
+                 and n.lower().endswith(('.csv', '.csv.gz', '.xlsx', '.xls', '.zip'))]
+        return {'usage': usage, 'target': args.target or target}
+    from synthetic_data import generate_dataset
+    return generate_dataset(os.path.join(work_dir, 'data'), users=args.generate, weeks=args.weeks, seed=args.seed)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the web app with concurrent simulated analysts.")
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help="Server to test")
+    parser.add_argument('--start-server', action='store_true', help="Start the app locally on --port for the test")
+    parser.add_argument('--port', type=int, default=5055, help="Port for --start-server")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="With --start-server: disable the dataset and result caches so every analysis runs in full")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="With --start-server: run analyses in this many pool workers (config.ANALYSIS_WORKERS)")
+    parser.add_argument('--users', type=int, default=4, help="Concurrent simulated users")
+    parser.add_argument('--deep-dives', type=int, default=5, help="Deep dives per user after the analysis")
+    parser.add_argument('--ramp-seconds', type=float, default=0, help="Spread the user start times over this period")
+    parser.add_argument('--data', help="Folder of usage reports (and a manager/target file) to upload")
+    parser.add_argument('--target', help="Target file to upload with --data")
+    parser.add_argument('--generate', type=int, default=300, help="Without --data: users in a generated dataset")
+    parser.add_argument('--weeks', type=int, default=26, help="Weeks in the generated dataset")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds to wait for uploads and replies")
+    parser.add_argument('--analysis-timeout', type=float, default=1800, help="Seconds to wait for an analysis")
+    parser.add_argument('--probe-interval', type=float, default=0.25, help="Seconds between event-loop probes")
+    parser.add_argument('--stall-threshold', type=float, default=0.1, help="Probe round trip counted as a stall")
+    parser.add_argument('--json', help="Also write the summary to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if not HAS_SOCKETIO_CLIENT:
+        print('The load test needs the Socket.IO client: pip install "python-socketio[client]"', file=sys.stderr)
+        return 2
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset = load_dataset(args, work_dir)
+        server = None
+        url = args.url.rstrip('/')
+        if args.start_server:
+            url = f"http://127.0.0.1:{args.port}"
+            server = start_local_server(args.port, args.no_cache, os.path.join(work_dir, 'server.log'), args.workers)
+        try:
+            wait_until_ready(url, server)
+            summary = run_load_test(url, dataset, args.users, args.deep_dives, args.ramp_seconds, args.timeout,
+                                    args.analysis_timeout, args.probe_interval, args.stall_threshold, args.seed)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(timeout=30)
+
+    print(format_report(summary))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Logging Configuration
+One place to set up log levels, per-module overrides and an optional queued handler
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Dict, Optional
+
+import config
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configure_logging(level: Optional[str] = None, module_levels: Optional[Dict[str, str]] = None,
+                      queued: Optional[bool] = None, fmt: Optional[str] = None) -> None:
+    """
+    Configure the root logger from config (arguments override the config values)
+
+    With queued=True, records are handed to a background thread that does the formatting and
+    the stream writes, so request and analysis code never blocks on stdout.
+    """
+    global _listener
+    level = level or config.LOG_LEVEL
+    module_levels = config.LOG_MODULE_LEVELS if module_levels is None else module_levels
+    queued = config.LOG_QUEUED if queued is None else queued
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter(fmt or config.LOG_FORMAT))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    if queued:
+        records = queue.SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(records))
+        _listener = logging.handlers.QueueListener(records, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+    else:
+        root.addHandler(stream_handler)
+    root.setLevel(level.upper())
+
+    for name, module_level in (module_levels or {}).items():
+        logging.getLogger(name).setLevel(module_level.upper())
+
+
+def stop_logging() -> None:
+    """Flush and stop the queued handler's thread, if one is running"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
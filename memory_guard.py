@@ -0,0 +1,98 @@
+"""
+Memory Guard
+Process memory readings and a configurable budget so large analyses fail fast instead of swapping
+"""
+
+import os
+import sys
+from typing import Iterable, Optional
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+
+# Rough in-memory size of a parsed report relative to its size on disk
+INGEST_EXPANSION_FACTOR = {
+    'csv': 4.0,
+    'csv.gz': 40.0,
+    'excel': 12.0,
+}
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when an analysis would exceed, or has exceeded, the configured memory budget"""
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process in bytes (0 if it cannot be determined)"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process in bytes (0 if it cannot be determined)"""
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def estimate_ingest_bytes(file_paths: Iterable[str]) -> int:
+    """Estimate the in-memory size of the given usage reports once parsed"""
+    total = 0
+    for path in file_paths:
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            continue
+        lower = path.lower()
+        kind = 'excel' if lower.endswith(('.xlsx', '.xls')) else 'csv.gz' if lower.endswith('.gz') else 'csv'
+        total += int(size * INGEST_EXPANSION_FACTOR[kind])
+    return total
+
+
+def _to_mb(num_bytes: int) -> float:
+    return num_bytes / (1024 * 1024)
+
+
+class MemoryBudget:
+    """Checks process memory against a budget at pipeline stage boundaries"""
+
+    def __init__(self, budget_mb: Optional[float] = None):
+        """A budget of None or 0 disables all checks"""
+        self.budget_bytes = int(budget_mb * 1024 * 1024) if budget_mb else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.budget_bytes is not None
+
+    def check(self, stage: str) -> None:
+        """Raise MemoryBudgetExceeded if the process is already over budget"""
+        if not self.enabled:
+            return
+        rss = current_rss_bytes()
+        if rss > self.budget_bytes:
+            raise MemoryBudgetExceeded(
+                f"Analysis stopped at '{stage}': memory usage {_to_mb(rss):.0f} MB exceeds the "
+                f"configured memory budget of {_to_mb(self.budget_bytes):.0f} MB. "
+                f"Try fewer usage reports or narrower filters."
+            )
+
+    def check_estimate(self, stage: str, additional_bytes: int) -> None:
+        """Raise MemoryBudgetExceeded if allocating additional_bytes would exceed the budget"""
+        if not self.enabled:
+            return
+        projected = current_rss_bytes() + additional_bytes
+        if projected > self.budget_bytes:
+            raise MemoryBudgetExceeded(
+                f"Analysis not started: '{stage}' is estimated to need {_to_mb(projected):.0f} MB, "
+                f"which exceeds the configured memory budget of {_to_mb(self.budget_bytes):.0f} MB. "
+                f"Try fewer usage reports or narrower filters."
+            )
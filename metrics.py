@@ -0,0 +1,260 @@
+"""
+Metrics
+In-process counters, gauges and histograms rendered in the Prometheus text exposition format
+"""
+
+import math
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from memory_guard import current_rss_bytes, peak_rss_bytes
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labelnames: Tuple[str, ...], values: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """A named metric family with optional labels"""
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        """(name suffix, formatted labels, value) triples"""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{suffix}{labels} {_format_value(value)}" for suffix, labels, value in self.samples()]
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self._values)
+
+    def changes(self, since: Dict) -> Dict:
+        """Increments made after `since` was taken, by label values"""
+        return {key: value - since.get(key, 0) for key, value in self.snapshot().items() if value != since.get(key, 0)}
+
+    def merge(self, changes: Dict) -> None:
+        with self._lock:
+            for key, amount in changes.items():
+                self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [('', _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self.function = function  # read at scrape time, for values owned by another component
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        if self.function is not None:
+            return self.function()
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if self.function is not None:
+            return [('', '', self.function())]
+        with self._lock:
+            return [('', _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, buckets: Iterable[float], labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._sums[key] = self._sums.get(key, 0) + value
+
+    def count(self, **labels) -> int:
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {key: (list(counts), self._sums[key]) for key, counts in self._counts.items()}
+
+    def changes(self, since: Dict) -> Dict:
+        """Observations made after `since` was taken, as (bucket counts, sum) by label values"""
+        changes = {}
+        for key, (counts, total) in self.snapshot().items():
+            old_counts, old_total = since.get(key, ([0] * len(counts), 0))
+            if counts[-1] != old_counts[-1]:
+                changes[key] = ([new - old for new, old in zip(counts, old_counts)], total - old_total)
+        return changes
+
+    def merge(self, changes: Dict) -> None:
+        with self._lock:
+            for key, (counts, total) in changes.items():
+                merged = self._counts.setdefault(key, [0] * len(self.buckets))
+                for i, count in enumerate(counts):
+                    merged[i] += count
+                self._sums[key] = self._sums.get(key, 0) + total
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                for bound, count in zip(self.buckets, counts):
+                    samples.append(('_bucket', _format_labels(self.labelnames, key, ('le', _format_value(bound))), count))
+                samples.append(('_sum', _format_labels(self.labelnames, key), self._sums[key]))
+                samples.append(('_count', _format_labels(self.labelnames, key), counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """All metrics of the process, in registration order"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, buckets, labelnames=()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def get(self, name: str) -> Optional[Metric]:
+        return self._metrics.get(name)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Counter and histogram values, to pass to changes() later"""
+        return {name: metric.snapshot() for name, metric in self._metrics.items()
+                if isinstance(metric, (Counter, Histogram))}
+
+    def changes(self, since: Dict[str, Dict]) -> Dict[str, Dict]:
+        """
+        Counter and histogram updates made after `since` was taken, for merge() in another process
+
+        Pool workers send these back with each job's result, so the parent's /metrics includes
+        what jobs recorded in the workers (gauges describe the process itself and are left out).
+        """
+        changes = {}
+        for name, metric in self._metrics.items():
+            changed = metric.changes(since.get(name, {})) if isinstance(metric, (Counter, Histogram)) else None
+            if changed:
+                changes[name] = changed
+        return changes
+
+    def merge(self, changes: Dict[str, Dict]) -> None:
+        """Add updates another process's registry returned from changes()"""
+        for name, changed in changes.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(changed)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+SIZE_BUCKETS = [2 ** 10 * 4 ** i for i in range(12)]  # 1 KiB .. 4 GiB
+DURATION_BUCKETS = [0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600]
+
+UPLOADS = REGISTRY.counter('copilot_uploads_total', "Completed file uploads", ['kind', 'outcome'])
+UPLOAD_BYTES = REGISTRY.histogram('copilot_upload_bytes', "Size of uploaded files", SIZE_BUCKETS, ['kind'])
+JOBS_SUBMITTED = REGISTRY.counter('copilot_jobs_submitted_total', "Analysis jobs submitted")
+JOBS_FINISHED = REGISTRY.counter('copilot_jobs_finished_total', "Analysis jobs finished, by final state", ['state'])
+JOB_DURATION = REGISTRY.histogram('copilot_job_duration_seconds', "Analysis run time, from start to finish",
+                                  DURATION_BUCKETS, ['state'])
+JOB_QUEUE_WAIT = REGISTRY.histogram('copilot_job_queue_wait_seconds', "Time analysis jobs waited for admission",
+                                    DURATION_BUCKETS)
+DEEP_DIVES = REGISTRY.counter('copilot_deep_dive_requests_total', "User deep-dive requests", ['outcome'])
+CACHE_REQUESTS = REGISTRY.counter('copilot_cache_requests_total', "Dataset and result cache lookups",
+                                  ['kind', 'result'])
+SOCKET_CONNECTIONS = REGISTRY.gauge('copilot_socket_connections', "Open Socket.IO connections")
+REGISTRY.gauge('process_resident_memory_bytes', "Resident memory of this process", function=current_rss_bytes)
+REGISTRY.gauge('process_peak_resident_memory_bytes', "Peak resident memory of this process", function=peak_rss_bytes)
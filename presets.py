@@ -0,0 +1,193 @@
+"""
+Presets
+Target populations and manager hierarchies of config.TARGET_PRESETS, parsed and indexed once and
+reloaded only when a preset file's modification time or size changes
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import config
+from chunked_upload import file_sha256
+
+
+logger = logging.getLogger(__name__)
+
+# Target file columns read to build the filter dropdowns
+FILTER_COLUMNS = ['UserPrincipalName', 'Company', 'Department', 'City', 'ManagerLine']
+
+
+def split_manager_line(line) -> List[str]:
+    """Managers of a ManagerLine, immediate manager first"""
+    if not isinstance(line, str) or not line.strip():
+        return []
+    return [part.strip() for part in line.split('->') if part.strip()]
+
+
+def read_filter_frame(path: str) -> pd.DataFrame:
+    """The filter columns of a target file, as strings with blanks for missing values"""
+    available_cols = pd.read_csv(path, nrows=0, encoding='utf-8-sig').columns.tolist()
+    cols_to_read = [col for col in FILTER_COLUMNS if col in available_cols]
+    df = pd.read_csv(path, usecols=cols_to_read, dtype=str, encoding='utf-8-sig')
+    return df.fillna('')
+
+
+def filter_options(df: pd.DataFrame, managers: Optional[List[str]] = None) -> Dict[str, List[str]]:
+    """
+    Dropdown values of a read_filter_frame; managers are the given list (a preset's) or else
+    everyone appearing in a ManagerLine
+    """
+    filters = {
+        'companies': sorted(df['Company'].unique().tolist()) if 'Company' in df.columns else [],
+        'departments': sorted(df['Department'].unique().tolist()) if 'Department' in df.columns else [],
+        'locations': sorted(df['City'].unique().tolist()) if 'City' in df.columns else []
+    }
+    if managers is not None:
+        filters['managers'] = list(managers)
+    else:
+        all_managers = set()
+        if 'ManagerLine' in df.columns:
+            for chain in df['ManagerLine']:
+                all_managers.update(split_manager_line(chain))
+        filters['managers'] = sorted(all_managers)
+    return filters
+
+
+def file_signature(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PresetHierarchy:
+    """One preset's parsed target file plus lookups by email and by manager"""
+
+    def __init__(self, key: str, file_path: str, managers: List[str], target_df: pd.DataFrame,
+                 filter_df: pd.DataFrame, content_hash: str, signature: Tuple[int, int]):
+        self.key = key
+        self.file_path = file_path
+        self.managers = list(managers)
+        # Parsed exactly as CopilotAnalyzer.read_target_file does, so it can stand in for it
+        self.target_df = target_df
+        self.content_hash = content_hash
+        self.signature = signature
+        self._filters = filter_options(filter_df)
+
+        if 'UserPrincipalName' in target_df.columns and target_df['UserPrincipalName'].dtype == object:
+            self._emails = target_df['UserPrincipalName'].str.lower()
+        else:
+            self._emails = pd.Series(np.nan, index=target_df.index, dtype=object)
+        self.emails: FrozenSet[str] = frozenset(self._emails.dropna())
+        rows: Dict[str, List] = {}
+        if 'ManagerLine' in target_df.columns:
+            for label, line in target_df['ManagerLine'].items():
+                for manager in set(split_manager_line(line.lower() if isinstance(line, str) else line)):
+                    rows.setdefault(manager, []).append(label)
+        # target_df row labels of everyone below each manager, at any level, by lower-case name
+        self.rows_by_manager: Dict[str, np.ndarray] = {m: np.array(labels) for m, labels in rows.items()}
+
+    def filter_options(self, managers: Optional[List[str]] = None) -> Dict[str, List[str]]:
+        """filter_options of the preset file, without reading it again"""
+        filters = {name: list(values) for name, values in self._filters.items()}
+        if managers is not None:
+            filters['managers'] = list(managers)
+        return filters
+
+    def rows_under(self, managers: Iterable[str]) -> np.ndarray:
+        """Labels of the target_df rows with any of these managers in their ManagerLine"""
+        found = [self.rows_by_manager[key] for key in (m.strip().lower() for m in managers)
+                 if key in self.rows_by_manager]
+        return np.unique(np.concatenate(found)) if found else np.array([], dtype=int)
+
+    def members(self, manager: str) -> FrozenSet[str]:
+        """Emails of everyone below a manager"""
+        return frozenset(self._emails.loc[self.rows_under([manager])].dropna())
+
+
+def load_preset(key: str, spec: Dict) -> Optional[PresetHierarchy]:
+    """Parse and index a preset's target file; None for presets without one"""
+    file_path = spec.get('file_path')
+    if not file_path:
+        return None
+    signature = file_signature(file_path)
+    target_df = pd.read_csv(file_path, encoding='utf-8-sig')
+    return PresetHierarchy(key, file_path, spec.get('managers', []), target_df, read_filter_frame(file_path),
+                           file_sha256(file_path), signature)
+
+
+_lock = threading.Lock()
+# Preset definitions being served (config.TARGET_PRESETS unless preload() was given others)
+_specs: Optional[Dict] = None
+_loaded: Dict[str, PresetHierarchy] = {}
+
+
+def _load(key: str, spec: Dict) -> Optional[PresetHierarchy]:
+    try:
+        preset = load_preset(key, spec)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not load preset '%s': %s", key, e)
+        preset = None
+    if preset is None:
+        _loaded.pop(key, None)
+    else:
+        _loaded[key] = preset
+    return preset
+
+
+def _current(key: str) -> Optional[PresetHierarchy]:
+    """The loaded preset, reloaded first if its file changed; callers hold _lock"""
+    spec = (config.TARGET_PRESETS if _specs is None else _specs).get(key)
+    if not spec or not spec.get('file_path'):
+        _loaded.pop(key, None)
+        return None
+    preset = _loaded.get(key)
+    if preset is not None:
+        try:
+            if file_signature(spec['file_path']) == preset.signature:
+                return preset
+        except OSError:
+            pass
+        logger.info("Preset '%s' changed on disk; reloading %s", key, spec['file_path'])
+    return _load(key, spec)
+
+
+def preload(presets: Optional[Dict] = None) -> Dict[str, PresetHierarchy]:
+    """Load every preset with a target file (config.TARGET_PRESETS by default); unreadable ones are logged and skipped"""
+    global _specs
+    with _lock:
+        _specs = presets
+        _loaded.clear()
+        specs = config.TARGET_PRESETS if presets is None else presets
+        loaded = {key: preset for key, spec in specs.items() if (preset := _load(key, spec)) is not None}
+    logger.info("Preloaded %d preset hierarchies", len(loaded))
+    return loaded
+
+
+def refresh() -> Dict[str, PresetHierarchy]:
+    """Load the presets not loaded yet and reload those whose files changed"""
+    with _lock:
+        specs = config.TARGET_PRESETS if _specs is None else _specs
+        return {key: preset for key in specs if (preset := _current(key)) is not None}
+
+
+def get_preset(key: Optional[str]) -> Optional[PresetHierarchy]:
+    if not key:
+        return None
+    with _lock:
+        return _current(key)
+
+
+def preset_for_hash(content_hash: Optional[str]) -> Optional[PresetHierarchy]:
+    """The loaded preset whose target file has this content, e.g. an uploaded copy of it"""
+    if not content_hash:
+        return None
+    with _lock:
+        for key in list(_loaded):
+            preset = _current(key)
+            if preset is not None and preset.content_hash == content_hash:
+                return preset
+    return None
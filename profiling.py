@@ -0,0 +1,115 @@
+"""
+Profiling
+Opt-in cProfile capture of a single analysis, saved as a .prof file and as collapsed stacks
+"""
+
+import cProfile
+import logging
+import os
+import pstats
+import threading
+from typing import Any, Callable, Dict, Tuple
+
+
+# Paths below this share of the total time are dropped from the collapsed stacks
+MIN_STACK_FRACTION = 0.0005
+MAX_STACK_DEPTH = 64
+
+PROFILE_FORMATS = ('prof', 'collapsed')
+
+logger = logging.getLogger(__name__)
+
+# cProfile hooks the whole interpreter (every greenlet, and on Python 3.12+ every thread), so
+# only one profile is captured per process at a time
+_profiling = threading.Lock()
+
+
+def _frame_name(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == '~':  # built-ins, e.g. "<method 'sort' of 'list' objects>"
+        return name.replace(';', ',')
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+
+def collapsed_stacks(stats: pstats.Stats) -> Dict[str, int]:
+    """
+    Approximate "a;b;c weight" stacks from cProfile's caller/callee graph
+
+    cProfile only records one level of callers, so a function's time is split between its
+    callers in proportion to the time each caller spent in it. Weights are microseconds.
+    """
+    entries = stats.stats
+    callees: Dict[Tuple, Dict[Tuple, float]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, {})[func] = caller_stats[3]  # cumulative time via this caller
+    roots = [func for func, (_, _, _, _, callers) in entries.items() if not callers]
+    total = sum(entries[func][3] for func in roots) or 1.0
+    stacks: Dict[str, int] = {}
+
+    def walk(func, path, share, on_path):
+        """share: fraction of func's time that was spent on this path; on_path guards recursion"""
+        _, _, tottime, cumtime, _ = entries[func]
+        if cumtime * share < total * MIN_STACK_FRACTION or len(path) >= MAX_STACK_DEPTH:
+            return
+        path = path + [_frame_name(func)]
+        weight = int(tottime * share * 1e6)
+        if weight:
+            key = ';'.join(path)
+            stacks[key] = stacks.get(key, 0) + weight
+        for callee, via_time in callees.get(func, {}).items():
+            callee_cumtime = entries[callee][3]
+            if callee in on_path or not callee_cumtime:
+                continue
+            walk(callee, path, share * via_time / callee_cumtime, on_path | {callee})
+
+    for root in roots:
+        walk(root, [], 1.0, {root})
+    return stacks
+
+
+def write_profile(profiler: cProfile.Profile, path_stem: str) -> Dict[str, str]:
+    """Save <stem>.prof (pstats) and <stem>.collapsed (flamegraph.pl / speedscope input)"""
+    os.makedirs(os.path.dirname(path_stem) or '.', exist_ok=True)
+    prof_path = path_stem + '.prof'
+    profiler.dump_stats(prof_path)
+    collapsed_path = path_stem + '.collapsed'
+    stacks = collapsed_stacks(pstats.Stats(prof_path))
+    with open(collapsed_path, 'w', encoding='utf-8') as f:
+        for stack, weight in sorted(stacks.items()):
+            f.write(f"{stack} {weight}\n")
+    return {'prof': prof_path, 'collapsed': collapsed_path}
+
+
+def saved_profile(path_stem: str) -> Dict[str, str]:
+    """The profile files written for path_stem, by format (empty if it was not profiled)"""
+    paths = {fmt: path_stem + '.' + fmt for fmt in PROFILE_FORMATS}
+    return paths if all(os.path.exists(path) for path in paths.values()) else {}
+
+
+def profile_call(path_stem: str, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, Dict[str, str]]:
+    """
+    Run fn under cProfile and write its profile files; returns (fn's result, {format: path})
+
+    While another profile is being captured in this process, fn runs unprofiled and no
+    paths are returned, rather than mixing both runs into one profile.
+    """
+    if not _profiling.acquire(blocking=False):
+        logger.warning("Another analysis is being profiled; running %s unprofiled", path_stem)
+        return fn(*args, **kwargs), {}
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # another profiling tool (e.g. a debugger or coverage) is active
+            logger.warning("Cannot profile %s (%s); running it unprofiled", path_stem, e)
+            return fn(*args, **kwargs), {}
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            # Written even if fn raised (or was cancelled), since those runs are often the interesting ones
+            paths = write_profile(profiler, path_stem)
+        return result, paths
+    finally:
+        _profiling.release()
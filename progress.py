@@ -0,0 +1,110 @@
+"""
+Progress Sinks
+Where CopilotAnalyzer sends its status messages, so the engine does not depend on Socket.IO
+"""
+
+import logging
+import queue as queue_module
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressSink:
+    """Receives status messages from a running analysis"""
+
+    def publish(self, message: str) -> None:
+        raise NotImplementedError
+
+
+class NullProgressSink(ProgressSink):
+    """Discards all messages"""
+
+    def publish(self, message: str) -> None:
+        pass
+
+
+class LoggingProgressSink(ProgressSink):
+    """Writes messages to a logger (the default for headless runs)"""
+
+    def __init__(self, log: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.log = log or logger
+        self.level = level
+
+    def publish(self, message: str) -> None:
+        self.log.log(self.level, "%s", message)
+
+
+class MemoryProgressSink(ProgressSink):
+    """Keeps messages in a list, for tests and for replaying progress to late subscribers"""
+
+    def __init__(self):
+        self.events: List[Dict] = []
+
+    def publish(self, message: str) -> None:
+        self.events.append({'message': message, 'time': time.time()})
+
+    @property
+    def messages(self) -> List[str]:
+        return [event['message'] for event in self.events]
+
+
+class SocketIOProgressSink(ProgressSink):
+    """Emits 'status_update' events to one client, yielding so eventlet can flush them"""
+
+    def __init__(self, socketio, sid, event: str = 'status_update', yield_seconds: float = 0.1):
+        self.socketio = socketio
+        self.sid = sid
+        self.event = event
+        self.yield_seconds = yield_seconds
+
+    def publish(self, message: str) -> None:
+        self.socketio.emit(self.event, {'message': message}, to=self.sid)
+        if self.yield_seconds:
+            self.socketio.sleep(self.yield_seconds)
+
+
+class QueueProgressSink(ProgressSink):
+    """Puts messages on a multiprocessing (or thread) queue for a parent process to relay"""
+
+    def __init__(self, queue, source: Optional[str] = None):
+        self.queue = queue
+        self.source = source
+
+    def publish(self, message: str) -> None:
+        self.queue.put({'source': self.source, 'message': message})
+
+
+class FanOutProgressSink(ProgressSink):
+    """Publishes every message to several sinks"""
+
+    def __init__(self, sinks: Iterable[ProgressSink]):
+        self.sinks = list(sinks)
+
+    def publish(self, message: str) -> None:
+        for sink in self.sinks:
+            sink.publish(message)
+
+
+def relay_queue(queue, sink_for: Callable[[Optional[str]], Optional[ProgressSink]],
+                timeout: float = 0) -> int:
+    """
+    Forward messages from a QueueProgressSink's queue to the sink for each message's source
+
+    Returns without blocking once the queue is empty (after waiting up to timeout for the
+    first message), so callers can poll it from a loop. Returns the number of messages relayed.
+    """
+    relayed = 0
+    block = timeout > 0
+    while True:
+        try:
+            item = queue.get(block=block, timeout=timeout if block else None)
+        except queue_module.Empty:
+            return relayed
+        block = False
+        sink = sink_for(item.get('source'))
+        if sink is not None:
+            sink.publish(item['message'])
+        relayed += 1
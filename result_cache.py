@@ -0,0 +1,82 @@
+"""
+Result Cache
+Keys for memoizing complete analyses by input content, normalized filters and engine version
+"""
+
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+import config
+from dataset_cache import dataset_key
+
+
+# Bump on any change that alters analysis output without touching the engine modules below
+# (for example a dependency upgrade that changes Excel rendering)
+ENGINE_VERSION = '1'
+
+# Modules whose source is hashed into the engine version, so a code or config upgrade invalidates results
+ENGINE_MODULES = ('analysis_logic', 'rui_calculator', 'usage_reader', 'date_parsing', 'presets', 'config',
+                  'dataset_cache', 'result_cache')
+
+FILTER_KEYS = ('companies', 'departments', 'locations', 'managers')
+
+_engine_version = None
+
+
+def engine_version() -> str:
+    """ENGINE_VERSION plus a digest of the engine sources, computed once per process"""
+    global _engine_version
+    if _engine_version is None:
+        hasher = hashlib.sha256()
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+        for module in ENGINE_MODULES:
+            path = os.path.join(base_dir, module + '.py')
+            hasher.update(module.encode('utf-8'))
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    hasher.update(f.read())
+        _engine_version = f"{ENGINE_VERSION}-{hasher.hexdigest()[:12]}"
+    return _engine_version
+
+
+def normalize_filters(filters: Optional[Dict], has_target: bool) -> Dict[str, List[str]]:
+    """
+    Canonical form of a filter set: only non-empty known keys, values de-duplicated and sorted
+
+    Values are lower-cased because filtering is case-insensitive; only manager names are
+    stripped, matching how each filter is applied. Without a target file filters have no effect.
+    """
+    if not filters or not has_target:
+        return {}
+    normalized = {}
+    for key in FILTER_KEYS:
+        values = filters.get(key)
+        if not values:
+            continue
+        values = [str(v).lower() for v in values]
+        if key == 'managers':
+            values = [v.strip() for v in values]
+        normalized[key] = sorted(set(values))
+    return normalized
+
+
+def analysis_result_key(usage_hashes: Iterable[str], target_hash: Optional[str], filters: Dict,
+                        engines: Optional[Dict[str, str]] = None) -> str:
+    """
+    Cache key for one analysis; report order is kept since it can affect tie-breaking.
+    `engines` is the analysis's engine selection (config.ANALYSIS_ENGINES plus overrides).
+    """
+    settings = {
+        'target_only_ingest': bool(config.USAGE_INGEST_TARGET_ONLY),
+        'engines': dict(sorted((config.ANALYSIS_ENGINES if engines is None else engines).items())),
+    }
+    parts = [
+        engine_version(),
+        *usage_hashes,
+        f"target:{target_hash or ''}",
+        json.dumps(filters, sort_keys=True),
+        json.dumps(settings, sort_keys=True),
+    ]
+    return dataset_key('result', parts)
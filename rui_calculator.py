@@ -7,6 +7,9 @@ import pandas as pd
 import numpy as np
 from typing import Dict, List, Optional, Tuple
 
+import config
+from instrumentation import StageTimings
+
 
 class RUICalculator:
     """Calculate Relative Use Index scores for license management"""
@@ -26,9 +29,23 @@ class RUICalculator:
     THRESHOLD_HIGH_RISK = 20
     THRESHOLD_MEDIUM_RISK = 40
     
-    def __init__(self, reference_date):
-        """Initialize with reference date for consistent calculations"""
+    # Implementations of the peer-group and manager-summary steps, by engine name
+    # (see config.ANALYSIS_ENGINES)
+    PEER_GROUP_ENGINES = {'reference': '_assign_peer_groups_reference'}
+    MANAGER_SUMMARY_ENGINES = {'reference': '_manager_summary_reference'}
+    
+    def __init__(self, reference_date, timings: Optional[StageTimings] = None, engines: Optional[Dict[str, str]] = None):
+        """Initialize with reference date for consistent calculations; step timings go to `timings`"""
         self.reference_date = pd.to_datetime(reference_date)
+        self.timings = timings if timings is not None else StageTimings()
+        self.engines = dict(config.ANALYSIS_ENGINES, **(engines or {}))
+    
+    def _engine(self, step: str, registry: Dict[str, str]):
+        """The method implementing `step` with the configured engine"""
+        engine = self.engines.get(step, 'reference')
+        if engine not in registry:
+            raise ValueError(f"Unknown {step} engine '{engine}'. Available: {', '.join(sorted(registry))}")
+        return getattr(self, registry[engine])
     
     def calculate_rui_scores(self, users_df: pd.DataFrame, manager_df: pd.DataFrame = None, status_callback=None) -> pd.DataFrame:
         """
@@ -41,11 +58,9 @@ class RUICalculator:
         Returns:
             DataFrame with RUI scores and peer group information added
         """
+        merged = False
         # Merge manager data if provided
         if manager_df is not None and not manager_df.empty:
-            manager_df = manager_df.copy()
-            if 'UserPrincipalName' in manager_df.columns:
-                manager_df['UserPrincipalName'] = manager_df['UserPrincipalName'].str.lower()
             # Only merge columns that don't already exist in users_df
             merge_cols = []
             if 'UserPrincipalName' in manager_df.columns:
@@ -57,50 +72,70 @@ class RUICalculator:
             
             # Only merge if there are columns to add and UserPrincipalName exists
             if len(merge_cols) > 1 and 'UserPrincipalName' in merge_cols:
+                # Project to the merge columns before normalising so the full target table is never copied
+                manager_cols = manager_df[merge_cols].copy()
+                manager_cols['UserPrincipalName'] = manager_cols['UserPrincipalName'].str.lower()
                 users_df = users_df.merge(
-                    manager_df[merge_cols],
+                    manager_cols,
                     left_on='Email',
                     right_on='UserPrincipalName',
                     how='left'
                 )
+                merged = True
+        
+        # The stages below add their columns in place; a shallow copy keeps the caller's frame untouched
+        if not merged:
+            users_df = users_df.copy(deep=False)
         
         # Calculate component scores
         if status_callback:
             status_callback("3a2. Calculating recency scores...")
-        users_df = self._calculate_recency_scores(users_df)
+        with self.timings.stage('rui.recency') as stage:
+            stage.rows = len(users_df)
+            users_df = self._calculate_recency_scores(users_df)
         
         if status_callback:
             status_callback("3a3. Calculating frequency scores...")
-        users_df = self._calculate_frequency_scores(users_df)
+        with self.timings.stage('rui.frequency') as stage:
+            stage.rows = len(users_df)
+            users_df = self._calculate_frequency_scores(users_df)
         
         if status_callback:
             status_callback("3a4. Calculating breadth scores...")
-        users_df = self._calculate_breadth_scores(users_df)
+        with self.timings.stage('rui.breadth') as stage:
+            stage.rows = len(users_df)
+            users_df = self._calculate_breadth_scores(users_df)
         
         if status_callback:
             status_callback("3a5. Calculating trend scores...")
-        users_df = self._calculate_trend_scores(users_df)
+        with self.timings.stage('rui.trend') as stage:
+            stage.rows = len(users_df)
+            users_df = self._calculate_trend_scores(users_df)
         
         # Form peer groups and calculate RUI
         if status_callback:
             status_callback("3a6. Assigning peer groups...")
-        users_df = self._assign_peer_groups(users_df, status_callback)
+        with self.timings.stage('rui.peer_groups') as stage:
+            stage.rows = len(users_df)
+            users_df = self._assign_peer_groups(users_df, status_callback)
         
         if status_callback:
             status_callback("3a7. Calculating relative RUI scores...")
-        users_df = self._calculate_peer_relative_rui(users_df)
+        with self.timings.stage('rui.relative_rui') as stage:
+            stage.rows = len(users_df)
+            users_df = self._calculate_peer_relative_rui(users_df)
         
         # Add risk classification
         if status_callback:
             status_callback("3a8. Classifying risk levels...")
-        users_df = self._classify_risk(users_df)
+        with self.timings.stage('rui.risk') as stage:
+            stage.rows = len(users_df)
+            users_df = self._classify_risk(users_df)
         
         return users_df
     
     def _calculate_recency_scores(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate recency component (0-100) with exponential decay"""
-        df = df.copy()
-        
+        """Calculate recency component (0-100) with exponential decay (adds columns in place)"""
         # Calculate days since last activity
         df['days_since_activity'] = (
             self.reference_date - pd.to_datetime(df['Overall Recency'], errors='coerce')
@@ -113,9 +148,7 @@ class RUICalculator:
         return df
     
     def _calculate_frequency_scores(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate frequency component based on appearances/reports"""
-        df = df.copy()
-        
+        """Calculate frequency component based on appearances/reports (adds columns in place)"""
         # Use existing Adjusted Consistency as frequency proxy
         if 'Adjusted Consistency (%)' in df.columns:
             df['frequency_score'] = df['Adjusted Consistency (%)'].clip(0, 100)
@@ -126,9 +159,7 @@ class RUICalculator:
         return df
     
     def _calculate_breadth_scores(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate breadth component based on tool diversity"""
-        df = df.copy()
-        
+        """Calculate breadth component based on tool diversity (adds columns in place)"""
         # Use average tools per report as breadth metric
         if 'Avg Tools / Report' in df.columns:
             # Normalize to 0-100 scale (assume 10 tools = 100%)
@@ -142,9 +173,7 @@ class RUICalculator:
         return df
     
     def _calculate_trend_scores(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate trend component based on usage trajectory"""
-        df = df.copy()
-        
+        """Calculate trend component based on usage trajectory (adds columns in place)"""
         # Map trend to score
         trend_map = {
             'Growing': 100,
@@ -162,9 +191,10 @@ class RUICalculator:
         return df
     
     def _assign_peer_groups(self, df: pd.DataFrame, status_callback=None) -> pd.DataFrame:
-        """Assign users to peer groups based on manager hierarchy"""
-        df = df.copy()
-        
+        """Assign users to peer groups based on manager hierarchy (adds columns in place)"""
+        return self._engine('peer_groups', self.PEER_GROUP_ENGINES)(df, status_callback)
+    
+    def _assign_peer_groups_reference(self, df: pd.DataFrame, status_callback=None) -> pd.DataFrame:
         df['peer_group'] = None
         df['peer_group_size'] = 0
         df['peer_group_type'] = None
@@ -246,10 +276,8 @@ class RUICalculator:
             # Strategy 1: Self + direct reports if user is a manager
             if len(subordinates) >= self.MIN_PEER_GROUP_SIZE - 1:
                 # Include self and subordinates
-                peer_group_indices = list(subordinates.index) + [idx]
-                peers = df.loc[peer_group_indices]
                 df.at[idx, 'peer_group'] = f"team_{current_user_email}"
-                df.at[idx, 'peer_group_size'] = len(peers)
+                df.at[idx, 'peer_group_size'] = len(subordinates) + 1
                 df.at[idx, 'peer_group_type'] = 'Self + Subordinates'
                 continue
             
@@ -357,84 +385,56 @@ class RUICalculator:
         # Recalculate peer_group_size to match actual group membership
         # This fixes cases where initial assignment counted potential peers
         # but actual group membership is different
-        for group_name in df['peer_group'].unique():
-            if group_name:
-                group_members = df[df['peer_group'] == group_name]
-                actual_size = len(group_members)
-                
-                # Update all members of this group with the correct size
-                for idx in group_members.index:
-                    if df.at[idx, 'peer_group_size'] != actual_size:
-                        df.at[idx, 'peer_group_size'] = actual_size
+        has_group = df['peer_group'].notna() & (df['peer_group'] != '')
+        group_sizes = df.loc[has_group, 'peer_group'].map(df.loc[has_group, 'peer_group'].value_counts())
+        df.loc[has_group, 'peer_group_size'] = group_sizes
         
         return df
     
     def _calculate_peer_relative_rui(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calculate RUI scores relative to peer groups"""
-        df = df.copy()
-        
+        """Calculate RUI scores relative to peer groups (adds columns in place)"""
         # Initialize RUI columns
         df['rui_score'] = 0.0
         df['peer_rank'] = 0
         df['peer_percentile'] = 0.0
         
-        # Calculate RUI for each peer group
-        for group_id in df['peer_group'].unique():
-            group_mask = df['peer_group'] == group_id
-            group_df = df[group_mask].copy()
-            
-            if len(group_df) == 0:
-                continue
-            
-            # Calculate raw component scores
-            for component in ['recency', 'frequency', 'breadth', 'trend']:
-                col_name = f'{component}_score'
-                
-                # Calculate percentile rank within peer group
-                percentile_col = f'{component}_percentile'
-                group_df[percentile_col] = group_df[col_name].rank(pct=True) * 100
-            
-            # Calculate weighted RUI
-            group_df['rui_score'] = (
-                group_df['recency_percentile'] * self.WEIGHT_RECENCY +
-                group_df['frequency_percentile'] * self.WEIGHT_FREQUENCY +
-                group_df['breadth_percentile'] * self.WEIGHT_BREADTH +
-                group_df['trend_percentile'] * self.WEIGHT_TREND
-            )
-            
-            # Apply good standing penalty
-            group_df.loc[~group_df['good_standing'], 'rui_score'] *= 0.8
-            
-            # Calculate peer rank
-            group_df['rui_score'] = group_df['rui_score'].clip(0, 100)
-            group_df['peer_rank'] = group_df['rui_score'].rank(ascending=False, method='min').astype(int)
-            group_df['peer_percentile'] = group_df['rui_score'].rank(pct=True) * 100
-            
-            # Update main dataframe
-            df.loc[group_mask, 'rui_score'] = group_df['rui_score']
-            df.loc[group_mask, 'peer_rank'] = group_df['peer_rank']
-            df.loc[group_mask, 'peer_percentile'] = group_df['peer_percentile']
-            
-            # Add component percentiles for transparency
-            for component in ['recency', 'frequency', 'breadth', 'trend']:
-                percentile_col = f'{component}_percentile'
-                df.loc[group_mask, percentile_col] = group_df[percentile_col]
+        # Calculate RUI within each peer group; grouped ranks avoid materialising a frame per group
+        in_group = df['peer_group'].notna()
+        groups = df.groupby('peer_group', sort=False)
+        
+        # Calculate percentile rank within peer group for each component
+        for component in ['recency', 'frequency', 'breadth', 'trend']:
+            percentile_col = f'{component}_percentile'
+            df[percentile_col] = groups[f'{component}_score'].rank(pct=True) * 100
+        
+        # Calculate weighted RUI
+        rui_score = (
+            df['recency_percentile'] * self.WEIGHT_RECENCY +
+            df['frequency_percentile'] * self.WEIGHT_FREQUENCY +
+            df['breadth_percentile'] * self.WEIGHT_BREADTH +
+            df['trend_percentile'] * self.WEIGHT_TREND
+        )
+        
+        # Apply good standing penalty
+        rui_score = rui_score.where(df['good_standing'], rui_score * 0.8)
+        
+        # Calculate peer rank
+        rui_score = rui_score.clip(0, 100)
+        rui_groups = rui_score.groupby(df['peer_group'], sort=False)
+        df.loc[in_group, 'rui_score'] = rui_score[in_group]
+        df.loc[in_group, 'peer_rank'] = rui_groups.rank(ascending=False, method='min')[in_group].astype(int)
+        df.loc[in_group, 'peer_percentile'] = (rui_groups.rank(pct=True) * 100)[in_group]
         
         return df
     
     def _classify_risk(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Classify users into risk categories based on RUI score"""
-        df = df.copy()
-        
-        def get_risk_level(score):
-            if score < self.THRESHOLD_HIGH_RISK:
-                return 'High - Reclaim'
-            elif score < self.THRESHOLD_MEDIUM_RISK:
-                return 'Medium - Review'
-            else:
-                return 'Low - Retain'
-        
-        df['license_risk'] = df['rui_score'].apply(get_risk_level)
+        """Classify users into risk categories based on RUI score (adds columns in place)"""
+        score = df['rui_score']
+        df['license_risk'] = np.select(
+            [score < self.THRESHOLD_HIGH_RISK, score < self.THRESHOLD_MEDIUM_RISK],
+            ['High - Reclaim', 'Medium - Review'],
+            default='Low - Retain'
+        )
         
         # Override risk classification for new users (90-day grace period)
         # New users should not be at risk during their onboarding period
@@ -443,11 +443,10 @@ class RUICalculator:
             df.loc[new_user_mask, 'license_risk'] = 'Low - New User (Grace Period)'
         
         # Create peer rank string (e.g., "3 of 8")
-        df['peer_rank_display'] = df.apply(
-            lambda x: f"{int(x['peer_rank'])} of {int(x['peer_group_size'])}" 
-            if x['peer_group_size'] > 0 else "N/A",
-            axis=1
+        rank_display = (
+            df['peer_rank'].astype(int).astype(str) + ' of ' + df['peer_group_size'].astype(int).astype(str)
         )
+        df['peer_rank_display'] = rank_display.where(df['peer_group_size'] > 0, 'N/A')
         
         # Create trend arrow
         trend_arrows = {
@@ -463,64 +462,63 @@ class RUICalculator:
     
     def get_manager_summary(self, df: pd.DataFrame) -> pd.DataFrame:
         """Create manager-level summary statistics, aggregating small teams to meaningful groups"""
+        return self._engine('manager_summary', self.MANAGER_SUMMARY_ENGINES)(df)
+    
+    def _manager_summary_reference(self, df: pd.DataFrame) -> pd.DataFrame:
         if 'ManagerLine' not in df.columns:
             return pd.DataFrame()
         
-        # Create a copy to work with
-        df = df.copy()
-        
         # Determine the effective manager for each user (lowest level that gets 5+ users)
-        df['effective_manager'] = None
-        
-        # Build manager hierarchy mapping
-        manager_hierarchy = {}
-        for _, row in df.iterrows():
-            mgr_line = row.get('ManagerLine', '')
-            if pd.notna(mgr_line) and mgr_line != '':
-                managers = [m.strip() for m in mgr_line.split('->')]
-                # Store the full chain for each user
-                manager_hierarchy[row['Email']] = managers
+        manager_chains = [
+            [m.strip() for m in mgr_line.split('->')] if pd.notna(mgr_line) and mgr_line != '' else None
+            for mgr_line in df['ManagerLine']
+        ]
         
         # Pre-compute manager counts for efficiency (avoid O(n³) complexity)
         manager_counts = {}  # {(manager, level): count}
         
         # First pass: count all manager relationships
-        for _, row in df.iterrows():
-            mgr_line = row.get('ManagerLine', '')
-            if pd.notna(mgr_line) and mgr_line != '':
-                managers = [m.strip() for m in mgr_line.split('->')]
+        for managers in manager_chains:
+            if managers is not None:
                 for i, manager in enumerate(managers):
                     key = (manager, i)
                     manager_counts[key] = manager_counts.get(key, 0) + 1
         
         # Second pass: assign effective managers using pre-computed counts
-        for idx, row in df.iterrows():
-            mgr_line = row.get('ManagerLine', '')
-            if pd.notna(mgr_line) and mgr_line != '':
-                managers = [m.strip() for m in mgr_line.split('->')]
-                
-                # Start from immediate manager and work up
-                for i, manager in enumerate(managers):
-                    key = (manager, i)
-                    users_under_manager = manager_counts.get(key, 0)
-                    
-                    # If this manager has 5+ users, use them as the effective manager
-                    if users_under_manager >= self.MIN_PEER_GROUP_SIZE:
-                        df.at[idx, 'effective_manager'] = manager
-                        df.at[idx, 'management_level'] = i
-                        break
-                
-                # If no manager has 5+ users, use the highest level available
-                if df.at[idx, 'effective_manager'] is None and managers:
-                    df.at[idx, 'effective_manager'] = managers[-1]  # Top of chain
-                    df.at[idx, 'management_level'] = len(managers) - 1
-            else:
+        effective_managers = []
+        management_levels = []
+        for managers in manager_chains:
+            if managers is None:
                 # No manager line - mark as CEO/Top
-                df.at[idx, 'effective_manager'] = 'No Manager Data'
-                df.at[idx, 'management_level'] = -1
+                effective_managers.append('No Manager Data')
+                management_levels.append(-1)
+                continue
+            
+            # Start from immediate manager and work up
+            effective_manager = None
+            for i, manager in enumerate(managers):
+                # If this manager has 5+ users, use them as the effective manager
+                if manager_counts.get((manager, i), 0) >= self.MIN_PEER_GROUP_SIZE:
+                    effective_manager, level = manager, i
+                    break
+            
+            # If no manager has 5+ users, use the highest level available
+            if effective_manager is None:
+                effective_manager, level = managers[-1], len(managers) - 1  # Top of chain
+            effective_managers.append(effective_manager)
+            management_levels.append(level)
+        
+        # Work on a narrow frame holding only the columns the summary needs, not a copy of every metric
+        team_df = pd.DataFrame({
+            'effective_manager': effective_managers,
+            'Email': df['Email'].to_numpy(),
+            'rui_score': df['rui_score'].to_numpy(),
+            'license_risk': df['license_risk'].to_numpy(),
+            'management_level': np.asarray(management_levels, dtype=float),
+        })
         
         # Group by effective manager
-        summary = df.groupby('effective_manager').agg({
+        summary = team_df.groupby('effective_manager').agg({
             'Email': 'count',
             'rui_score': 'mean',
             'license_risk': lambda x: (x.str.startswith('High')).sum(),
@@ -533,34 +531,26 @@ class RUICalculator:
         })
         
         # Add medium and low risk counts
-        for manager in summary.index:
-            manager_df = df[df['effective_manager'] == manager]
-            summary.loc[manager, 'medium_risk_count'] = (
-                manager_df['license_risk'].str.startswith('Medium')
-            ).sum()
-            summary.loc[manager, 'low_risk_count'] = (
-                manager_df['license_risk'].str.startswith('Low')
-            ).sum()
-            # New users are counted separately
-            summary.loc[manager, 'new_user_count'] = (
-                manager_df['license_risk'].str.contains('New User')
-            ).sum()
-            summary.loc[manager, 'action_required'] = (
-                summary.loc[manager, 'high_risk_count']
-            )
-            
-            # Add organization level descriptor
-            level = summary.loc[manager, 'mgmt_level']
+        risk_by_manager = team_df['license_risk'].groupby(team_df['effective_manager'])
+        summary['medium_risk_count'] = risk_by_manager.apply(lambda x: x.str.startswith('Medium').sum())
+        summary['low_risk_count'] = risk_by_manager.apply(lambda x: x.str.startswith('Low').sum())
+        # New users are counted separately
+        summary['new_user_count'] = risk_by_manager.apply(lambda x: x.str.contains('New User').sum())
+        summary['action_required'] = summary['high_risk_count']
+        
+        # Add organization level descriptor
+        def get_org_level(level):
             if level == -1:
-                summary.loc[manager, 'org_level'] = 'No Data'
+                return 'No Data'
             elif level == 0:
-                summary.loc[manager, 'org_level'] = 'Direct Manager'
+                return 'Direct Manager'
             elif level == 1:
-                summary.loc[manager, 'org_level'] = 'Skip-Level'
+                return 'Skip-Level'
             elif level == 2:
-                summary.loc[manager, 'org_level'] = 'Department'
-            else:
-                summary.loc[manager, 'org_level'] = f'Level {level+1}'
+                return 'Department'
+            return f'Level {level+1}'
+        
+        summary['org_level'] = summary['mgmt_level'].map(get_org_level)
         
         summary = summary.reset_index()
         
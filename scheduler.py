@@ -0,0 +1,221 @@
+"""
+Scheduler
+Estimates each analysis job's peak memory and runtime from its inputs, and admits jobs only
+while their combined estimates fit the configured budget; the rest wait in a FIFO queue
+"""
+
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from memory_guard import estimate_ingest_bytes
+
+
+# Cost model, calibrated on weekly activity exports (one row per licensed user per report).
+# Per-user work (metrics, RUI peer groups, workbook rows) dominates both memory and time.
+BASE_JOB_BYTES = 32 * 1024 ** 2
+BYTES_PER_USER = 64 * 1024
+BASE_JOB_SECONDS = 2.0
+SECONDS_PER_USER = 0.02
+SECONDS_PER_ROW = 0.0002
+
+SAMPLE_BYTES = 256 * 1024
+XLSX_BYTES_PER_ROW = 40
+
+
+class JobEstimate:
+    """Predicted cost of one analysis"""
+
+    def __init__(self, rows: int, users: int, ingest_bytes: int):
+        self.rows = rows
+        self.users = users
+        self.ingest_bytes = ingest_bytes
+        self.memory_bytes = int(BASE_JOB_BYTES + ingest_bytes + users * BYTES_PER_USER)
+        self.seconds = BASE_JOB_SECONDS + users * SECONDS_PER_USER + rows * SECONDS_PER_ROW
+
+    def to_dict(self) -> Dict:
+        return {
+            'rows': self.rows,
+            'users': self.users,
+            'memory_mb': round(self.memory_bytes / 1024 ** 2, 1),
+            'seconds': round(self.seconds, 1),
+        }
+
+
+def _gzip_sample(path: str) -> Tuple[bytes, int]:
+    """First SAMPLE_BYTES of decompressed data and the exact compressed bytes they came from"""
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    sample, compressed = b'', 0
+    with open(path, 'rb') as f:
+        while len(sample) < SAMPLE_BYTES:
+            block = f.read(16 * 1024)
+            if not block:
+                break
+            sample += decompressor.decompress(block, SAMPLE_BYTES - len(sample))
+            compressed += len(block) - len(decompressor.unconsumed_tail)
+            if decompressor.unconsumed_tail or decompressor.eof:
+                break
+    return sample, max(compressed, 1)
+
+
+def estimate_rows(path: str) -> int:
+    """Data rows in a report, extrapolated from the line density of a sample of the file"""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return 0
+    lower = path.lower()
+    if lower.endswith(('.xlsx', '.xls')):
+        return size // XLSX_BYTES_PER_ROW
+    try:
+        if lower.endswith('.gz'):
+            sample, compressed = _gzip_sample(path)
+            # Compressed bytes consumed for the sample give the compression ratio
+            expanded = len(sample) * size / compressed if len(sample) >= SAMPLE_BYTES else len(sample)
+        else:
+            with open(path, 'rb') as f:
+                sample = f.read(SAMPLE_BYTES)
+            expanded = size
+    except (OSError, zlib.error):
+        return 0
+    lines = sample.count(b'\n')
+    if not sample or not lines:
+        return 0
+    if len(sample) >= expanded:
+        return max(lines - 1, 0)  # whole file sampled: exact, minus the header
+    return int(expanded * lines / len(sample))
+
+
+def estimate_job(usage_paths: Iterable[str], target_path: Optional[str] = None) -> JobEstimate:
+    """Estimate a job from file sizes, report row counts and the implied user count"""
+    usage_paths = list(usage_paths)
+    report_rows = [estimate_rows(path) for path in usage_paths]
+    # Each report lists every licensed user once, so the largest report approximates the population
+    users = max(report_rows, default=0)
+    if target_path and os.path.exists(target_path):
+        target_rows = estimate_rows(target_path)
+        if target_rows:
+            users = min(users, target_rows) if users else target_rows
+    return JobEstimate(sum(report_rows), users, estimate_ingest_bytes(usage_paths))
+
+
+class JobScheduler:
+    """
+    Admission control for analysis jobs
+
+    A job starts when its estimated memory fits next to the running jobs' estimates and a
+    concurrency slot is free. Queued jobs start strictly in arrival order; a job larger than
+    the whole budget starts once it is alone. on_queue_change(job_id, position, eta_seconds)
+    is called for every queued job whenever the queue moves.
+    """
+
+    def __init__(self, memory_budget_bytes: Optional[int], max_concurrent: int = 2,
+                 on_queue_change: Optional[Callable[[str, int, float], None]] = None):
+        self.memory_budget_bytes = memory_budget_bytes
+        self.max_concurrent = max(1, max_concurrent)
+        self.on_queue_change = on_queue_change
+        self._running: Dict[str, Tuple[JobEstimate, float]] = {}
+        self._queue: Deque[Tuple[str, JobEstimate, Callable[[], None]]] = deque()
+        self._lock = threading.Lock()
+
+    def _fits(self, estimate: JobEstimate) -> bool:
+        if len(self._running) >= self.max_concurrent:
+            return False
+        if not self._running or not self.memory_budget_bytes:
+            return True
+        reserved = sum(running.memory_bytes for running, _ in self._running.values())
+        return reserved + estimate.memory_bytes <= self.memory_budget_bytes
+
+    def submit(self, job_id: str, estimate: JobEstimate, start: Callable[[], None]) -> int:
+        """Start the job now or queue it; returns its queue position (0 = started)"""
+        with self._lock:
+            if not self._queue and self._fits(estimate):
+                self._running[job_id] = (estimate, time.time())
+                position = 0
+            else:
+                self._queue.append((job_id, estimate, start))
+                position = len(self._queue)
+        if position == 0:
+            start()
+        else:
+            self._notify()
+        return position
+
+    def finished(self, job_id: str) -> None:
+        """Release a running job's reservation and start whatever now fits"""
+        with self._lock:
+            self._running.pop(job_id, None)
+        self._drain()
+
+    def remove(self, job_id: str) -> bool:
+        """Drop a job that is still queued (e.g. cancelled); True if it was queued"""
+        with self._lock:
+            for entry in self._queue:
+                if entry[0] == job_id:
+                    self._queue.remove(entry)
+                    break
+            else:
+                return False
+        self._drain()
+        return True
+
+    def _drain(self) -> None:
+        to_start = []
+        with self._lock:
+            while self._queue and self._fits(self._queue[0][1]):
+                job_id, estimate, start = self._queue.popleft()
+                self._running[job_id] = (estimate, time.time())
+                to_start.append(start)
+        for start in to_start:
+            start()
+        self._notify()
+
+    def queue_status(self) -> List[Tuple[str, int, float]]:
+        """(job_id, position, expected seconds until start) for every queued job"""
+        with self._lock:
+            now = time.time()
+            # Simulate running jobs finishing at their estimated end times, in order
+            finish_times = sorted(max(started + estimate.seconds, now) for estimate, started in self._running.values())
+            status = []
+            clock = now
+            for position, (job_id, estimate, _) in enumerate(self._queue, start=1):
+                if finish_times:
+                    clock = max(clock, finish_times.pop(0))
+                status.append((job_id, position, clock - now))
+                finish_times.append(clock + estimate.seconds)
+                finish_times.sort()
+            return status
+
+    def running_count(self) -> int:
+        with self._lock:
+            return len(self._running)
+
+    def queued_count(self) -> int:
+        with self._lock:
+            return len(self._queue)
+
+    def _notify(self) -> None:
+        if self.on_queue_change is None:
+            return
+        for job_id, position, eta in self.queue_status():
+            self.on_queue_change(job_id, position, eta)
+
+
+def format_wait(seconds: float) -> str:
+    """Human-readable wait, e.g. 'under a minute' or '~4 min'"""
+    if seconds < 60:
+        return 'under a minute'
+    return f"~{int(round(seconds / 60))} min"
+
+
+def default_memory_budget_bytes(configured_mb: Optional[float]) -> Optional[int]:
+    """Configured budget, or 75% of physical memory when it can be determined"""
+    if configured_mb:
+        return int(configured_mb * 1024 ** 2)
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.75)
+    except (ValueError, OSError, AttributeError):
+        return None
@@ -0,0 +1,219 @@
+"""
+Synthetic Data
+Seeded generator for weekly CopilotActivityUserDetail-shaped usage reports and a matching
+manager.tree-shaped target file, for benchmarks and scale tests
+
+Example:
+    python synthetic_data.py --users 20000 --weeks 26 --depth 5 --fan-out 8 --out data/20k
+"""
+
+import argparse
+import csv
+import os
+import sys
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from usage_reader import REPORT_DATE_COLUMN, UPN_COLUMN
+
+
+DEFAULT_TOOLS = [
+    'Microsoft Teams Copilot', 'Word Copilot', 'Excel Copilot', 'PowerPoint Copilot',
+    'Outlook Copilot', 'OneNote Copilot', 'Loop Copilot', 'Copilot Chat',
+]
+
+FIRST_NAMES = [
+    'Olivia', 'Liam', 'Emma', 'Noah', 'Amelia', 'Oliver', 'Ava', 'Elijah', 'Sophia', 'Lucas',
+    'Mia', 'Mateo', 'Isla', 'Arjun', 'Priya', 'Wei', 'Yuki', 'Fatima', 'Omar', 'Chloe',
+]
+LAST_NAMES = [
+    'Smith', 'Jones', 'Garcia', 'Patel', 'Brown', 'Nguyen', 'Kim', 'Muller', 'Rossi', 'Silva',
+    'Chen', 'Khan', 'Taylor', 'Martin', 'Cohen', 'Okafor', 'Novak', 'Dubois', 'Tanaka', 'Walsh',
+]
+COMPANIES = ['Contoso Consumer', 'Contoso Health', 'Contoso Tech']
+CITIES = ['London', 'Warren NJ', 'Singapore', 'Weybridge', 'Dublin', 'Shanghai', 'Sao Paulo', 'Pune']
+
+# Adoption curves: the week each user starts using Copilot, as a fraction of the period
+ADOPTION_CURVES = ('s-curve', 'linear', 'early', 'immediate')
+
+
+def adoption_weeks(rng: np.random.Generator, users: int, weeks: int, curve: str) -> np.ndarray:
+    """Week index in which each user starts using Copilot (weeks = never within the period)"""
+    if curve == 'immediate':
+        fraction = np.zeros(users)
+    elif curve == 'linear':
+        fraction = rng.random(users)
+    elif curve == 'early':
+        fraction = rng.exponential(0.25, users)
+    elif curve == 's-curve':
+        fraction = rng.logistic(0.5, 0.12, users)
+    else:
+        raise ValueError(f"Unknown adoption curve '{curve}'. Available: {', '.join(ADOPTION_CURVES)}")
+    # About a tenth of the licensed users never adopt
+    never = rng.random(users) < 0.1
+    return np.where(never, weeks, np.clip(np.floor(fraction * weeks), 0, weeks)).astype(int)
+
+
+def build_org(rng: np.random.Generator, users: int, depth: int, fan_out: int,
+              domain: str = 'contoso.com') -> pd.DataFrame:
+    """
+    A manager hierarchy with `depth` manager levels above the individual contributors
+
+    ManagerLine lists the immediate manager first and the top of the tree last, as in
+    manager.tree; names are unique so the RUI calculator can match managers to their emails.
+    """
+    if users < 1:
+        raise ValueError("users must be at least 1")
+    depth, fan_out = max(1, depth), max(1, fan_out)
+    level_sizes = [1]
+    remaining = users - 1
+    for _ in range(depth - 1):
+        if remaining <= 0:
+            break
+        size = min(level_sizes[-1] * fan_out, remaining)
+        level_sizes.append(size)
+        remaining -= size
+    if remaining > 0:
+        level_sizes.append(remaining)
+
+    width = len(str(users))
+    first = rng.integers(0, len(FIRST_NAMES), users)
+    last = rng.integers(0, len(LAST_NAMES), users)
+    # Fixed-width suffixes keep names unique and never a prefix of one another
+    names = [f"{FIRST_NAMES[f]} {LAST_NAMES[l]}{i:0{width}d}" for i, (f, l) in enumerate(zip(first, last))]
+    emails = [f"{FIRST_NAMES[f].lower()}.x.{LAST_NAMES[l].lower()}{i:0{width}d}@{domain}"
+              for i, (f, l) in enumerate(zip(first, last))]
+
+    manager_lines = [''] * users
+    branch = np.zeros(users, dtype=int)  # index of the level-1 manager each person reports into
+    start = 0
+    previous = []
+    for level, size in enumerate(level_sizes):
+        members = list(range(start, start + size))
+        for position, person in enumerate(members):
+            if level == 0:
+                continue
+            manager = previous[position % len(previous)]
+            manager_lines[person] = names[manager] if level == 1 else f"{names[manager]} -> {manager_lines[manager]}"
+            branch[person] = person if level == 1 else branch[manager]
+        previous = members
+        start += size
+
+    branch_ids = np.unique(branch)
+    branch_department = {b: f"Department {i + 1:02d}" for i, b in enumerate(branch_ids)}
+    branch_company = {b: COMPANIES[i % len(COMPANIES)] for i, b in enumerate(branch_ids)}
+    org = pd.DataFrame({
+        'UserPrincipalName': emails,
+        'Company': [branch_company[b] for b in branch],
+        'Department': [branch_department[b] for b in branch],
+        'City': [CITIES[c] for c in rng.integers(0, len(CITIES), users)],
+        'ManagerLine': manager_lines,
+        'DisplayName': names,
+    })
+    # Exports are not ordered by hierarchy
+    return org.iloc[rng.permutation(users)].reset_index(drop=True)
+
+
+def _date_strings(days: np.ndarray) -> np.ndarray:
+    """Days since the epoch (NaN = no activity) as ISO dates, '' for missing"""
+    missing = np.isnan(days)
+    values = np.where(missing, 0, days).astype('int64').astype('datetime64[D]')
+    return np.where(missing, '', np.datetime_as_string(values, unit='D'))
+
+
+def generate_dataset(out_dir: str, users: int = 1000, weeks: int = 26, tools: int = len(DEFAULT_TOOLS),
+                     depth: int = 4, fan_out: int = 8, adoption: str = 's-curve', file_format: str = 'csv',
+                     seed: int = 0, start_date: str = '2025-01-06', domain: str = 'contoso.com') -> Dict:
+    """
+    Write one usage report per week plus manager_tree.csv into out_dir
+
+    Every licensed user appears in every weekly report. Last-activity dates carry over between
+    weeks, users adopt according to the chosen curve, and about 15% of adopters stop using
+    Copilot part-way through, so every classification and risk level is represented.
+
+    Returns {'usage': [report paths], 'target': target path, 'rows': total report rows}.
+    """
+    if not 1 <= tools <= len(DEFAULT_TOOLS):
+        raise ValueError(f"tools must be between 1 and {len(DEFAULT_TOOLS)}")
+    if file_format not in ('csv', 'csv.gz', 'xlsx'):
+        raise ValueError("file_format must be 'csv', 'csv.gz' or 'xlsx'")
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+
+    org = build_org(rng, users, depth, fan_out, domain)
+    target_path = os.path.join(out_dir, 'manager_tree.csv')
+    org.drop(columns='DisplayName').to_csv(target_path, index=False, quoting=csv.QUOTE_ALL)
+
+    tool_names = DEFAULT_TOOLS[:tools]
+    adopt_week = adoption_weeks(rng, users, weeks, adoption)
+    churn_week = np.where(rng.random(users) < 0.15, rng.integers(0, weeks + 1, users), weeks + 1)
+    churn_week = np.maximum(churn_week, adopt_week + 1)
+    intensity = rng.beta(2.0, 2.0, users)  # chance of being active in a given week
+    breadth = rng.beta(1.5, 3.0, (users, tools)) * np.linspace(1.0, 0.4, tools)  # chance per tool
+    # Users join the license pool during the period too; some report rows predate adoption
+    licensed_week = np.minimum(rng.integers(-weeks, weeks, users).clip(min=0), adopt_week)
+    upn = org['UserPrincipalName'].to_numpy()
+    # Exports mix upper-case UPNs in
+    upn = np.where(rng.random(users) < 0.05, np.char.upper(upn.astype(str)), upn)
+    display_names = org['DisplayName'].to_numpy()
+
+    start_day = int(np.datetime64(start_date, 'D').astype('int64'))
+    last_activity = np.full((users, tools), np.nan)
+    paths, total_rows = [], 0
+    for week in range(weeks):
+        report_day = start_day + 7 * week
+        active = (week >= adopt_week) & (week < churn_week) & (rng.random(users) < intensity)
+        used = active[:, None] & (rng.random((users, tools)) < breadth)
+        days = report_day - rng.integers(1, 8, (users, tools))
+        last_activity = np.where(used, days, last_activity)
+
+        in_report = week >= licensed_week
+        report = {
+            REPORT_DATE_COLUMN: np.datetime_as_string(np.datetime64(report_day, 'D'), unit='D'),
+            UPN_COLUMN: upn[in_report],
+            'Display Name': display_names[in_report],
+        }
+        for t, tool in enumerate(tool_names):
+            report[f'Last activity date of {tool} (UTC)'] = _date_strings(last_activity[in_report, t])
+        frame = pd.DataFrame(report)
+        total_rows += len(frame)
+
+        stem = os.path.join(out_dir, f"CopilotActivityUserDetail_week{week + 1:03d}")
+        if file_format == 'xlsx':
+            path = stem + '.xlsx'
+            frame.to_excel(path, index=False)
+        else:
+            path = stem + '.' + file_format
+            frame.to_csv(path, index=False)
+        paths.append(path)
+    return {'usage': paths, 'target': target_path, 'rows': total_rows}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic Copilot usage reports and a manager tree.")
+    parser.add_argument('--out', required=True, help="Output directory")
+    parser.add_argument('--users', type=int, default=1000, help="Licensed users (1k-500k)")
+    parser.add_argument('--weeks', type=int, default=26, help="Weekly reports to generate")
+    parser.add_argument('--tools', type=int, default=len(DEFAULT_TOOLS), help="Copilot tools per report")
+    parser.add_argument('--depth', type=int, default=4, help="Manager levels above individual contributors")
+    parser.add_argument('--fan-out', type=int, default=8, help="Direct reports per manager")
+    parser.add_argument('--adoption', choices=ADOPTION_CURVES, default='s-curve', help="Adoption curve")
+    parser.add_argument('--format', dest='file_format', choices=['csv', 'csv.gz', 'xlsx'], default='csv')
+    parser.add_argument('--seed', type=int, default=0, help="Random seed; the same seed gives identical files")
+    parser.add_argument('--start-date', default='2025-01-06', help="Refresh date of the first report")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    options = vars(args)
+    out_dir = options.pop('out')
+    dataset = generate_dataset(out_dir, **options)
+    print(f"Wrote {len(dataset['usage'])} reports ({dataset['rows']} rows) and {dataset['target']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
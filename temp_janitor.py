@@ -0,0 +1,155 @@
+"""
+Temp Janitor
+Keeps temp_uploads bounded: session folders expire after a period without access, the whole
+folder is held under a global quota, and folders with running jobs are never deleted
+"""
+
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class QuotaExceeded(Exception):
+    """Raised when an upload would take a session past its disk quota"""
+
+
+def folder_size(path: str) -> int:
+    """Total size in bytes of the files under path"""
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, name))
+            except OSError:
+                pass
+    return total
+
+
+class TempJanitor:
+    """
+    Expires and evicts session folders under root
+
+    A folder's mtime is its last access: requests touch it explicitly, and adding files
+    updates it too. Jobs hold a reference on their session while they run.
+    """
+
+    def __init__(self, root: str, ttl_seconds: float, session_quota_bytes: Optional[int] = None,
+                 global_quota_bytes: Optional[int] = None):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.session_quota_bytes = session_quota_bytes
+        self.global_quota_bytes = global_quota_bytes
+        self._active = Counter()
+        self._lock = threading.Lock()
+
+    def session_folder(self, session_id: str) -> str:
+        return os.path.join(self.root, session_id)
+
+    def touch(self, session_id: str) -> None:
+        """Record an access so the session's files outlive the TTL"""
+        folder = self.session_folder(session_id)
+        if os.path.isdir(folder):
+            os.utime(folder)
+
+    def acquire(self, session_id: str) -> None:
+        """Protect a session's folder from deletion until the matching release()"""
+        with self._lock:
+            self._active[session_id] += 1
+
+    def release(self, session_id: str) -> None:
+        with self._lock:
+            self._active[session_id] -= 1
+            if self._active[session_id] <= 0:
+                del self._active[session_id]
+        self.touch(session_id)
+
+    @contextmanager
+    def active(self, session_id: str):
+        """Hold the session's folder for the duration of a block"""
+        self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release(session_id)
+
+    def is_active(self, session_id: str) -> bool:
+        with self._lock:
+            return self._active[session_id] > 0
+
+    def check_session_quota(self, session_id: str, incoming_bytes: int) -> None:
+        """Raise QuotaExceeded if adding incoming_bytes would take the session over its quota"""
+        if not self.session_quota_bytes:
+            return
+        used = folder_size(self.session_folder(session_id))
+        if used + max(incoming_bytes, 0) > self.session_quota_bytes:
+            raise QuotaExceeded(
+                f"This session already stores {used / 1024 ** 2:.0f} MB of uploads; the limit is "
+                f"{self.session_quota_bytes / 1024 ** 2:.0f} MB. Refresh the page to start a new session."
+            )
+
+    def _remove(self, session_id: str, last_access: float) -> bool:
+        """Delete a session folder unless it became active or was accessed since it was scanned"""
+        folder = self.session_folder(session_id)
+        with self._lock:
+            if self._active[session_id] > 0:
+                return False
+            try:
+                if os.path.getmtime(folder) > last_access:
+                    return False
+            except OSError:
+                return False
+            if os.path.isdir(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+            else:
+                os.remove(folder)
+        return True
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """Remove expired sessions, then evict least recently used ones above the global quota"""
+        if not os.path.isdir(self.root):
+            return []
+        now = time.time() if now is None else now
+        entries = []
+        for entry in os.scandir(self.root):
+            try:
+                entries.append((entry.stat().st_mtime, entry.name))
+            except OSError:
+                continue
+
+        removed = []
+        remaining = []
+        for last_access, session_id in entries:
+            if now - last_access > self.ttl_seconds and self._remove(session_id, last_access):
+                removed.append(session_id)
+            else:
+                remaining.append((last_access, session_id))
+
+        if self.global_quota_bytes:
+            sizes = {session_id: folder_size(self.session_folder(session_id)) for _, session_id in remaining}
+            total = sum(sizes.values())
+            for last_access, session_id in sorted(remaining):
+                if total <= self.global_quota_bytes:
+                    break
+                if self._remove(session_id, last_access):
+                    removed.append(session_id)
+                    total -= sizes[session_id]
+        return removed
+
+    def run(self, sleep, interval_seconds: float) -> None:
+        """Sweep forever; sleep is the server's cooperative sleep (e.g. socketio.sleep)"""
+        while True:
+            try:
+                removed = self.sweep()
+                if removed:
+                    logger.info("Temp janitor removed %d session folder(s)", len(removed))
+            except Exception:
+                logger.exception("Temp janitor sweep failed")
+            sleep(interval_seconds)
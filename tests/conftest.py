@@ -1,4 +1,23 @@
 import sys
 import os
 
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
\ No newline at end of file
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+@pytest.fixture(autouse=True)
+def isolated_dataset_cache(tmp_path, monkeypatch):
+    """Give each test its own dataset/result cache instead of the shared one in the working tree"""
+    import dataset_cache
+    monkeypatch.setattr(dataset_cache, '_shared_cache',
+                        dataset_cache.DatasetCache(str(tmp_path / 'dataset_cache'), 512 * 1024 ** 2))
+
+
+@pytest.fixture(autouse=True)
+def isolated_leaderboard_store(tmp_path, monkeypatch):
+    """Keep the app's stored leaderboards out of the working tree"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        from leaderboard_store import LeaderboardStore
+        monkeypatch.setattr(app_module, 'leaderboard_store', LeaderboardStore(str(tmp_path / 'leaderboard.sqlite3')))
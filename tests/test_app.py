@@ -1,13 +1,16 @@
 import pytest
 from app import app
 from config import TARGET_PRESETS
+import io
 import json
 
 @pytest.fixture
-def client():
+def client(tmp_path):
     app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
     with app.test_client() as client:
         yield client
+    app.config['TEMP_FOLDER'] = 'temp_uploads'
 
 def test_index_no_target(client):
     rv = client.get('/')
@@ -28,3 +31,25 @@ def test_index_invalid_target(client):
     rv = client.get('/?target=invalid')
     assert rv.status_code == 200
     assert b"window.preSelectedManagers = [];" in rv.data
+
+def test_preset_upload_served_from_preloaded_preset(client, monkeypatch):
+    """Uploading a preset's own target file returns its filter lists without reading the file"""
+    import presets
+    preset = presets.get_preset('qsc')
+    assert preset is not None
+    monkeypatch.setattr(presets, 'read_filter_frame', lambda path: pytest.fail("target file was read"))
+    client.get('/?target=qsc')
+    with open(preset.file_path, 'rb') as f:
+        rv = client.post('/upload?target=qsc', data={'file': (f, 'qsc_target_users.csv'), 'file_type': 'target'})
+    assert rv.status_code == 200
+    filters = rv.get_json()['filters']
+    assert filters['managers'] == TARGET_PRESETS['qsc']['managers']
+    assert filters['companies'] == preset.filter_options()['companies']
+
+def test_other_target_upload_lists_its_managers(client):
+    """Any other target file is read for its own filter lists"""
+    client.get('/')
+    csv = b"UserPrincipalName,Company,Department,City,ManagerLine\na@example.com,Contoso,Sales,Paris,Boss -> Big Boss\n"
+    rv = client.post('/upload', data={'file': (io.BytesIO(csv), 'other_target.csv'), 'file_type': 'target'})
+    assert rv.status_code == 200
+    assert rv.get_json()['filters']['managers'] == ['Big Boss', 'Boss']
@@ -0,0 +1,93 @@
+"""Test ZIP and gzip usage report uploads"""
+
+import gzip
+import io
+import os
+import sys
+import zipfile
+
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app
+from usage_reader import read_usage_report
+
+
+USAGE_CSV = """Report Refresh Date,User Principal Name,Last activity date of Word Copilot (UTC)
+2025-03-01,user1@example.com,2025-02-27
+2025-03-01,user2@example.com,
+"""
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    with app.test_client() as client:
+        client.get('/')
+        yield client
+    app.config['TEMP_FOLDER'] = 'temp_uploads'
+
+
+def _zip_bytes(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+def _upload(client, data, filename):
+    return client.post('/upload', data={'file': (data, filename), 'file_type': 'usage'},
+                       content_type='multipart/form-data')
+
+
+def test_zip_upload_registers_each_report(client):
+    """Every report in a ZIP is extracted and registered for analysis"""
+    archive = _zip_bytes({
+        'week1/2025_03_01_CopilotActivityUserDetail.csv': USAGE_CSV,
+        'week2/2025_03_01_CopilotActivityUserDetail.csv': USAGE_CSV,
+        '__MACOSX/._2025_03_01_CopilotActivityUserDetail.csv': 'junk',
+        'notes.txt': 'not a report'
+    })
+    rv = _upload(client, archive, 'reports.zip')
+    assert rv.status_code == 200
+    result = rv.get_json()
+    assert result['status'] == 'success'
+    assert result['filenames'] == [
+        '2025_03_01_CopilotActivityUserDetail.csv.gz',
+        '2025_03_01_CopilotActivityUserDetail_2.csv.gz'
+    ]
+
+    with client.session_transaction() as sess:
+        usage_paths = sess['file_paths']['usage']
+    assert sorted(usage_paths) == sorted(result['filenames'])
+    for path in usage_paths.values():
+        df = read_usage_report(path)
+        assert df['User Principal Name'].tolist() == ['user1@example.com', 'user2@example.com']
+
+
+def test_gzip_upload_is_read_compressed(client):
+    """A .csv.gz report is stored as uploaded and decompressed while reading"""
+    rv = _upload(client, io.BytesIO(gzip.compress(USAGE_CSV.encode('utf-8'))), 'weekly.csv.gz')
+    assert rv.get_json()['filenames'] == ['weekly.csv.gz']
+
+    with client.session_transaction() as sess:
+        path = sess['file_paths']['usage']['weekly.csv.gz']
+    df = read_usage_report(path)
+    assert len(df) == 2
+    assert df['Last activity date of Word Copilot (UTC)'].iloc[0] == pd.Timestamp('2025-02-27')
+
+
+def test_invalid_zip_is_rejected(client):
+    """Corrupt or report-less archives return a clear error"""
+    rv = _upload(client, io.BytesIO(b'not a zip'), 'reports.zip')
+    assert rv.status_code == 400
+    assert 'ZIP' in rv.get_json()['message']
+
+    rv = _upload(client, _zip_bytes({'readme.txt': 'hello'}), 'empty.zip')
+    assert rv.status_code == 400
+    assert 'usage reports' in rv.get_json()['message']
@@ -0,0 +1,66 @@
+"""Test the stage benchmark suite and its regression check"""
+
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+from benchmark import STAGES, benchmark_scale, compare, main
+from synthetic_data import generate_dataset
+
+
+def test_compare_flags_slower_and_larger_stages():
+    baseline = {'1000': {'execute_analysis': {'seconds': 10.0, 'peak_mb': 100.0},
+                         'deep_dive': {'seconds': 1.0, 'peak_mb': 10.0}}}
+    current = {'1000': {'execute_analysis': {'seconds': 14.0, 'peak_mb': 110.0},
+                        'deep_dive': {'seconds': 1.1, 'peak_mb': 20.0}}}
+    regressions = compare(current, baseline, tolerance=0.25)
+    assert len(regressions) == 2
+    assert regressions[0].startswith('execute_analysis @ 1000 users: seconds')
+    assert regressions[1].startswith('deep_dive @ 1000 users: peak_mb')
+    assert compare(current, baseline, tolerance=1.5) == []
+
+
+def test_compare_ignores_noise_on_fast_stages_and_new_entries():
+    """Millisecond stages doubling is timer noise; stages or scales without a baseline are skipped"""
+    baseline = {'250': {'get_manager_summary': {'seconds': 0.01, 'peak_mb': 0.2}}}
+    current = {'250': {'get_manager_summary': {'seconds': 0.03, 'peak_mb': 0.5},
+                       'deep_dive': {'seconds': 5.0}},
+               '5000': {'get_manager_summary': {'seconds': 9.0}}}
+    assert compare(current, baseline, tolerance=0.25, min_seconds=0.05, min_mb=1.0) == []
+
+
+def test_every_stage_runs_on_a_small_dataset(tmp_path):
+    dataset = generate_dataset(str(tmp_path / 'data'), users=40, weeks=20, seed=3)
+    results = benchmark_scale(dataset, repeat=1, memory=True)
+    assert list(results) == list(STAGES)
+    for stage, result in results.items():
+        assert result['seconds'] > 0, stage
+        assert result['peak_mb'] > 0, stage
+
+
+def test_main_writes_history_and_fails_on_regression(tmp_path, capsys, monkeypatch):
+    folder = str(tmp_path)
+    args = ['--folder', folder, '--scales', '30', '--weeks', '20', '--repeat', '1', '--no-memory',
+            '--stages', 'get_manager_summary', 'usage_complexity']
+    assert main(args + ['--update-baseline']) == 0
+    baseline_path = os.path.join(folder, 'baseline.json')
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    assert set(baseline['results']['30']) == {'get_manager_summary', 'usage_complexity'}
+
+    # A baseline that is far faster than anything achievable must be reported as a regression
+    for result in baseline['results']['30'].values():
+        result['seconds'] = 1e-6
+    with open(baseline_path, 'w') as f:
+        json.dump(baseline, f)
+    monkeypatch.setattr(config, 'BENCHMARK_MIN_SECONDS', 0)
+    assert main(args + ['--tolerance', '0']) == 1
+    assert 'regression' in capsys.readouterr().out
+
+    with open(os.path.join(folder, 'history.jsonl')) as f:
+        history = [json.loads(line) for line in f]
+    assert len(history) == 2
+    assert set(history[0]['results']['30']) == {'get_manager_summary', 'usage_complexity'}
@@ -0,0 +1,103 @@
+"""Test the resumable chunked upload protocol"""
+
+import hashlib
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app
+from chunked_upload import ChunkedUploadManager, chunk_checksum
+from usage_reader import read_usage_report
+
+
+USAGE_CSV = ("Report Refresh Date,User Principal Name,Last activity date of Word Copilot (UTC)\n"
+             + "".join(f"2025-03-01,user{i}@example.com,2025-02-27\n" for i in range(200))).encode('utf-8')
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    with app.test_client() as client:
+        client.get('/')
+        yield client
+    app.config['TEMP_FOLDER'] = 'temp_uploads'
+
+
+def _start(client, data, filename, file_type='usage'):
+    rv = client.post('/upload/chunked', json={'filename': filename, 'file_type': file_type, 'total_size': len(data)})
+    assert rv.status_code == 200
+    return rv.get_json()['upload_id']
+
+
+def _put(client, upload_id, data, offset, checksum=None):
+    return client.put(f'/upload/chunked/{upload_id}?offset={offset}', data=data,
+                      headers={'X-Chunk-Checksum': checksum or chunk_checksum(data)})
+
+
+def test_chunked_upload_assembles_file_and_hash(client):
+    """Chunks are appended in order and the final file carries its SHA-256"""
+    upload_id = _start(client, USAGE_CSV, 'weekly.csv')
+    for offset in range(0, len(USAGE_CSV), 1000):
+        rv = _put(client, upload_id, USAGE_CSV[offset:offset + 1000], offset)
+        assert rv.status_code == 200
+    rv = client.post(f'/upload/chunked/{upload_id}/complete')
+    result = rv.get_json()
+    assert result['status'] == 'success'
+    assert result['filenames'] == ['weekly.csv']
+    assert result['content_hash'] == hashlib.sha256(USAGE_CSV).hexdigest()
+
+    with client.session_transaction() as sess:
+        path = sess['file_paths']['usage']['weekly.csv']
+        assert sess['file_hashes'][path] == result['content_hash']
+    assert len(read_usage_report(path)) == 200
+
+
+def test_bad_chunks_are_rejected(client):
+    """Corrupt chunks, wrong offsets and early completion leave the upload resumable"""
+    upload_id = _start(client, USAGE_CSV, 'weekly.csv')
+    assert _put(client, upload_id, USAGE_CSV[:1000], 0, checksum='00000000').status_code == 422
+    assert _put(client, upload_id, USAGE_CSV[1000:2000], 1000).status_code == 409
+    assert client.post(f'/upload/chunked/{upload_id}/complete').status_code == 409
+
+    assert _put(client, upload_id, USAGE_CSV[:1000], 0).get_json()['received'] == 1000
+    assert client.get(f'/upload/chunked/{upload_id}').get_json()['received'] == 1000
+
+
+def test_upload_resumes_after_restart(client):
+    """A fresh manager (e.g. after a server restart) picks up the partial file and its hash"""
+    upload_id = _start(client, USAGE_CSV, 'weekly.csv')
+    _put(client, upload_id, USAGE_CSV[:1500], 0)
+
+    original = app_module.chunked_uploads
+    app_module.chunked_uploads = ChunkedUploadManager(original.max_upload_bytes)
+    try:
+        status = client.get(f'/upload/chunked/{upload_id}').get_json()
+        assert status['received'] == 1500
+        _put(client, upload_id, USAGE_CSV[1500:], 1500)
+        result = client.post(f'/upload/chunked/{upload_id}/complete').get_json()
+    finally:
+        app_module.chunked_uploads = original
+    assert result['content_hash'] == hashlib.sha256(USAGE_CSV).hexdigest()
+
+
+def test_chunked_zip_upload_and_size_limit(client):
+    """Archives uploaded in chunks are extracted like direct uploads; oversized files are refused"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('week1.csv', USAGE_CSV)
+    data = buffer.getvalue()
+    upload_id = _start(client, data, 'reports.zip')
+    _put(client, upload_id, data, 0)
+    result = client.post(f'/upload/chunked/{upload_id}/complete').get_json()
+    assert result['filenames'] == ['week1.csv.gz']
+
+    rv = client.post('/upload/chunked', json={'filename': 'huge.csv', 'file_type': 'usage',
+                                              'total_size': app_module.config.MAX_UPLOAD_BYTES + 1})
+    assert rv.status_code == 413
@@ -0,0 +1,93 @@
+"""Test the headless command-line runner"""
+
+import json
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cli
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+user2@example.com,2024-02-01,2024-01-20,2024-01-25
+"""
+
+TARGET_CSV = """UserPrincipalName,Company,Department,City,ManagerLine
+user1@example.com,Contoso,Sales,Paris,Boss -> Lead A
+user2@example.com,Contoso,Finance,Lyon,Boss -> Lead B
+"""
+
+
+def _inputs(tmp_path):
+    reports = tmp_path / 'reports'
+    reports.mkdir()
+    (reports / 'week1.csv').write_text(USAGE_CSV)
+    (reports / 'notes.txt').write_text('ignored')
+    target = tmp_path / 'target.csv'
+    target.write_text(TARGET_CSV)
+    return str(reports), str(target)
+
+
+def test_collect_usage_files_expands_directories_and_archives(tmp_path):
+    """Directories contribute their reports and ZIP archives are extracted"""
+    reports, _ = _inputs(tmp_path)
+    archive_path = tmp_path / 'more.zip'
+    with zipfile.ZipFile(str(archive_path), 'w') as archive:
+        archive.writestr('week2.csv', USAGE_CSV)
+
+    files = cli.collect_usage_files([reports, str(archive_path)], str(tmp_path / 'extract'))
+    assert sorted(files) == ['week1.csv', 'week2.csv.gz']
+    assert all(os.path.exists(path) for path in files.values())
+
+
+def test_single_run_writes_outputs(tmp_path):
+    """A single run writes the workbook, leaderboard, metrics table and dashboard summary"""
+    reports, target = _inputs(tmp_path)
+    out = tmp_path / 'out'
+    assert cli.main(['--usage', reports, '--target', target, '--out', str(out), '--name', 'weekly']) == 0
+
+    written = sorted(os.listdir(str(out / 'weekly')))
+    assert 'copilot_usage_report.xlsx' in written
+    assert 'leaderboard.html' in written
+    assert any(name.startswith('user_metrics.') for name in written)
+    dashboard = json.loads((out / 'weekly' / 'dashboard.json').read_text())
+    assert dashboard['dashboard']['total'] == 2
+
+
+def test_parallel_runs_from_config(tmp_path):
+    """Several filter configurations run in worker processes, each into its own folder"""
+    reports, target = _inputs(tmp_path)
+    runs_file = tmp_path / 'runs.json'
+    runs_file.write_text(json.dumps([
+        {'name': 'lead a', 'filters': {'managers': ['Lead A']}},
+        {'name': 'everyone'},
+        {'name': 'nobody', 'filters': {'managers': ['Nobody']}},
+    ]))
+    out = tmp_path / 'out'
+
+    code = cli.main(['--usage', reports, '--target', target, '--runs', str(runs_file),
+                     '--workers', '2', '--out', str(out)])
+
+    assert code == 1  # the 'nobody' run matches no users
+    lead_a = json.loads((out / 'lead_a' / 'dashboard.json').read_text())
+    everyone = json.loads((out / 'everyone' / 'dashboard.json').read_text())
+    assert lead_a['dashboard']['total'] == 1
+    assert everyone['dashboard']['total'] == 2
+    assert not (out / 'nobody' / 'dashboard.json').exists()
+
+
+def test_missing_excel_report_fails_the_run(tmp_path, monkeypatch):
+    """A run whose workbook could not be built reports an error instead of crashing"""
+    reports, target = _inputs(tmp_path)
+    out = tmp_path / 'out'
+    monkeypatch.setattr(cli.CopilotAnalyzer, 'create_excel_report', lambda self, *args, **kwargs: None)
+    assert cli.main(['--usage', reports, '--target', target, '--out', str(out), '--name', 'weekly']) == 1
+
+    written = sorted(os.listdir(str(out / 'weekly')))
+    assert 'copilot_usage_report.xlsx' not in written
+    assert 'leaderboard.html' in written
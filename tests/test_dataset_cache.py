@@ -0,0 +1,86 @@
+"""Test the content-addressed dataset cache"""
+
+import os
+import sys
+import time
+
+import pandas as pd
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis_logic
+from analysis_logic import CopilotAnalyzer
+from dataset_cache import DatasetCache, combined_usage_key, content_hash, usage_report_key
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+User1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def test_keys_depend_on_content_and_order():
+    """Keys are stable for the same hashes and differ by kind and report order"""
+    assert usage_report_key('abc') == usage_report_key('abc')
+    assert usage_report_key('abc') != usage_report_key('abd')
+    assert combined_usage_key(['a', 'b']) != combined_usage_key(['b', 'a'])
+    assert usage_report_key('a') != combined_usage_key(['a'])
+
+
+def test_lru_eviction(tmp_path):
+    """Least-recently-read entries are evicted first once the cap is exceeded"""
+    frame = pd.DataFrame({'x': range(1000)})
+    probe = DatasetCache(str(tmp_path / 'probe'), 10 ** 9)
+    probe.put('probe', frame)
+    entry_size = probe.size_bytes()
+
+    cache = DatasetCache(str(tmp_path / 'cache'), int(entry_size * 2.5))
+    cache.put('a', frame)
+    cache.put('b', frame)
+    past = time.time() - 60
+    os.utime(os.path.join(cache.folder, 'a.pkl'), (past, past))
+    os.utime(os.path.join(cache.folder, 'b.pkl'), (past - 60, past - 60))
+    assert cache.get('b') is not None  # reading b makes a the least recently used
+
+    cache.put('c', frame)
+    assert cache.contains('b') and cache.contains('c')
+    assert not cache.contains('a')
+    assert cache.size_bytes() <= cache.max_bytes
+
+
+def test_disabled_cache_is_a_no_op(tmp_path):
+    cache = DatasetCache(str(tmp_path), 0)
+    cache.put('a', pd.DataFrame({'x': [1]}))
+    assert cache.get('a') is None
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_identical_upload_in_another_session_is_not_reparsed(tmp_path, monkeypatch):
+    """A second analyzer reading a byte-identical file gets the parsed frame from the cache"""
+    cache = DatasetCache(str(tmp_path / 'cache'), 10 ** 9)
+    paths = []
+    for session in ['session1', 'session2']:
+        folder = tmp_path / session
+        folder.mkdir()
+        (folder / 'usage.csv').write_text(USAGE_CSV)
+        paths.append(str(folder / 'usage.csv'))
+
+    first = CopilotAnalyzer(None, None)
+    first.dataset_cache = cache
+    expected = first.load_usage_reports({'usage.csv': paths[0]})
+    assert cache.contains(usage_report_key(content_hash(paths[0])))
+
+    def fail(*args, **kwargs):
+        raise AssertionError("report should come from the cache")
+    monkeypatch.setattr(analysis_logic, 'read_usage_report', fail)
+
+    second = CopilotAnalyzer(None, None)
+    second.dataset_cache = cache
+    pd.testing.assert_frame_equal(second.load_usage_reports({'usage.csv': paths[1]}), expected)
+    assert expected['User Principal Name'].tolist()[0] == 'user1@example.com'
+
+    # A different combination still reuses the per-report entries
+    pd.testing.assert_frame_equal(
+        second.load_usage_reports({'a.csv': paths[0], 'b.csv': paths[1]}),
+        pd.concat([expected, expected], ignore_index=True)
+    )
@@ -0,0 +1,79 @@
+"""Test format-aware date parsing for usage reports"""
+
+import pandas as pd
+import pytest
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import date_parsing
+from date_parsing import (
+    MIXED_FORMAT, clear_format_cache, detected_formats, parse_date_column,
+    parse_date_columns, sniff_date_format
+)
+
+
+def test_sniff_common_formats():
+    """Sniffer detects the exact format of a column from its values"""
+    assert sniff_date_format(pd.Series(['2025-01-31', '2025-02-01', None])) == '%Y-%m-%d'
+    assert sniff_date_format(pd.Series(['01/31/2025', '02/01/2025'])) == '%m/%d/%Y'
+    assert sniff_date_format(pd.Series(['31/01/2025', '01/02/2025'])) == '%d/%m/%Y'
+    assert sniff_date_format(pd.Series(['2025-01-31 08:15:00'])) == '%Y-%m-%d %H:%M:%S'
+    assert sniff_date_format(pd.Series([None, None])) is None
+
+
+def test_fixed_format_matches_mixed_parsing():
+    """Fixed-format parsing gives the same dates as mixed parsing"""
+    values = pd.Series(['2025-01-31', None, '2025-03-15', '2024-12-01'])
+    parsed, fmt = parse_date_column(values)
+    assert fmt == '%Y-%m-%d'
+    expected = pd.to_datetime(values, errors='coerce', format='mixed')
+    pd.testing.assert_series_equal(parsed, expected, check_dtype=False)
+
+
+def test_inconsistent_column_falls_back_to_mixed():
+    """Columns whose values don't share one format use mixed parsing"""
+    values = pd.Series(['2025-01-31', 'March 3, 2025', '02/01/2025'])
+    parsed, fmt = parse_date_column(values)
+    assert fmt == MIXED_FORMAT
+    assert parsed.notna().all()
+    assert parsed.iloc[1] == pd.Timestamp('2025-03-03')
+
+
+def test_formats_remembered_per_layout():
+    """Detected formats are cached per report layout and re-detected when they stop fitting"""
+    clear_format_cache()
+    columns = ['User Principal Name', 'Report Refresh Date', 'Last activity date of Copilot Chat (UTC)']
+    first = pd.DataFrame([['a@x.com', '2025-01-31', '2025-01-20']], columns=columns)
+    parse_date_columns(first)
+    assert detected_formats(columns) == {
+        'Report Refresh Date': '%Y-%m-%d',
+        'Last activity date of Copilot Chat (UTC)': '%Y-%m-%d'
+    }
+    assert pd.api.types.is_datetime64_any_dtype(first['Report Refresh Date'])
+
+    # Same layout, different export locale: the stale format is replaced
+    second = pd.DataFrame([['b@x.com', '01/31/2025', None]], columns=columns)
+    parse_date_columns(second)
+    assert detected_formats(columns)['Report Refresh Date'] == '%m/%d/%Y'
+    assert second['Report Refresh Date'].iloc[0] == pd.Timestamp('2025-01-31')
+    # An empty column keeps the format learned earlier
+    assert detected_formats(columns)['Last activity date of Copilot Chat (UTC)'] == '%Y-%m-%d'
+    clear_format_cache()
+
+
+def test_mixed_column_skips_sniffing(monkeypatch):
+    """A column remembered as mixed-format goes straight to mixed parsing on later reports"""
+    clear_format_cache()
+    columns = ['User Principal Name', 'Report Refresh Date']
+    parse_date_columns(pd.DataFrame([['a@x.com', '2025-01-31'], ['b@x.com', 'March 3, 2025']], columns=columns))
+    assert detected_formats(columns)['Report Refresh Date'] == MIXED_FORMAT
+
+    def fail_sniff(values, sample_size=None):
+        pytest.fail("mixed-format column was sniffed again")
+    monkeypatch.setattr(date_parsing, 'sniff_date_format', fail_sniff)
+    later = pd.DataFrame([['c@x.com', '02/01/2025'], ['d@x.com', '2025-02-03']], columns=columns)
+    parse_date_columns(later)
+    assert later['Report Refresh Date'].tolist() == [pd.Timestamp('2025-02-01'), pd.Timestamp('2025-02-03')]
+    assert detected_formats(columns)['Report Refresh Date'] == MIXED_FORMAT
+    clear_format_cache()
@@ -0,0 +1,78 @@
+"""Test the golden-output harness that checks analysis engines against the reference"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from golden import check_engines, diff_frames, values_equal
+from rui_calculator import RUICalculator
+from synthetic_data import generate_dataset
+
+
+@pytest.fixture(scope='module')
+def dataset(tmp_path_factory):
+    generated = generate_dataset(str(tmp_path_factory.mktemp('golden')), users=60, weeks=20, seed=5)
+    return {os.path.basename(path): path for path in generated['usage']}, generated['target']
+
+
+def test_reference_engines_match_themselves(dataset):
+    usage_files, target = dataset
+    assert check_engines(usage_files, target, {}) == []
+
+
+def test_a_diverging_engine_is_reported(dataset, monkeypatch):
+    """A candidate that changes one user's consistency is reported with that user's email"""
+    def perturbed(self, *args):
+        records = self._user_metrics_reference(*args)
+        records[0]['Usage Consistency (%)'] += 1.0
+        return records
+    monkeypatch.setattr(CopilotAnalyzer, '_user_metrics_perturbed', perturbed, raising=False)
+    monkeypatch.setitem(CopilotAnalyzer.USER_METRICS_ENGINES, 'perturbed', '_user_metrics_perturbed')
+
+    usage_files, target = dataset
+    diffs = check_engines(usage_files, target, {'user_metrics': 'perturbed'})
+    consistency = [d for d in diffs if d.startswith("utilized_metrics_df['Usage Consistency (%)']: 1 of 60 rows differ")]
+    assert len(consistency) == 1
+    assert '@contoso.com' in consistency[0]
+
+
+def test_diff_frames_applies_tolerances():
+    expected = pd.DataFrame({
+        'Email': ['a@x.com', 'b@x.com'],
+        'Score': [1.0, np.nan],
+        'Seen': pd.to_datetime(['2025-01-01', None]),
+        'Trend Details': [{'recent_avg': 1.0}, {}],
+    })
+    close = expected.copy()
+    close['Score'] = [1.0 + 1e-12, np.nan]
+    close['Trend Details'] = [{'recent_avg': 1.0 + 1e-12}, {}]
+    assert diff_frames(expected, close, 'users') == []
+
+    far = expected.copy()
+    far['Score'] = [1.1, np.nan]
+    far['Seen'] = pd.to_datetime(['2025-01-02', None])
+    diffs = diff_frames(expected, far, 'users')
+    assert len(diffs) == 2
+    assert diffs[0].startswith("users['Score']: 1 of 2 rows differ (a@x.com: 1.0 != 1.1")
+
+    assert diff_frames(expected, expected.drop(columns='Seen'), 'users') == ["users: missing columns ['Seen']"]
+    assert diff_frames(expected, expected.iloc[:1], 'users') == ['users: expected 2 rows, got 1']
+    assert diff_frames(None, pd.DataFrame(), 'summary') == []
+
+
+def test_values_equal():
+    assert values_equal(pd.NaT, None)
+    assert not values_equal(pd.NaT, pd.Timestamp('2025-01-01'))
+    assert values_equal([1, {'a': 2.0}], [1, {'a': 2.0 + 1e-12}])
+    assert not values_equal({'a': 1}, {'b': 1})
+
+
+def test_unknown_engine_is_rejected():
+    calculator = RUICalculator('2025-06-30', engines={'peer_groups': 'missing'})
+    with pytest.raises(ValueError, match="Unknown peer_groups engine 'missing'"):
+        calculator._assign_peer_groups(pd.DataFrame({'Email': ['a@x.com']}))
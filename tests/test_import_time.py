@@ -0,0 +1,48 @@
+"""Test that the web process starts without the plotting and Excel libraries, within a time budget"""
+
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative `import app` time reported by -X importtime; measured at about 1s,
+# almost all of it pandas, Flask and eventlet. matplotlib and openpyxl used to add ~1.5s.
+IMPORT_BUDGET_SECONDS = 3.0
+DEFERRED_PACKAGES = ('matplotlib', 'openpyxl')
+
+STARTUP_SCRIPT = """
+import json, sys
+import app
+app.app.config['TESTING'] = True
+with app.app.test_client() as client:
+    status = client.get('/').status_code
+print(json.dumps({'status': status, 'loaded': sorted({m.split('.')[0] for m in sys.modules})}))
+"""
+
+
+def _run(*args):
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True, timeout=120)
+
+
+def test_index_is_served_without_plotting_or_excel_libraries():
+    result = _run('-c', STARTUP_SCRIPT)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['status'] == 200
+    assert not set(DEFERRED_PACKAGES) & set(report['loaded'])
+
+
+def test_app_import_time_budget():
+    result = _run('-X', 'importtime', '-c', 'import app')
+    assert result.returncode == 0, result.stderr
+    # Lines look like "import time:   self [us] | cumulative | package"
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, total, name = line.split('|')
+            if total.strip().isdigit():
+                cumulative[name.strip()] = int(total)
+    assert 'app' in cumulative
+    assert cumulative['app'] / 1e6 < IMPORT_BUDGET_SECONDS, f"import app took {cumulative['app'] / 1e6:.2f}s"
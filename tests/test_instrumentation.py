@@ -0,0 +1,98 @@
+"""Test per-stage timing instrumentation of the analysis pipeline"""
+
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from instrumentation import RSS_SAMPLE_INTERVAL, StageTimings
+from progress import NullProgressSink
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def test_stage_records():
+    """Stages record wall/CPU time, rows and memory, and failed stages are flagged"""
+    timings = StageTimings()
+    with timings.stage('ok') as stage:
+        stage.rows = 3
+    with pytest.raises(ValueError):
+        with timings.stage('broken'):
+            raise ValueError('boom')
+    manual = timings.start('manual')
+    manual.stop(rows=7)
+    manual.stop(rows=99)  # stopping twice keeps the first record
+
+    records = {record['stage']: record for record in timings.to_list()}
+    assert list(records) == ['ok', 'broken', 'manual']
+    assert records['ok']['rows'] == 3 and 'error' not in records['ok']
+    assert records['broken']['error'] is True
+    assert records['manual']['rows'] == 7
+    for record in records.values():
+        assert record['wall_seconds'] >= 0 and record['cpu_seconds'] >= 0
+        assert record['peak_rss_mb'] >= 0
+
+
+def test_peak_memory_is_per_stage():
+    """A stage's peak covers memory it freed before finishing, and not what earlier stages used"""
+    timings = StageTimings()
+    with timings.stage('spike'):
+        block = np.ones(16 * 1024 * 1024)  # 128 MB
+        time.sleep(RSS_SAMPLE_INTERVAL * 4)
+        del block
+    with timings.stage('after'):
+        time.sleep(RSS_SAMPLE_INTERVAL * 2)
+
+    spike, after = timings.to_list()
+    assert spike['peak_rss_mb'] >= spike['rss_mb'] + 100
+    assert after['peak_rss_mb'] < spike['peak_rss_mb'] - 100
+    assert not timings._running
+
+
+@pytest.mark.parametrize('usage, target, stages', [
+    ({}, None, ['result_cache_lookup', 'load_usage_reports', 'total']),
+    ({'usage.csv': 'usage.csv'}, 'target.csv', ['result_cache_lookup', 'load_usage_reports', 'apply_filters', 'total']),
+])
+def test_early_returns_finish_their_stages(tmp_path, usage, target, stages):
+    """Runs that stop early (no readable reports, no matching users) still record every stage they began"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    (tmp_path / 'target.csv').write_text("UserPrincipalName,DisplayName,ManagerLine\nother@example.com,Other,Boss\n")
+    analyzer = CopilotAnalyzer(progress=NullProgressSink())
+    results = analyzer.execute_analysis({name: str(tmp_path / path) for name, path in usage.items()},
+                                        str(tmp_path / target) if target else None, {})
+    assert 'error' in results
+    assert [record['stage'] for record in results['timings']] == stages
+    assert not analyzer.timings._running
+
+
+def test_analysis_returns_and_logs_timings(tmp_path, caplog):
+    """Each run returns its stage breakdown and logs it as one JSON line; cache hits report their own"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    usage = {'usage.csv': str(tmp_path / 'usage.csv')}
+
+    with caplog.at_level(logging.INFO, logger='instrumentation'):
+        results = CopilotAnalyzer(progress=NullProgressSink()).execute_analysis(usage, None, {})
+    stages = [record['stage'] for record in results['timings']]
+    for expected in ['load_usage_reports', 'user_metrics', 'rui.peer_groups', 'usage_complexity',
+                     'excel_report', 'leaderboard_html', 'total']:
+        assert expected in stages
+    assert stages[-1] == 'total'
+    assert next(r for r in results['timings'] if r['stage'] == 'load_usage_reports')['rows'] == 3
+
+    logged = json.loads(caplog.records[-1].getMessage())
+    assert logged['event'] == 'analysis_timings' and logged['cached'] is False
+    assert [record['stage'] for record in logged['stages']] == stages
+
+    replayed = CopilotAnalyzer(progress=NullProgressSink()).execute_analysis(usage, None, {})
+    assert [record['stage'] for record in replayed['timings']] == ['result_cache_lookup', 'total']
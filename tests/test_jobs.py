@@ -0,0 +1,158 @@
+"""Test the analysis job registry, cancellation and re-attaching clients"""
+
+import os
+import sys
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from analysis_logic import CopilotAnalyzer
+from app import app, job_registry, socketio
+from jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobCancelled, JobRegistry
+from progress import MemoryProgressSink
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+@pytest.fixture
+def client(tmp_path):
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    with app.test_client() as client:
+        client.get('/')
+        yield client
+    app.config['TEMP_FOLDER'] = 'temp_uploads'
+
+
+def _user_id(client):
+    with client.session_transaction() as sess:
+        return sess['user_id']
+
+
+def test_job_lifecycle_and_expiry():
+    """Jobs move through their states and finished ones expire after the retention period"""
+    registry = JobRegistry(retention_seconds=60)
+    job = registry.create('user-a')
+    assert job.state == QUEUED
+    registry.start(job)
+    assert job.state == RUNNING
+    registry.finish(job, {'dashboard': {}})
+    assert job.state == DONE and job.finished_at is not None
+    assert not registry.cancel(job)
+
+    assert registry.get(job.id, owner='user-b') is None
+    assert registry.get(job.id, owner='user-a') is job
+    assert registry.expire(now=job.finished_at + 61) == 1
+    assert registry.get(job.id) is None
+
+
+def test_cancellation_stops_analysis_between_stages(tmp_path):
+    """A cancelled job raises at the analyzer's next stage and is not swallowed by stage fallbacks"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    registry = JobRegistry(retention_seconds=60)
+    job = registry.create('user-a')
+    sink = MemoryProgressSink()
+
+    def cancel_after_metrics():
+        if any(message.startswith('3.') for message in sink.messages):
+            registry.cancel(job)
+        job.check_cancelled()
+
+    runner = CopilotAnalyzer(progress=sink, cancel_check=cancel_after_metrics)
+    with pytest.raises(JobCancelled):
+        runner.execute_analysis({'usage.csv': str(tmp_path / 'usage.csv')}, None, {})
+    assert not any(message.startswith('5.') for message in sink.messages)
+    assert not any(name.startswith('result-') for name in os.listdir(runner.dataset_cache.folder))
+
+
+def test_background_run_records_outcome(client, tmp_path, monkeypatch):
+    """The background task marks jobs done or cancelled and emits to the job's room"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    emitted = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None: emitted.append((event, to)))
+    user_id = _user_id(client)
+    usage = {'usage.csv': str(tmp_path / 'usage.csv')}
+
+    job = job_registry.create(user_id)
+    runner = CopilotAnalyzer(progress=MemoryProgressSink(), cancel_check=job.check_cancelled)
+    app_module.run_analysis_and_emit(job, runner, usage, None, {}, user_id)
+    assert job.state == DONE
+    assert job.result['job_id'] == job.id
+    assert emitted[-1] == ('analysis_complete', f'job:{job.id}')
+
+    cancelled = job_registry.create(user_id)
+    job_registry.cancel(cancelled)
+    runner = CopilotAnalyzer(progress=MemoryProgressSink(), cancel_check=cancelled.check_cancelled)
+    app_module.run_analysis_and_emit(cancelled, runner, usage, None, {}, user_id)
+    assert cancelled.state == CANCELLED
+    assert emitted[-1] == ('analysis_cancelled', f'job:{cancelled.id}')
+
+
+def test_rest_endpoints(client):
+    """Status, result and cancel endpoints only expose the session's own jobs"""
+    user_id = _user_id(client)
+    done = job_registry.create(user_id)
+    job_registry.finish(done, {'dashboard': {'total': 3}, 'reports': {}})
+    queued = job_registry.create(user_id)
+    foreign = job_registry.create('someone-else')
+
+    assert client.get(f'/jobs/{done.id}').get_json()['state'] == DONE
+    assert client.get(f'/jobs/{done.id}/result').get_json()['dashboard'] == {'total': 3}
+    assert client.get(f'/jobs/{queued.id}/result').status_code == 409
+    assert client.post(f'/jobs/{queued.id}/cancel').status_code == 200
+    assert queued.cancel_event.is_set()
+    assert client.post(f'/jobs/{done.id}/cancel').status_code == 409
+    assert client.get(f'/jobs/{foreign.id}').status_code == 404
+    assert {job['job_id'] for job in client.get('/jobs').get_json()['jobs']} >= {done.id, queued.id}
+
+    failed = job_registry.create(user_id)
+    job_registry.fail(failed, 'boom')
+    assert client.get(f'/jobs/{failed.id}/result').get_json()['message'] == 'boom'
+    assert failed.state == FAILED
+
+
+def test_reconnecting_client_reattaches(client):
+    """A new socket can attach to a finished job and receives its result again"""
+    user_id = _user_id(client)
+    job = job_registry.create(user_id)
+    job_registry.finish(job, {'dashboard': {'total': 1}, 'reports': {}, 'job_id': job.id})
+
+    socket_client = socketio.test_client(app, flask_test_client=client)
+    socket_client.emit('attach_job', {'job_id': job.id})
+    received = {message['name']: message['args'][0] for message in socket_client.get_received()}
+    assert received['job_status']['state'] == DONE
+    assert received['analysis_complete']['dashboard'] == {'total': 1}
+
+    socket_client.emit('attach_job', {'job_id': 'missing'})
+    assert socket_client.get_received()[-1]['args'][0]['state'] == 'unknown'
+    socket_client.disconnect()
+
+
+def test_leaderboard_endpoint_pages_finished_job(client, tmp_path):
+    """A finished analysis stores its users, served a page at a time from /jobs/<id>/leaderboard"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    user_id = _user_id(client)
+    job = job_registry.create(user_id)
+    runner = CopilotAnalyzer(progress=MemoryProgressSink(), cancel_check=job.check_cancelled)
+    app_module.run_analysis_and_emit(job, runner, {'usage.csv': str(tmp_path / 'usage.csv')}, None, {}, user_id)
+    assert job.result['leaderboard'] == {'url': f'/jobs/{job.id}/leaderboard', 'users': 2}
+
+    page = client.get(f'/jobs/{job.id}/leaderboard?per_page=1').get_json()
+    assert (page['total'], page['pages'], len(page['rows'])) == (2, 2, 1)
+    assert page['rows'][0]['global_rank'] == 1
+    searched = client.get(f'/jobs/{job.id}/leaderboard?q=USER2').get_json()
+    assert [row['email'] for row in searched['rows']] == ['user2@example.com']
+    assert client.get(f'/jobs/{job.id}/leaderboard?sort=nope').status_code == 400
+
+    queued = job_registry.create(user_id)
+    assert client.get(f'/jobs/{queued.id}/leaderboard').status_code == 409
+    unsaved = job_registry.create(user_id)
+    job_registry.finish(unsaved, {'dashboard': {}, 'reports': {}})
+    assert client.get(f'/jobs/{unsaved.id}/leaderboard').status_code == 404
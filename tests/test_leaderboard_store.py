@@ -0,0 +1,88 @@
+"""Test the SQLite store behind the paginated leaderboard API"""
+
+import os
+import sys
+
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from leaderboard_store import LeaderboardQueryError, LeaderboardStore
+
+
+def metrics_df():
+    return pd.DataFrame({
+        'Email': ['Ann@example.com', 'bob@example.com', 'cy_1@example.com', 'dee%@example.com', 'eve@example.com'],
+        'Global Rank': [1, 2, 3, 4, 5],
+        'Classification': ['Power User', 'Consistent User', 'Power User', 'Coaching Opportunity', 'New User'],
+        'Engagement Score': [0.9, 0.7, 0.8, 0.2, None],
+        'Avg Tools / Report': [3.0, 1.0, 2.5, 0.5, 4.0],
+        'Overall Recency': pd.to_datetime(['2024-03-01', '2024-02-01', None, '2024-01-15', '2024-03-02']),
+        'license_risk': ['Low', 'Medium', 'Low', 'High', 'High'],
+        'ManagerLine': ['Lead A -> Director', 'Lead A -> Director', 'Lead B -> Director', 'Director', ''],
+    })
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LeaderboardStore(str(tmp_path / 'leaderboard.sqlite3'))
+    assert store.save('job', metrics_df()) == 5
+    return store
+
+
+def emails(result):
+    return [row['email'] for row in result['rows']]
+
+
+def test_pages_follow_global_rank(store):
+    """Default pages are in global rank order, with totals for the paging controls"""
+    first = store.page('job', per_page=2)
+    assert emails(first) == ['Ann@example.com', 'bob@example.com']
+    assert (first['total'], first['pages']) == (5, 3)
+    assert emails(store.page('job', page=3, per_page=2)) == ['eve@example.com']
+    assert store.page('job', page=4, per_page=2)['rows'] == []
+
+    row = first['rows'][0]
+    assert row['last_active'] == '2024-03-01'
+    assert row['manager'] == 'Lead A'
+    assert row['usage_consistency'] is None  # column missing from the metrics
+    assert store.page('missing') is None
+
+
+def test_sorting_by_indexed_and_unindexed_fields(store):
+    """Any metric sorts both ways; missing values come first ascending"""
+    assert emails(store.page('job', sort='engagement_score', order='desc'))[:2] == ['Ann@example.com', 'cy_1@example.com']
+    assert emails(store.page('job', sort='engagement_score'))[0] == 'eve@example.com'
+    assert emails(store.page('job', sort='avg_tools_per_report', order='desc', per_page=2)) == \
+        ['eve@example.com', 'Ann@example.com']
+    assert emails(store.page('job', sort='last_active', per_page=2, page=2)) == ['bob@example.com', 'Ann@example.com']
+    with pytest.raises(LeaderboardQueryError):
+        store.page('job', sort='rank; DROP TABLE leaderboard')
+    with pytest.raises(LeaderboardQueryError):
+        store.page('job', order='up')
+    with pytest.raises(LeaderboardQueryError):
+        store.page('job', page=0)
+
+
+def test_filters_and_search(store):
+    """Filters ignore case, managers match at any level and search treats wildcards literally"""
+    assert emails(store.page('job', classifications=['power user'])) == ['Ann@example.com', 'cy_1@example.com']
+    assert emails(store.page('job', classifications=['Power User', 'New User'], license_risks=['high'])) == \
+        ['eve@example.com']
+    assert emails(store.page('job', managers=['lead a'])) == ['Ann@example.com', 'bob@example.com']
+    assert store.page('job', managers=['Director'])['total'] == 4
+    assert emails(store.page('job', search='ANN')) == ['Ann@example.com']
+    assert emails(store.page('job', search='_')) == ['cy_1@example.com']
+    assert emails(store.page('job', search='%')) == ['dee%@example.com']
+
+
+def test_resave_replaces_and_prune_drops_old_jobs(store):
+    """Saving a job again replaces its rows; prune removes jobs past their retention"""
+    assert store.save('job', metrics_df().head(2)) == 2
+    assert store.page('job')['total'] == 2
+    assert store.page('job', managers=['Director'])['total'] == 2
+    store.save('other', metrics_df())
+
+    assert store.prune(60) == 0
+    assert store.prune(60, now=pd.Timestamp.now().timestamp() + 120) == 2
+    assert store.page('job') is None and store.page('other') is None
@@ -0,0 +1,54 @@
+"""Test the load-test harness helpers and the server's latency probe"""
+
+import os
+import queue
+import sys
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app, socketio
+from load_test import LoadStats, format_report, latency_summary, wait_for
+
+
+def test_latency_probe_is_acknowledged():
+    socket_client = socketio.test_client(app)
+    ack = socket_client.emit('latency_probe', {}, callback=True)
+    assert ack['server_time'] > 0
+    socket_client.disconnect()
+
+
+def test_latency_summary_percentiles():
+    summary = latency_summary([i / 100 for i in range(1, 101)])
+    assert summary['count'] == 100
+    assert summary['p50'] == pytest.approx(0.505)
+    assert summary['p99'] == pytest.approx(0.9901)
+    assert summary['max'] == 1.0
+    assert latency_summary([]) == {'count': 0}
+
+
+def test_wait_for_skips_other_events_and_times_out():
+    events = queue.Queue()
+    events.put(('status_update', 1.0, {}))
+    events.put(('job_created', 2.0, {'job_id': 'j1'}))
+    assert wait_for(events, {'job_created'}, timeout=1) == ('job_created', 2.0, {'job_id': 'j1'})
+    with pytest.raises(TimeoutError):
+        wait_for(events, {'analysis_complete'}, timeout=0.05)
+
+
+def test_report_lists_latencies_and_grouped_failures():
+    stats = LoadStats()
+    stats.record('deep_dive', 0.2)
+    stats.fail('upload', 'HTTP 413')
+    stats.fail('upload', 'HTTP 413')
+    summary = {
+        'url': 'http://127.0.0.1:5055', 'users': 2, 'wall_seconds': 3.0, 'analyses_completed': 0,
+        'analyses_per_minute': 0, 'deep_dives_completed': 1, 'deep_dives_per_second': 0.33,
+        'latency': {event: latency_summary(values) for event, values in stats.latencies.items()},
+        'stalls': {'threshold_seconds': 0.1, 'probes': 4, 'over_threshold': 1, 'stalled_seconds': 0.5},
+        'failures': [{'event': e, 'message': m, 'count': c} for (e, m), c in stats.failures.items()],
+    }
+    report = format_report(summary)
+    assert 'deep_dive' in report
+    assert '1 of 4 probes waited longer than 0.1s' in report
+    assert '2 x upload: HTTP 413' in report
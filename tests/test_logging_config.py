@@ -0,0 +1,55 @@
+"""Test logging setup and that report generation no longer writes to stdout"""
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from logging_config import configure_logging, stop_logging
+from progress import NullProgressSink
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def _restore(root, handlers, level):
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_levels_and_queued_handler(capsys):
+    """Per-module levels override the root level, and the queued handler delivers every record"""
+    root = logging.getLogger()
+    saved = (list(root.handlers), root.level)
+    try:
+        configure_logging(level='WARNING', module_levels={'demo.verbose': 'DEBUG'}, queued=True, fmt='%(name)s %(message)s')
+        logging.getLogger('demo.quiet').info("hidden")
+        logging.getLogger('demo.verbose').debug("shown %d", 1)
+        stop_logging()  # drains the queue
+        err = capsys.readouterr().err
+        assert 'demo.verbose shown 1' in err
+        assert 'hidden' not in err
+    finally:
+        _restore(root, *saved)
+        logging.getLogger('demo.verbose').setLevel(logging.NOTSET)
+
+
+def test_analysis_does_not_print(tmp_path, capsys, caplog):
+    """Report generation logs through `logging` only; per-row details appear only at DEBUG"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    usage = {'usage.csv': str(tmp_path / 'usage.csv')}
+    with caplog.at_level(logging.DEBUG, logger='analysis_logic'):
+        results = CopilotAnalyzer(progress=NullProgressSink()).run_analysis(usage, None, {})
+    assert 'error' not in results
+    assert capsys.readouterr().out == ''
+    assert any("Processing sheet" in record.getMessage() for record in caplog.records)
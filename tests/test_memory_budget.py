@@ -0,0 +1,85 @@
+"""Test the analysis memory budget and in-place pipeline stages"""
+
+import pandas as pd
+from datetime import datetime, timedelta
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from memory_guard import MemoryBudget, MemoryBudgetExceeded, current_rss_bytes, estimate_ingest_bytes
+from rui_calculator import RUICalculator
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def _write_usage(tmp_path):
+    usage_path = tmp_path / 'usage.csv'
+    usage_path.write_text(USAGE_CSV)
+    return {'usage.csv': str(usage_path)}
+
+
+def test_budget_disabled_never_raises():
+    """A budget of None performs no checks"""
+    budget = MemoryBudget(None)
+    assert not budget.enabled
+    budget.check('stage')
+    budget.check_estimate('stage', 10 ** 15)
+
+
+def test_budget_exceeded_raises_clear_error():
+    """Exceeding the budget raises with the stage name and the budget in the message"""
+    assert current_rss_bytes() > 0
+    budget = MemoryBudget(1)
+    try:
+        budget.check('2. Calculating user metrics')
+        assert False, "Expected MemoryBudgetExceeded"
+    except MemoryBudgetExceeded as e:
+        assert '2. Calculating user metrics' in str(e)
+        assert 'memory budget of 1 MB' in str(e)
+
+
+def test_estimate_scales_with_file_size(tmp_path):
+    """Ingest estimate grows with the size of the files on disk"""
+    files = _write_usage(tmp_path)
+    size = os.path.getsize(files['usage.csv'])
+    assert estimate_ingest_bytes(files.values()) >= size
+    assert estimate_ingest_bytes([str(tmp_path / 'missing.csv')]) == 0
+
+
+def test_analysis_fails_fast_over_budget(tmp_path):
+    """execute_analysis returns an error instead of running when the budget is too small"""
+    runner = CopilotAnalyzer(None, None)
+    runner.update_status = lambda msg: None
+    runner.memory_budget = MemoryBudget(1)
+
+    results = runner.execute_analysis(_write_usage(tmp_path), None, {})
+
+    assert 'error' in results
+    assert 'memory' in results['error'].lower()
+    assert runner.full_usage_data is None
+
+
+def test_rui_does_not_modify_input_frame():
+    """RUI stages add columns in place on their own frame, never on the caller's"""
+    reference_date = datetime.now()
+    users_df = pd.DataFrame({
+        'Email': [f'user{i}@test.com' for i in range(6)],
+        'Overall Recency': [reference_date - timedelta(days=i * 10) for i in range(6)],
+        'Adjusted Consistency (%)': [90, 80, 70, 60, 50, 40],
+        'Avg Tools / Report': [6.0, 5.0, 4.0, 3.0, 2.0, 1.0],
+        'Usage Trend': ['Growing', 'Growing', 'Stable', 'Stable', 'Declining', 'Declining']
+    })
+    original_columns = list(users_df.columns)
+    original_values = users_df.copy()
+
+    result = RUICalculator(reference_date).calculate_rui_scores(users_df)
+
+    assert 'rui_score' in result.columns
+    assert list(users_df.columns) == original_columns
+    pd.testing.assert_frame_equal(users_df, original_values)
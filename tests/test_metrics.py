@@ -0,0 +1,143 @@
+"""Test the in-process metrics registry and the /metrics endpoint"""
+
+import os
+import sys
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+import metrics
+from analysis_logic import CopilotAnalyzer
+from app import app, job_registry, socketio
+from metrics import MetricsRegistry
+from progress import MemoryProgressSink
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def test_text_exposition_format():
+    """Counters, gauges and histograms render with HELP/TYPE lines, labels and cumulative buckets"""
+    registry = MetricsRegistry()
+    requests = registry.counter('demo_requests_total', "Requests", ['path'])
+    requests.inc(path='/a')
+    requests.inc(2, path='/b "quoted"')
+    registry.gauge('demo_temperature', "Temperature", function=lambda: 21.5)
+    sizes = registry.histogram('demo_size_bytes', "Sizes", [10, 100])
+    for value in (5, 50, 500):
+        sizes.observe(value)
+
+    text = registry.render()
+    assert '# TYPE demo_requests_total counter' in text
+    assert 'demo_requests_total{path="/a"} 1' in text
+    assert 'demo_requests_total{path="/b \\"quoted\\""} 2' in text
+    assert 'demo_temperature 21.5' in text
+    assert 'demo_size_bytes_bucket{le="10"} 1' in text
+    assert 'demo_size_bytes_bucket{le="100"} 2' in text
+    assert 'demo_size_bytes_bucket{le="+Inf"} 3' in text
+    assert 'demo_size_bytes_sum 555' in text and 'demo_size_bytes_count 3' in text
+
+    with pytest.raises(ValueError):
+        requests.inc(-1, path='/a')
+    with pytest.raises(ValueError):
+        requests.inc(method='GET')
+    with pytest.raises(ValueError):
+        registry.counter('demo_requests_total', "Duplicate")
+
+
+def test_changes_merge_into_another_registry():
+    """Counter and histogram updates made after a snapshot can be added to a second registry"""
+    def make():
+        registry = MetricsRegistry()
+        registry.counter('demo_total', "Demo", ['kind'])
+        registry.histogram('demo_seconds', "Demo", [1, 10])
+        registry.gauge('demo_level', "Demo").set(7)
+        return registry
+
+    worker, parent = make(), make()
+    worker.get('demo_total').inc(5, kind='old')
+    parent.get('demo_total').inc(1, kind='old')
+    before = worker.snapshot()
+    worker.get('demo_total').inc(2, kind='old')
+    worker.get('demo_total').inc(kind='new')
+    worker.get('demo_seconds').observe(5)
+
+    changes = worker.changes(before)
+    assert 'demo_level' not in changes
+    parent.merge(changes)
+    parent.merge(worker.changes(worker.snapshot()))  # nothing new
+    assert parent.get('demo_total').value(kind='old') == 3
+    assert parent.get('demo_total').value(kind='new') == 1
+    assert parent.get('demo_seconds').count() == 1
+    assert 'demo_seconds_bucket{le="1"} 0' in parent.render() and 'demo_seconds_sum 5' in parent.render()
+
+
+def test_service_feeds_metrics(tmp_path, monkeypatch):
+    """Uploads, job outcomes and cache lookups show up on /metrics"""
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None: None)
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    uploads_before = metrics.UPLOADS.value(kind='usage', outcome='success')
+    done_before = metrics.JOBS_FINISHED.value(state='done')
+    try:
+        with app.test_client() as client:
+            client.get('/')
+            with client.session_transaction() as sess:
+                user_id = sess['user_id']
+            (tmp_path / 'report.csv').write_text(USAGE_CSV)
+            with open(tmp_path / 'report.csv', 'rb') as f:
+                response = client.post('/upload', data={'file': (f, 'usage.csv'), 'file_type': 'usage'})
+            assert response.status_code == 200
+            assert metrics.UPLOADS.value(kind='usage', outcome='success') == uploads_before + 1
+
+            job = job_registry.create(user_id)
+            usage = {'usage.csv': os.path.join(str(tmp_path), user_id, 'usage.csv')}
+            app_module.run_analysis_and_emit(job, CopilotAnalyzer(progress=MemoryProgressSink()), usage, None, {}, user_id)
+            assert metrics.JOBS_FINISHED.value(state='done') == done_before + 1
+
+            response = client.get('/metrics')
+            assert response.status_code == 200
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            text = response.get_data(as_text=True)
+            assert 'copilot_job_duration_seconds_count{state="done"}' in text
+            assert 'copilot_cache_requests_total{kind="result",result="miss"}' in text
+            assert 'copilot_jobs_queued 0' in text
+            assert 'process_resident_memory_bytes' in text
+    finally:
+        app.config['TEMP_FOLDER'] = 'temp_uploads'
+
+
+def test_deep_dives_are_counted(tmp_path):
+    """Deep-dive requests over Socket.IO are counted by outcome"""
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    success_before = metrics.DEEP_DIVES.value(outcome='success')
+    not_found_before = metrics.DEEP_DIVES.value(outcome='not_found')
+    try:
+        with app.test_client() as client:
+            client.get('/')
+            with client.session_transaction() as sess:
+                user_id = sess['user_id']
+            (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+            job = job_registry.create(user_id)
+            usage = {'usage.csv': str(tmp_path / 'usage.csv')}
+            app_module.run_analysis_and_emit(job, CopilotAnalyzer(progress=MemoryProgressSink()), usage, None, {}, user_id)
+
+            socket_client = socketio.test_client(app, flask_test_client=client)
+            socket_client.emit('perform_deep_dive', {'email': 'USER1@example.com'})
+            socket_client.emit('perform_deep_dive', {'email': 'nobody@example.com'})
+            results = [message['args'][0] for message in socket_client.get_received()
+                       if message['name'] == 'deep_dive_result']
+            socket_client.disconnect()
+        assert 'chart_data' in results[0]
+        assert results[1]['chart_user'] is None
+        assert metrics.DEEP_DIVES.value(outcome='success') == success_before + 1
+        assert metrics.DEEP_DIVES.value(outcome='not_found') == not_found_before + 1
+    finally:
+        app.config['TEMP_FOLDER'] = 'temp_uploads'
@@ -0,0 +1,122 @@
+"""Test the preloaded preset hierarchies"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import presets
+from analysis_logic import CopilotAnalyzer
+
+
+TARGET_CSV = """UserPrincipalName,Company,Department,City,ManagerLine
+A@example.com,Contoso,Sales,Paris,Boss -> Big Boss
+b@example.com,Contoso,Sales,Paris,Big Boss
+c@example.com,Fabrikam,IT,Oslo,
+"""
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot
+a@example.com,2024-01-01,2024-01-01
+b@example.com,2024-01-01,2024-01-01
+c@example.com,2024-01-01,2024-01-01
+"""
+
+
+def write_target(tmp_path, name='target.csv', content=TARGET_CSV):
+    path = tmp_path / name
+    path.write_text(content, encoding='utf-8')
+    return str(path)
+
+
+def test_hierarchy_indexes(tmp_path):
+    """Emails and everyone below each manager are indexed case-insensitively"""
+    preset = presets.load_preset('demo', {'file_path': write_target(tmp_path), 'managers': ['Boss']})
+    assert preset.emails == {'a@example.com', 'b@example.com', 'c@example.com'}
+    assert preset.members('big boss') == {'a@example.com', 'b@example.com'}
+    assert preset.members('Boss') == {'a@example.com'}
+    assert preset.members('Nobody') == frozenset()
+    assert list(preset.rows_under(['boss', 'Big Boss'])) == [0, 1]
+    assert presets.load_preset('none', {'managers': ['Boss']}) is None
+
+
+def test_filter_options_match_a_fresh_read(tmp_path):
+    """A preset's filter lists are those of reading its file, with or without the preset's managers"""
+    path = write_target(tmp_path)
+    preset = presets.load_preset('demo', {'file_path': path, 'managers': ['Boss']})
+    fresh = presets.filter_options(presets.read_filter_frame(path))
+    assert preset.filter_options() == fresh
+    assert fresh['managers'] == ['Big Boss', 'Boss']
+    assert fresh['companies'] == ['Contoso', 'Fabrikam']
+    assert preset.filter_options(['Boss'])['managers'] == ['Boss']
+
+
+def test_preload_skips_missing_files(tmp_path):
+    """Presets without a readable target file are left out"""
+    try:
+        loaded = presets.preload({
+            'demo': {'file_path': write_target(tmp_path)},
+            'missing': {'file_path': str(tmp_path / 'missing.csv')},
+            'managers_only': {'managers': ['Boss']},
+        })
+        assert set(loaded) == {'demo'}
+        assert presets.get_preset('missing') is None
+        assert presets.get_preset('managers_only') is None
+    finally:
+        presets.preload()
+
+
+def test_reloaded_when_file_changes(tmp_path):
+    """A preset is re-read once its file's modification time or size changes, and only then"""
+    path = write_target(tmp_path)
+    try:
+        presets.preload({'demo': {'file_path': path}})
+        first = presets.get_preset('demo')
+        assert presets.get_preset('demo') is first
+
+        write_target(tmp_path, content=TARGET_CSV + "d@example.com,Contoso,Sales,Paris,Boss\n")
+        os.utime(path, ns=(first.signature[0] + 10 ** 9, first.signature[0] + 10 ** 9))
+        second = presets.get_preset('demo')
+        assert second is not first
+        assert 'd@example.com' in second.members('Boss')
+        assert presets.preset_for_hash(first.content_hash) is None
+
+        os.remove(path)
+        assert presets.get_preset('demo') is None
+    finally:
+        presets.preload()
+
+
+def test_read_target_file_uses_preloaded_preset(tmp_path):
+    """An upload with the same content as a preloaded preset is served from memory"""
+    try:
+        presets.preload({'demo': {'file_path': write_target(tmp_path)}})
+        uploaded = write_target(tmp_path, 'uploaded.csv')
+        analyzer = CopilotAnalyzer()
+        assert analyzer.read_target_file(uploaded) is presets.get_preset('demo').target_df
+        assert analyzer.target_preset.key == 'demo'
+    finally:
+        presets.preload()
+
+
+def test_manager_filter_matches_without_preset(tmp_path, monkeypatch):
+    """Filtering by manager through the preset index selects the same users as splitting ManagerLine"""
+    monkeypatch.setattr(config, 'RESULT_CACHE_ENABLED', False)
+    usage = tmp_path / 'usage.csv'
+    usage.write_text(USAGE_CSV, encoding='utf-8')
+    uploaded = write_target(tmp_path, 'uploaded.csv')
+    filters = {'companies': [], 'departments': [], 'locations': [], 'managers': [' boss ']}
+
+    def filtered_emails():
+        analyzer = CopilotAnalyzer()
+        analyzer.execute_analysis({'usage.csv': str(usage)}, uploaded, filters)
+        return analyzer, sorted(analyzer.utilized_metrics_df['Email'])
+
+    plain_analyzer, plain = filtered_emails()
+    try:
+        presets.preload({'demo': {'file_path': write_target(tmp_path)}})
+        preset_analyzer, indexed = filtered_emails()
+    finally:
+        presets.preload()
+    assert plain_analyzer.target_preset is None and preset_analyzer.target_preset is not None
+    assert indexed == plain == ['a@example.com']
@@ -0,0 +1,103 @@
+"""Test opt-in profiler capture for analysis jobs"""
+
+import os
+import sys
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from analysis_logic import CopilotAnalyzer
+from app import app, job_registry, socketio
+from jobs import CANCELLED, DONE
+from profiling import profile_call
+from progress import MemoryProgressSink
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def _busy(n):
+    return sum(_square(i) for i in range(n))
+
+
+def _square(i):
+    return i * i
+
+
+def test_profile_call_writes_prof_and_collapsed_stacks(tmp_path):
+    """The result is passed through and both profile formats are written"""
+    result, paths = profile_call(str(tmp_path / 'run'), _busy, 20000)
+    assert result == sum(i * i for i in range(20000))
+    assert os.path.getsize(paths['prof']) > 0
+
+    with open(paths['collapsed'], encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert lines
+    for line in lines:
+        stack, weight = line.rsplit(' ', 1)
+        assert int(weight) > 0
+    assert any(line.startswith('_busy (test_profiling.py') and '_square (test_profiling.py' in line for line in lines)
+
+
+def test_profile_written_when_call_fails(tmp_path):
+    with pytest.raises(ZeroDivisionError):
+        profile_call(str(tmp_path / 'failed'), lambda: 1 / 0)
+    assert os.path.exists(tmp_path / 'failed.prof')
+
+
+def test_nested_profile_runs_unprofiled(tmp_path):
+    """A call made while another profile is being captured still runs, without a profile of its own"""
+    result, paths = profile_call(str(tmp_path / 'outer'), profile_call, str(tmp_path / 'inner'), _busy, 100)
+    assert result == (_busy(100), {})
+    assert paths['prof'].endswith('outer.prof') and not os.path.exists(tmp_path / 'inner.prof')
+    # The lock is released afterwards
+    assert profile_call(str(tmp_path / 'again'), _busy, 100)[1]
+
+
+def test_profiled_job_serves_its_profile(tmp_path, monkeypatch):
+    """A job started with profile=True exposes its profile, even if cancelled; others report none"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None: None)
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    try:
+        with app.test_client() as client:
+            client.get('/')
+            with client.session_transaction() as sess:
+                user_id = sess['user_id']
+            usage = {'usage.csv': str(tmp_path / 'usage.csv')}
+
+            job = job_registry.create(user_id)
+            runner = CopilotAnalyzer(progress=MemoryProgressSink())
+            app_module.run_analysis_and_emit(job, runner, usage, None, {}, user_id, profile=True)
+            assert job.state == DONE and job.to_dict()['artifacts'] == ['profile']
+            assert os.path.dirname(job.artifacts['profile']['prof']) == os.path.join(str(tmp_path), user_id, 'profiles')
+
+            response = client.get(f'/jobs/{job.id}/profile')
+            assert response.status_code == 200 and len(response.data) > 0
+            response = client.get(f'/jobs/{job.id}/profile?format=collapsed')
+            assert b'build_analysis_payload' in response.data
+
+            cancelled = job_registry.create(user_id)
+
+            def cancel_mid_run():
+                cancelled.cancel_event.set()  # as if the user cancelled once the analysis had started
+                cancelled.check_cancelled()
+
+            runner = CopilotAnalyzer(progress=MemoryProgressSink(), cancel_check=cancel_mid_run)
+            app_module.run_analysis_and_emit(cancelled, runner, usage, None, {}, user_id, profile=True)
+            # The profile of the run up to the cancellation is kept
+            assert cancelled.state == CANCELLED and cancelled.to_dict()['artifacts'] == ['profile']
+            assert client.get(f'/jobs/{cancelled.id}/profile').status_code == 200
+
+            plain = job_registry.create(user_id)
+            app_module.run_analysis_and_emit(plain, CopilotAnalyzer(progress=MemoryProgressSink()), usage, None, {}, user_id)
+            assert client.get(f'/jobs/{plain.id}/profile').status_code == 404
+    finally:
+        app.config['TEMP_FOLDER'] = 'temp_uploads'
@@ -0,0 +1,68 @@
+"""Test progress sinks and running the analyzer without Socket.IO"""
+
+import logging
+import multiprocessing
+import os
+import sys
+from unittest.mock import Mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from progress import (FanOutProgressSink, LoggingProgressSink, MemoryProgressSink, NullProgressSink,
+                      QueueProgressSink, SocketIOProgressSink, relay_queue)
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+"""
+
+
+def _publish_from_child(queue):
+    QueueProgressSink(queue, 'child').publish('hello from worker')
+
+
+def test_analysis_reports_to_memory_sink(tmp_path):
+    """The analyzer runs without a socket and reports every stage to the sink"""
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    sink = MemoryProgressSink()
+    results = CopilotAnalyzer(progress=sink).execute_analysis({'usage.csv': str(tmp_path / 'usage.csv')}, None, {})
+
+    assert 'error' not in results
+    assert sink.messages[0] == "1. Loading usage reports from server..."
+    assert "Success! Reports are ready for download." in sink.messages
+
+
+def test_socketio_sink_emits_to_client():
+    """The Socket.IO sink keeps the web app's status_update contract"""
+    socketio = Mock()
+    SocketIOProgressSink(socketio, 'sid-1').publish('Working')
+    socketio.emit.assert_called_once_with('status_update', {'message': 'Working'}, to='sid-1')
+    socketio.sleep.assert_called_once()
+
+    runner = CopilotAnalyzer(socketio, 'sid-2')
+    assert isinstance(runner.progress, SocketIOProgressSink)
+
+
+def test_logging_fan_out_and_null_sinks(caplog):
+    """A fan-out sink delivers each message to every sink it wraps"""
+    memory = MemoryProgressSink()
+    sink = FanOutProgressSink([memory, LoggingProgressSink(logging.getLogger('progress.test')), NullProgressSink()])
+    with caplog.at_level(logging.INFO, logger='progress.test'):
+        sink.publish('step 1')
+    assert memory.messages == ['step 1']
+    assert 'step 1' in caplog.text
+
+
+def test_queue_sink_crosses_processes():
+    """Messages published in a child process are relayed to the sink for their source"""
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_publish_from_child, args=(queue,))
+    process.start()
+    process.join(10)
+
+    received = {}
+    assert relay_queue(queue, lambda source: received.setdefault(source, MemoryProgressSink()), timeout=5) == 1
+    assert received['child'].messages == ['hello from worker']
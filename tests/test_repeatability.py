@@ -6,6 +6,7 @@ import sys
 import hashlib
 import json
 from analysis_logic import CopilotAnalyzer
+from progress import NullProgressSink
 
 def get_results_hash(results):
     """Generate a hash of the results for comparison"""
@@ -44,10 +45,7 @@ def main():
     # Run analysis 5 times
     for i in range(5):
         print(f"\nRun {i+1}...")
-        runner = CopilotAnalyzer(None, None)
-        
-        # Mock the update_status method
-        runner.update_status = lambda msg: None
+        runner = CopilotAnalyzer(progress=NullProgressSink())
         
         results = runner.execute_analysis(usage_files, target_file, filters)
         
@@ -0,0 +1,126 @@
+"""Test memoization of complete analysis results"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import result_cache
+from analysis_logic import CopilotAnalyzer
+from result_cache import normalize_filters
+
+
+USAGE_CSV = """User Principal Name,Report Refresh Date,Last activity date of Copilot,Last activity date of Copilot Chat
+user1@example.com,2024-01-01,2024-01-01,
+user1@example.com,2024-02-01,,2024-02-01
+user2@example.com,2024-01-01,2024-01-01,2024-01-01
+user2@example.com,2024-02-01,2024-01-20,2024-01-25
+"""
+
+TARGET_CSV = """UserPrincipalName,Company,Department,City,ManagerLine
+user1@example.com,Contoso,Sales,Paris,Boss -> Lead A
+user2@example.com,Contoso,Finance,Lyon,Boss -> Lead B
+"""
+
+
+def _inputs(tmp_path):
+    (tmp_path / 'usage.csv').write_text(USAGE_CSV)
+    (tmp_path / 'target.csv').write_text(TARGET_CSV)
+    return {'usage.csv': str(tmp_path / 'usage.csv')}, str(tmp_path / 'target.csv')
+
+
+def _runner():
+    runner = CopilotAnalyzer(None, None)
+    runner.update_status = lambda msg: None
+    return runner
+
+
+def test_normalize_filters():
+    """Order, case and empty filters do not change the normalized form"""
+    a = normalize_filters({'managers': [' Lead A', 'boss'], 'companies': ['Contoso'], 'locations': []}, True)
+    b = normalize_filters({'companies': ['CONTOSO'], 'managers': ['Boss', 'lead a ']}, True)
+    assert a == b == {'companies': ['contoso'], 'managers': ['boss', 'lead a']}
+    assert normalize_filters({'companies': ['Contoso']}, False) == {}
+
+
+def test_identical_request_is_served_from_cache(tmp_path, monkeypatch):
+    """A repeated analysis with equivalent filters returns the stored result without recomputing"""
+    usage_files, target_file = _inputs(tmp_path)
+    first = _runner().execute_analysis(usage_files, target_file, {'managers': ['Boss']})
+    assert 'error' not in first
+
+    def fail(*args, **kwargs):
+        raise AssertionError("analysis should not run again")
+    monkeypatch.setattr(CopilotAnalyzer, 'run_analysis', fail)
+
+    runner = _runner()
+    second = runner.execute_analysis(usage_files, target_file, {'managers': ['boss '], 'companies': []})
+    assert second['reports']['excel_bytes'] == first['reports']['excel_bytes']
+    assert second['dashboard'] == first['dashboard']
+    assert runner.utilized_metrics_df is not None
+
+
+def test_engine_version_and_filters_invalidate(tmp_path, monkeypatch):
+    """Different filters or a new engine version run the analysis again"""
+    usage_files, target_file = _inputs(tmp_path)
+    runs = []
+    original = CopilotAnalyzer.run_analysis
+
+    def counting(self, *args, **kwargs):
+        runs.append(args)
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(CopilotAnalyzer, 'run_analysis', counting)
+
+    _runner().execute_analysis(usage_files, target_file, {})
+    _runner().execute_analysis(usage_files, target_file, {})
+    assert len(runs) == 1
+
+    _runner().execute_analysis(usage_files, target_file, {'managers': ['Lead A']})
+    assert len(runs) == 2
+
+    monkeypatch.setattr(result_cache, '_engine_version', 'upgraded')
+    _runner().execute_analysis(usage_files, target_file, {})
+    assert len(runs) == 3
+
+
+def test_errors_are_not_cached(tmp_path):
+    """Failed analyses are recomputed next time rather than memoized"""
+    usage_files, target_file = _inputs(tmp_path)
+    runner = _runner()
+    results = runner.execute_analysis(usage_files, target_file, {'managers': ['Nobody']})
+    assert 'error' in results
+    assert not any(name.startswith('result-') for name in os.listdir(runner.dataset_cache.folder))
+
+
+def test_engine_selection_invalidates(tmp_path, monkeypatch):
+    """Results computed by one engine selection are not served for another"""
+    usage_files, target_file = _inputs(tmp_path)
+    runs = []
+    original = CopilotAnalyzer.run_analysis
+
+    def counting(self, *args, **kwargs):
+        runs.append(args)
+        return original(self, *args, **kwargs)
+    monkeypatch.setattr(CopilotAnalyzer, 'run_analysis', counting)
+    monkeypatch.setitem(CopilotAnalyzer.USER_METRICS_ENGINES, 'candidate', '_user_metrics_reference')
+
+    _runner().execute_analysis(usage_files, target_file, {})
+    _runner().execute_analysis(usage_files, target_file, {})
+    assert len(runs) == 1
+
+    candidate = CopilotAnalyzer(progress=None, engines={'user_metrics': 'candidate'})
+    candidate.execute_analysis(usage_files, target_file, {})
+    assert len(runs) == 2
+
+    monkeypatch.setitem(config.ANALYSIS_ENGINES, 'user_metrics', 'candidate')
+    _runner().execute_analysis(usage_files, target_file, {})
+    assert len(runs) == 2  # same selection as the override above
+
+
+def test_engine_modules_cover_the_analysis_path():
+    """Modules whose code shapes the analysis output are hashed into the engine version"""
+    assert {'analysis_logic', 'rui_calculator', 'usage_reader', 'date_parsing', 'presets', 'config'} <= \
+        set(result_cache.ENGINE_MODULES)
+    assert all(os.path.exists(os.path.join(os.path.dirname(os.path.abspath(result_cache.__file__)), module + '.py'))
+               for module in result_cache.ENGINE_MODULES)
@@ -0,0 +1,119 @@
+"""Test job cost estimates and memory-aware admission control"""
+
+import gzip
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module
+from app import app, job_registry, socketio
+from jobs import CANCELLED
+from scheduler import JobEstimate, JobScheduler, estimate_job, estimate_rows, format_wait
+
+
+def _report(rows):
+    lines = ['User Principal Name,Report Refresh Date']
+    lines += [f'user{i}@example.com,2024-01-01' for i in range(rows)]
+    return '\n'.join(lines) + '\n'
+
+
+def _estimate(memory_mb, seconds=10.0):
+    estimate = JobEstimate(rows=0, users=0, ingest_bytes=0)
+    estimate.memory_bytes = memory_mb * 1024 ** 2
+    estimate.seconds = seconds
+    return estimate
+
+
+def test_row_and_user_estimates(tmp_path):
+    """Rows are counted or extrapolated per file; users come from the largest report, capped by the target"""
+    small = tmp_path / 'week1.csv'
+    small.write_text(_report(50))
+    assert estimate_rows(str(small)) == 50
+
+    large = tmp_path / 'week2.csv'
+    large.write_text(_report(20000))  # bigger than the sample, so extrapolated
+    assert abs(estimate_rows(str(large)) - 20000) < 1000
+
+    packed = tmp_path / 'week3.csv.gz'
+    packed.write_bytes(gzip.compress(_report(20000).encode()))
+    assert abs(estimate_rows(str(packed)) - 20000) < 2000
+
+    target = tmp_path / 'target.csv'
+    target.write_text(_report(30))
+    estimate = estimate_job([str(small), str(large)], str(target))
+    assert estimate.users == 30
+    assert estimate.rows >= 20000
+    assert estimate.memory_bytes > estimate_job([str(small)]).memory_bytes
+    assert estimate_job([str(tmp_path / 'missing.csv')]).rows == 0
+
+
+def test_jobs_queue_when_budget_is_exceeded():
+    """Jobs wait while the budget or the concurrency limit is used up and start in arrival order"""
+    started, notices = [], []
+    scheduler = JobScheduler(100 * 1024 ** 2, max_concurrent=3,
+                             on_queue_change=lambda job_id, position, eta: notices.append((job_id, position)))
+
+    assert scheduler.submit('a', _estimate(60), lambda: started.append('a')) == 0
+    assert scheduler.submit('b', _estimate(60), lambda: started.append('b')) == 1
+    # Small enough to fit, but must not overtake the queued job
+    assert scheduler.submit('c', _estimate(10), lambda: started.append('c')) == 2
+    assert started == ['a']
+    assert notices[-2:] == [('b', 1), ('c', 2)]
+
+    scheduler.finished('a')
+    assert started == ['a', 'b', 'c']
+    assert scheduler.queued_count() == 0 and scheduler.running_count() == 2
+
+
+def test_oversized_job_runs_alone_and_queued_jobs_can_be_removed():
+    """A job above the whole budget still runs once nothing else is; removed jobs never start"""
+    started = []
+    scheduler = JobScheduler(100 * 1024 ** 2, max_concurrent=2)
+    scheduler.submit('a', _estimate(10, seconds=120), lambda: started.append('a'))
+    scheduler.submit('huge', _estimate(500), lambda: started.append('huge'))
+    scheduler.submit('b', _estimate(10), lambda: started.append('b'))
+
+    status = scheduler.queue_status()
+    assert [(job_id, position) for job_id, position, _ in status] == [('huge', 1), ('b', 2)]
+    assert 100 < status[0][2] <= 120  # waits for 'a' to finish
+    assert status[1][2] > status[0][2]
+
+    assert scheduler.remove('b')
+    assert not scheduler.remove('b')
+    scheduler.finished('a')
+    assert started == ['a', 'huge']
+
+
+def test_format_wait():
+    assert format_wait(5) == 'under a minute'
+    assert format_wait(250) == '~4 min'
+
+
+def test_cancelling_queued_job_releases_it(tmp_path, monkeypatch):
+    """Cancelling a job that is still queued finishes it immediately without running it"""
+    emitted = []
+    monkeypatch.setattr(socketio, 'emit', lambda event, data, to=None: emitted.append((event, to)))
+    app.config['TESTING'] = True
+    app.config['TEMP_FOLDER'] = str(tmp_path)
+    app._janitor_started = True
+    monkeypatch.setattr(app_module, 'job_scheduler', JobScheduler(1, max_concurrent=1,
+                                                                  on_queue_change=app_module.notify_queue_position))
+    try:
+        with app.test_client() as client:
+            client.get('/')
+            with client.session_transaction() as sess:
+                user_id = sess['user_id']
+            running = job_registry.create(user_id)
+            queued = job_registry.create(user_id)
+            app_module.job_scheduler.submit(running.id, _estimate(10), lambda: None)
+            app_module.job_scheduler.submit(queued.id, _estimate(10), lambda: None)
+            assert queued.message.startswith('Queued: position 1')
+            assert emitted[-1] == ('status_update', f'job:{queued.id}')
+
+            assert client.post(f'/jobs/{queued.id}/cancel').status_code == 200
+            assert queued.state == CANCELLED
+            assert emitted[-1] == ('analysis_cancelled', f'job:{queued.id}')
+            assert app_module.job_scheduler.queued_count() == 0
+    finally:
+        app.config['TEMP_FOLDER'] = 'temp_uploads'
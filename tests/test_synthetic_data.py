@@ -0,0 +1,57 @@
+"""Test the synthetic usage report and manager tree generator"""
+
+import filecmp
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis_logic import CopilotAnalyzer
+from progress import NullProgressSink
+from synthetic_data import build_org, generate_dataset
+
+
+def test_same_seed_gives_identical_files(tmp_path):
+    first = generate_dataset(str(tmp_path / 'a'), users=120, weeks=4, seed=7)
+    second = generate_dataset(str(tmp_path / 'b'), users=120, weeks=4, seed=7)
+    other = generate_dataset(str(tmp_path / 'c'), users=120, weeks=4, seed=8)
+    for a, b in zip(first['usage'] + [first['target']], second['usage'] + [second['target']]):
+        assert filecmp.cmp(a, b, shallow=False)
+    assert not filecmp.cmp(first['usage'][-1], other['usage'][-1], shallow=False)
+
+
+def test_org_shape():
+    """ManagerLine follows manager.tree: immediate manager first, depth bounded, one root"""
+    org = build_org(np.random.default_rng(0), users=300, depth=3, fan_out=5)
+    assert list(org.columns[:5]) == ['UserPrincipalName', 'Company', 'Department', 'City', 'ManagerLine']
+    assert org['UserPrincipalName'].is_unique
+    chains = org['ManagerLine'].map(lambda line: line.split(' -> ') if line else [])
+    assert (chains.map(len) == 0).sum() == 1
+    assert chains.map(len).max() == 3
+    roots = {chain[-1] for chain in chains if chain}
+    assert len(roots) == 1
+
+
+def test_reports_feed_the_analysis(tmp_path):
+    """Generated reports have the export's columns and produce every classification"""
+    dataset = generate_dataset(str(tmp_path), users=150, weeks=20, tools=4, depth=3, fan_out=6, seed=1)
+    report = pd.read_csv(dataset['usage'][-1])
+    assert list(report.columns[:3]) == ['Report Refresh Date', 'User Principal Name', 'Display Name']
+    assert sum('Last activity date of' in col for col in report.columns) == 4
+    assert dataset['rows'] == sum(len(pd.read_csv(path)) for path in dataset['usage'])
+
+    usage = {os.path.basename(path): path for path in dataset['usage']}
+    results = CopilotAnalyzer(progress=NullProgressSink()).run_analysis(usage, dataset['target'], {})
+    assert 'error' not in results
+    metrics = results['deep_dive_data']['utilized_metrics_df']
+    assert {'New User', 'Consistent User', 'Coaching Opportunity'} <= set(metrics['Classification'])
+
+
+def test_rejects_bad_options(tmp_path):
+    with pytest.raises(ValueError):
+        generate_dataset(str(tmp_path), users=10, tools=99)
+    with pytest.raises(ValueError):
+        generate_dataset(str(tmp_path), users=10, adoption='sideways')
@@ -0,0 +1,67 @@
+"""Test TTL expiry, quotas and job protection for temp uploads"""
+
+import os
+import sys
+import time
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from temp_janitor import QuotaExceeded, TempJanitor
+
+
+def _session(root, name, size, age_seconds):
+    folder = root / name
+    folder.mkdir()
+    (folder / 'report.csv').write_bytes(b'x' * size)
+    stamp = time.time() - age_seconds
+    os.utime(str(folder), (stamp, stamp))
+    return folder
+
+
+def test_expired_sessions_are_removed(tmp_path):
+    """Sessions unused for longer than the TTL are deleted; recent ones are kept"""
+    old = _session(tmp_path, 'old', 10, 3600)
+    recent = _session(tmp_path, 'recent', 10, 60)
+    janitor = TempJanitor(str(tmp_path), ttl_seconds=600)
+
+    assert janitor.sweep() == ['old']
+    assert not old.exists() and recent.exists()
+
+
+def test_active_and_touched_sessions_survive(tmp_path):
+    """A running job or a fresh access protects an expired folder"""
+    running = _session(tmp_path, 'running', 10, 3600)
+    touched = _session(tmp_path, 'touched', 10, 3600)
+    janitor = TempJanitor(str(tmp_path), ttl_seconds=600)
+
+    janitor.acquire('running')
+    janitor.touch('touched')
+    assert janitor.sweep() == []
+    assert running.exists() and touched.exists()
+
+    janitor.release('running')  # releasing counts as an access
+    assert janitor.sweep() == []
+    assert sorted(janitor.sweep(now=time.time() + 3600)) == ['running', 'touched']
+    assert not running.exists() and not touched.exists()
+
+
+def test_global_quota_evicts_least_recently_used(tmp_path):
+    """Above the global quota the oldest inactive sessions go first"""
+    _session(tmp_path, 'a', 400, 300)
+    _session(tmp_path, 'b', 400, 200)
+    _session(tmp_path, 'c', 400, 100)
+    janitor = TempJanitor(str(tmp_path), ttl_seconds=3600, global_quota_bytes=900)
+    janitor.acquire('a')
+
+    assert janitor.sweep() == ['b']
+    assert sorted(os.listdir(str(tmp_path))) == ['a', 'c']
+
+
+def test_session_quota(tmp_path):
+    """Uploads that would take a session past its quota are refused"""
+    _session(tmp_path, 's', 500, 0)
+    janitor = TempJanitor(str(tmp_path), ttl_seconds=3600, session_quota_bytes=1000)
+    janitor.check_session_quota('s', 400)
+    with pytest.raises(QuotaExceeded):
+        janitor.check_session_quota('s', 600)
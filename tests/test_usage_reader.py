@@ -0,0 +1,147 @@
+"""Test the projected, typed usage report reader"""
+
+import gc
+import io
+import pandas as pd
+import pickle
+import pytest
+import sys
+import os
+import tracemalloc
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config
+import usage_reader
+from analysis_logic import CopilotAnalyzer
+from usage_reader import UsageStore, iter_usage_report_chunks, read_usage_report, usage_columns
+
+
+WIDE_USAGE_CSV = """Report Refresh Date,User Principal Name,Display Name,Department,Copilot Enabled Date,Last activity date of Microsoft Teams Copilot (UTC),Last activity date of Word Copilot (UTC),Copilot Chat Prompts
+2025-03-01,User1@Example.com,User One,Sales,2024-11-01,2025-02-27,,12
+2025-03-01,user2@example.com,User Two,Finance,2024-11-01,,2025-01-15,3
+2025-03-01,user3@example.com,User Three,Sales,,,,0
+"""
+
+EXPECTED_COLUMNS = [
+    'Report Refresh Date',
+    'User Principal Name',
+    'Last activity date of Microsoft Teams Copilot (UTC)',
+    'Last activity date of Word Copilot (UTC)'
+]
+
+
+@pytest.fixture
+def wide_csv(tmp_path):
+    path = tmp_path / 'CopilotActivityUserDetail.csv'
+    path.write_text(WIDE_USAGE_CSV)
+    return str(path)
+
+
+def test_usage_columns_projection():
+    """Only the UPN, report date and tool activity columns are kept"""
+    header = pd.read_csv(io.StringIO(WIDE_USAGE_CSV), nrows=0).columns
+    assert usage_columns(header) == EXPECTED_COLUMNS
+
+
+def test_read_csv_with_c_engine(wide_csv):
+    """C parser reads projected columns as strings and parses dates afterwards"""
+    df = read_usage_report(wide_csv, engine='c')
+    assert list(df.columns) == EXPECTED_COLUMNS
+    assert df['User Principal Name'].tolist() == ['User1@Example.com', 'user2@example.com', 'user3@example.com']
+    for col in ['Report Refresh Date', 'Last activity date of Word Copilot (UTC)']:
+        assert pd.api.types.is_datetime64_any_dtype(df[col])
+    assert df['Last activity date of Microsoft Teams Copilot (UTC)'].iloc[0] == pd.Timestamp('2025-02-27')
+    assert pd.isna(df['Last activity date of Microsoft Teams Copilot (UTC)'].iloc[1])
+
+
+@pytest.mark.skipif(not usage_reader.HAS_PYARROW, reason="pyarrow not installed")
+def test_pyarrow_engine_matches_c_engine(wide_csv):
+    """Both CSV engines expose the same frame to the analyzer"""
+    expected = read_usage_report(wide_csv, engine='c')
+    result = read_usage_report(wide_csv, engine='pyarrow')
+    assert list(result.columns) == EXPECTED_COLUMNS
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_read_excel_projection(wide_csv, tmp_path):
+    """Excel reports are projected the same way"""
+    xlsx_path = str(tmp_path / 'report.xlsx')
+    pd.read_csv(wide_csv).to_excel(xlsx_path, index=False)
+    df = read_usage_report(xlsx_path)
+    assert list(df.columns) == EXPECTED_COLUMNS
+    assert pd.api.types.is_datetime64_any_dtype(df['Report Refresh Date'])
+
+
+def test_chunked_read_matches_whole_read(wide_csv):
+    """Streaming in small chunks yields the same rows as a single read"""
+    expected = read_usage_report(wide_csv, engine='c')
+    expected['User Principal Name'] = expected['User Principal Name'].str.lower()
+
+    store = UsageStore()
+    for chunk in iter_usage_report_chunks(wide_csv, chunk_rows=1):
+        assert len(chunk) <= 1
+        store.append(chunk)
+    assert store.rows == 3
+
+    pd.testing.assert_frame_equal(store.to_frame(), expected, check_dtype=False)
+    assert len(store) == 0
+
+
+def test_chunked_read_applies_email_filter(wide_csv, tmp_path):
+    """Rows for users outside the email filter are dropped chunk by chunk, for CSV and Excel"""
+    xlsx_path = str(tmp_path / 'report.xlsx')
+    pd.read_csv(wide_csv).to_excel(xlsx_path, index=False)
+
+    for path in [wide_csv, xlsx_path]:
+        chunks = list(iter_usage_report_chunks(path, chunk_rows=2, emails={'user1@example.com', 'user3@example.com'}))
+        combined = pd.concat(chunks, ignore_index=True)
+        assert list(combined.columns) == EXPECTED_COLUMNS
+        assert combined['User Principal Name'].tolist() == ['user1@example.com', 'user3@example.com']
+        assert pd.api.types.is_datetime64_any_dtype(combined['Report Refresh Date'])
+
+
+def test_store_matches_concat_across_layouts(tmp_path):
+    """Chunks with different columns combine as pd.concat would, also after a cache round trip"""
+    first = pd.DataFrame({'User Principal Name': ['a@x.com', float('nan')],
+                          'Report Refresh Date': pd.to_datetime(['2025-01-01', None])})
+    second = pd.DataFrame({'User Principal Name': ['b@x.com'], 'Last activity date of Word Copilot': pd.to_datetime(['2025-01-02']),
+                           'Report Refresh Date': pd.to_datetime(['2025-01-03'])})
+    expected = pd.concat([first, second, first], ignore_index=True)
+
+    store, other = UsageStore(), UsageStore()
+    store.append(first)
+    other.extend([second, first])
+    store.merge(pickle.loads(pickle.dumps(other)))
+    assert len(store) == 3
+    pd.testing.assert_frame_equal(store.to_frame(), expected)
+
+
+def _write_usage_csv(path, rows):
+    with open(path, 'w') as f:
+        f.write('User Principal Name,Report Refresh Date,' + ','.join(f'Last activity date of Tool {t}' for t in range(6)) + '\n')
+        for i in range(rows):
+            activity = ['2025-01-%02d' % (1 + (i + t) % 28) if (i + t) % 3 else '' for t in range(6)]
+            f.write(f'User{i % 300}@Example.com,2025-{i % 12 + 1:02d}-01,' + ','.join(activity) + '\n')
+
+
+def test_chunked_ingest_peak_memory_follows_chunk_size(tmp_path, monkeypatch):
+    """Beyond the frame it returns, chunked ingest needs about the same memory for a report twice as long"""
+    monkeypatch.setattr(config, 'USAGE_INGEST_CHUNK_ROWS', 1000)
+    extra = []
+    for rows in (20000, 40000):
+        path = str(tmp_path / f'usage_{rows}.csv')
+        _write_usage_csv(path, rows)
+        analyzer = CopilotAnalyzer(progress=None)
+        gc.collect()
+        gc.disable()  # collections landing mid-run make the peak noisy
+        tracemalloc.start()
+        try:
+            usage_df = analyzer.load_usage_reports({'usage.csv': path})
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+            gc.enable()
+        assert len(usage_df) == rows
+        extra.append(peak - retained)
+    # Combining all chunks at the end used to need another copy of the whole frame
+    assert extra[1] < extra[0] * 1.3
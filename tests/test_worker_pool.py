@@ -0,0 +1,165 @@
+"""Test the pre-forked analysis worker pool"""
+
+import functools
+import os
+import sys
+import time
+
+import pytest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import metrics
+import presets
+import worker_pool
+from jobs import JobCancelled
+from progress import MemoryProgressSink
+from worker_pool import WorkerCrashed, WorkerPool
+
+
+TARGET_CSV = """UserPrincipalName,Company,Department,City,ManagerLine
+a@example.com,Contoso,Sales,Paris,Boss -> Big Boss
+b@example.com,Contoso,Sales,Paris,Big Boss
+"""
+
+
+def add(a, b=0):
+    return a + b
+
+
+def fail():
+    raise ValueError("boom")
+
+
+def pid():
+    return os.getpid()
+
+
+def crash():
+    os._exit(3)
+
+
+def wait_for_cancel(job_id):
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if worker_pool.cancel_requested():
+            raise JobCancelled(job_id)
+        time.sleep(0.01)
+    return 'not cancelled'
+
+
+def report_progress(job_id):
+    worker_pool.progress_sink(job_id).publish('halfway')
+    return worker_pool.in_worker()
+
+
+def look_up_cache(result):
+    metrics.CACHE_REQUESTS.inc(kind='pool-test', result=result)
+    metrics.JOB_QUEUE_WAIT.observe(0.25)
+    if result == 'miss':
+        raise ValueError("not cached")
+
+
+def preset_key(content_hash):
+    preset = presets.preset_for_hash(content_hash)
+    return preset.key if preset is not None else None
+
+
+@pytest.fixture
+def pool():
+    pools = []
+
+    def make(workers=1, **kwargs):
+        kwargs.setdefault('warm', None)
+        started = WorkerPool(workers, **kwargs).start()
+        pools.append(started)
+        return started
+    yield make
+    for started in pools:
+        started.shutdown()
+
+
+def test_results_and_exceptions(pool):
+    """Results come back through the future, and so do exceptions raised by the job"""
+    workers = pool(2)
+    assert workers.submit(add, 2, b=3).result(timeout=10) == 5
+    with pytest.raises(ValueError, match='boom'):
+        workers.submit(fail).result(timeout=10)
+    assert workers.submit(pid).result(timeout=10) != os.getpid()
+
+
+def test_recycles_after_max_jobs(pool):
+    """A worker is replaced by a fresh process after max_jobs_per_worker jobs"""
+    workers = pool(1, max_jobs_per_worker=2)
+    pids = [workers.submit(pid).result(timeout=10) for _ in range(4)]
+    assert pids[0] == pids[1] and pids[2] == pids[3]
+    assert pids[1] != pids[2]
+    assert workers.recycled == 2
+
+
+def test_recycles_above_memory_limit(pool):
+    """A worker whose resident memory exceeds the limit after a job is replaced"""
+    workers = pool(1, max_worker_rss_mb=1)
+    first, second = (workers.submit(pid).result(timeout=10) for _ in range(2))
+    assert first != second
+    assert workers.recycled >= 1
+
+
+def test_crashed_worker_is_replaced(pool):
+    """A worker that dies mid-job fails that job only"""
+    workers = pool(1)
+    with pytest.raises(WorkerCrashed):
+        workers.submit(crash).result(timeout=10)
+    assert workers.submit(add, 1).result(timeout=10) == 1
+
+
+def test_interrupt_running_job(pool):
+    """interrupt() raises the cancel flag checked by the running job"""
+    workers = pool(1)
+    future = workers.submit(wait_for_cancel, 'job-1')
+    deadline = time.time() + 10
+    while workers.stats()['busy'] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert workers.interrupt(future)
+    with pytest.raises(JobCancelled):
+        future.result(timeout=10)
+    # The flag is cleared for the next job
+    assert workers.submit(add, 1).result(timeout=10) == 1
+
+
+def test_progress_relayed_by_source(pool):
+    """Progress published in a worker reaches the parent's sink for that job"""
+    workers = pool(1)
+    assert workers.submit(report_progress, 'job-1').result(timeout=10) is True
+    sink = MemoryProgressSink()
+    deadline = time.time() + 5
+    while not sink.messages and time.time() < deadline:
+        workers.relay_progress({'job-1': sink}.get)
+        time.sleep(0.01)
+    assert sink.messages == ['halfway']
+    assert worker_pool.progress_sink('job-1').__class__.__name__ == 'NullProgressSink'
+
+
+def test_workers_inherit_preloaded_presets(pool, tmp_path):
+    """Presets loaded by the warm-up before forking are visible in every worker"""
+    path = tmp_path / 'target.csv'
+    path.write_text(TARGET_CSV, encoding='utf-8')
+    warm = functools.partial(presets.preload, {'demo': {'file_path': str(path), 'managers': ['Boss']}})
+    try:
+        workers = pool(2, warm=warm)
+        digest = presets.get_preset('demo').content_hash
+        assert {workers.submit(preset_key, digest).result(timeout=10) for _ in range(4)} == {'demo'}
+    finally:
+        presets.preload()
+
+
+def test_worker_metrics_reach_the_parent(pool):
+    """Metrics a job records in a worker are added to the parent's registry, even if the job fails"""
+    workers = pool(1)
+    waits = metrics.JOB_QUEUE_WAIT.count()
+    workers.submit(look_up_cache, 'hit').result(timeout=10)
+    workers.submit(look_up_cache, 'hit').result(timeout=10)
+    with pytest.raises(ValueError):
+        workers.submit(look_up_cache, 'miss').result(timeout=10)
+    assert metrics.CACHE_REQUESTS.value(kind='pool-test', result='hit') == 2
+    assert metrics.CACHE_REQUESTS.value(kind='pool-test', result='miss') == 1
+    assert metrics.JOB_QUEUE_WAIT.count() == waits + 3
@@ -0,0 +1,327 @@
+"""
+Usage Report Reader
+Reads Microsoft Copilot activity exports, keeping only the columns the analysis uses
+"""
+
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+from date_parsing import parse_date_columns
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+
+UPN_COLUMN = 'User Principal Name'
+REPORT_DATE_COLUMN = 'Report Refresh Date'
+TOOL_COLUMN_MARKER = 'Last activity date of'
+
+
+def is_usage_column(column) -> bool:
+    """True for the columns the analysis reads from an activity export"""
+    column = str(column)
+    return column in (UPN_COLUMN, REPORT_DATE_COLUMN) or TOOL_COLUMN_MARKER in column
+
+
+def usage_columns(columns) -> List[str]:
+    """Project a report header down to UPN, report date and per-tool activity columns"""
+    return [col for col in columns if is_usage_column(col)]
+
+
+def is_csv_report(file_path: str) -> bool:
+    """CSV reports, including gzip-compressed ones which pandas decompresses while reading"""
+    return file_path.lower().endswith(('.csv', '.csv.gz'))
+
+
+def csv_engine(engine: Optional[str] = None) -> str:
+    """CSV parser to use: pyarrow when installed, otherwise pandas' C parser"""
+    if engine:
+        return engine
+    return 'pyarrow' if HAS_PYARROW else 'c'
+
+
+def usage_dtypes(columns: List[str], engine: str) -> Dict[str, str]:
+    """
+    Explicit dtypes for the projected columns
+
+    The pyarrow engine parses ISO dates natively, so only the UPN is pinned to a string;
+    the C parser reads everything as strings and leaves dates to the format sniffer.
+    """
+    if engine == 'pyarrow':
+        return {col: 'str' for col in columns if col == UPN_COLUMN}
+    return {col: 'str' for col in columns}
+
+
+def filter_emails(df: pd.DataFrame, emails: Optional[Set[str]]) -> pd.DataFrame:
+    """Lower-case the UPN column and keep only rows for the given (lower-case) emails"""
+    df[UPN_COLUMN] = df[UPN_COLUMN].str.lower()
+    if emails is not None:
+        df = df[df[UPN_COLUMN].isin(emails)]
+    return df
+
+
+def read_usage_report(file_path: str, engine: Optional[str] = None, parse_dates: bool = True,
+                      emails: Optional[Set[str]] = None) -> pd.DataFrame:
+    """
+    Read one usage report (CSV or Excel) with column projection
+
+    Args:
+        file_path: Path to the activity export
+        engine: Force a CSV engine ('pyarrow' or 'c'); defaults to pyarrow when available
+        parse_dates: Convert the date columns to datetimes
+        emails: Optional set of lower-case emails to keep; other users' rows are dropped
+
+    Returns:
+        DataFrame with only the UPN, 'Report Refresh Date' and 'Last activity date of ...' columns
+    """
+    if is_csv_report(file_path):
+        header = pd.read_csv(file_path, nrows=0, encoding='utf-8-sig').columns
+        columns = usage_columns(header)
+        engine = csv_engine(engine)
+        df = pd.read_csv(
+            file_path,
+            usecols=columns,
+            dtype=usage_dtypes(columns, engine),
+            encoding='utf-8-sig',
+            engine=engine
+        )
+        # usecols does not preserve header order on every engine
+        if list(df.columns) != columns:
+            df = df[columns]
+    else:
+        df = pd.read_excel(file_path, usecols=is_usage_column, dtype={UPN_COLUMN: str})
+
+    if emails is not None:
+        df = filter_emails(df, emails)
+    if parse_dates:
+        parse_date_columns(df)
+    return df
+
+
+def _iter_excel_chunks(file_path: str, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    """Stream the first worksheet of an Excel report in chunks of projected rows"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        positions = [i for i, col in enumerate(header) if is_usage_column(col)]
+        columns = [str(header[i]) for i in positions]
+        buffer = []
+        for row in rows:
+            buffer.append([row[i] if i < len(row) else None for i in positions])
+            if len(buffer) >= chunk_rows:
+                yield pd.DataFrame(buffer, columns=columns)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=columns)
+    finally:
+        workbook.close()
+
+
+def iter_usage_report_chunks(file_path: str, chunk_rows: int,
+                             emails: Optional[Set[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Stream one usage report in chunks of at most chunk_rows rows
+
+    Each chunk is projected, lower-cased, filtered to the given emails and date-parsed
+    before the next one is read, so peak memory depends on chunk size rather than file size.
+    """
+    if is_csv_report(file_path):
+        header = pd.read_csv(file_path, nrows=0, encoding='utf-8-sig').columns
+        columns = usage_columns(header)
+        # pyarrow has no chunked reader in pandas; the C parser streams
+        chunks = pd.read_csv(
+            file_path,
+            usecols=columns,
+            dtype=usage_dtypes(columns, 'c'),
+            encoding='utf-8-sig',
+            chunksize=chunk_rows
+        )
+    else:
+        columns = None
+        chunks = _iter_excel_chunks(file_path, chunk_rows)
+
+    for chunk in chunks:
+        if columns is not None and list(chunk.columns) != columns:
+            chunk = chunk[columns]
+        chunk = filter_emails(chunk, emails)
+        if chunk.empty:
+            continue
+        parse_date_columns(chunk)
+        yield chunk
+
+
+# Rows of a text column encoded (pickling) or re-shared (merging) at a time
+SHARE_SLICE_ROWS = 8192
+
+
+def _missing(dtype: np.dtype, length: int) -> Optional[np.ndarray]:
+    """Missing values of a dtype, or None for dtypes that cannot hold them (ints, bools)"""
+    if dtype.kind in 'Mm':
+        return np.full(length, np.datetime64('NaT') if dtype.kind == 'M' else np.timedelta64('NaT'), dtype=dtype)
+    if dtype.kind in 'fcO':
+        return np.full(length, np.nan, dtype=dtype)
+    return None
+
+
+def _grow(values: np.ndarray, length: int) -> np.ndarray:
+    """values extended to length; resized in place when it owns its memory, which needs no copy"""
+    if values.base is None and values.flags.c_contiguous:
+        values.resize(length, refcheck=False)
+        return values
+    grown = np.empty(length, dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+class UsageStore:
+    """
+    Accumulates parsed usage chunks in compact form and builds the analysis frame from them
+
+    Each column is one array that grows in place as chunks arrive, and text values (the UPN)
+    are kept once however many rows share them, so the store holds little more than the
+    finished frame and to_frame hands its arrays over without copying them.
+    """
+
+    def __init__(self):
+        self._columns: Dict[str, np.ndarray] = {}
+        # One shared object per distinct text value
+        self._distinct: Dict = {}
+        # Object columns holding values other than text, which are stored as they are
+        self._opaque: Set[str] = set()
+        self._chunks = 0
+        self.rows = 0
+
+    def __getstate__(self) -> Dict:
+        # Pickled (for the dataset cache) without copying the data: dates as their int64 view
+        # and text as int32 codes into the distinct values, built a slice at a time
+        index = {value: code for code, value in enumerate(self._distinct)}
+        columns = {}
+        for column, values in self._columns.items():
+            if values.dtype.kind in 'Mm':
+                columns[column] = ('dates', values.dtype.str, values.view('i8'))
+            elif values.dtype == object and column not in self._opaque:
+                codes = np.empty(len(values), dtype=np.int32)
+                for offset in range(0, len(values), SHARE_SLICE_ROWS):
+                    part_codes, distinct = pd.factorize(values[offset:offset + SHARE_SLICE_ROWS])
+                    lookup = np.array([index[value] for value in distinct] + [-1], dtype=np.int32)
+                    codes[offset:offset + len(part_codes)] = lookup[part_codes]
+                columns[column] = ('text', None, codes)
+            else:
+                columns[column] = ('values', None, values)
+        return {'columns': columns, 'distinct': list(self._distinct), 'opaque': self._opaque,
+                'chunks': self._chunks, 'rows': self.rows}
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__init__()
+        self._distinct = {value: value for value in state['distinct']}
+        self._opaque, self._chunks, self.rows = state['opaque'], state['chunks'], state['rows']
+        lookup = np.empty(len(state['distinct']) + 1, dtype=object)
+        lookup[:-1] = list(self._distinct)
+        lookup[-1] = np.nan
+        columns = state['columns']
+        for column in list(columns):
+            kind, dtype, values = columns.pop(column)
+            self._columns[column] = (values.view(dtype) if kind == 'dates' else
+                                     lookup[values] if kind == 'text' else values)
+
+    def _shared(self, column: str, values: np.ndarray) -> np.ndarray:
+        """Text values replaced by the store's shared copy of each (missing ones by NaN); other objects are kept"""
+        if pd.api.types.infer_dtype(values, skipna=True) not in ('string', 'empty'):
+            self._opaque.add(column)
+            return np.array(values, dtype=object)
+        codes, distinct = pd.factorize(values)
+        shared = np.empty(len(distinct) + 1, dtype=object)
+        shared[:-1] = [self._distinct.setdefault(value, value) for value in distinct]
+        shared[-1] = np.nan  # code -1: missing
+        return shared[codes]
+
+    def _put(self, column: str, values: np.ndarray, start: int, end: int) -> None:
+        """Store values as rows start:end of column, which must already cover rows :start"""
+        stored = self._columns.get(column)
+        if stored is None:
+            stored = _missing(values.dtype, start) if start else np.empty(0, dtype=values.dtype)
+            if stored is None:
+                stored = np.full(start, np.nan)
+        if stored.dtype != values.dtype:
+            # Differently typed chunks: pandas picks the common type, as pd.concat would
+            stored = pd.concat([pd.Series(stored), pd.Series(values)], ignore_index=True).to_numpy()
+        else:
+            stored = _grow(stored, end)
+            stored[start:end] = values
+        self._columns[column] = stored
+
+    def _add(self, columns: Dict[str, np.ndarray], length: int) -> None:
+        start, end = self.rows, self.rows + length
+        for column, values in columns.items():
+            self._put(column, values, start, end)
+        self._pad(end)
+        self._chunks += 1
+        self.rows = end
+
+    def _pad(self, end: int) -> None:
+        """Fill columns missing from the latest rows with missing values, up to end"""
+        for column, stored in list(self._columns.items()):
+            if len(stored) < end:
+                missing = _missing(stored.dtype, end - len(stored))
+                self._put(column, np.full(end - len(stored), np.nan) if missing is None else missing, len(stored), end)
+
+    def append(self, chunk: pd.DataFrame) -> None:
+        columns = {}
+        for column in chunk.columns:
+            values = chunk[column].to_numpy()
+            columns[column] = self._shared(column, values) if values.dtype == object else values
+        self._add(columns, len(chunk))
+
+    def extend(self, chunks: Iterable[pd.DataFrame]) -> None:
+        for chunk in chunks:
+            self.append(chunk)
+
+    def merge(self, other: 'UsageStore') -> None:
+        """Add another store's rows (e.g. one report's, from the dataset cache), emptying it"""
+        if not other._chunks:
+            return
+        if not self._chunks:
+            self._columns, self._distinct, self._opaque = other._columns, other._distinct, other._opaque
+        else:
+            # Column by column, so at most one of the other store's columns is held twice
+            start, end = self.rows, self.rows + other.rows
+            for column in list(other._columns):
+                values = other._columns.pop(column)
+                if values.dtype == object and column in other._opaque:
+                    self._opaque.add(column)
+                    self._put(column, values, start, end)
+                elif values.dtype == object:
+                    for offset in range(0, len(values), SHARE_SLICE_ROWS):
+                        part = self._shared(column, values[offset:offset + SHARE_SLICE_ROWS])
+                        self._put(column, part, start + offset, start + offset + len(part))
+                else:
+                    self._put(column, values, start, end)
+                del values
+            self._pad(end)
+        self._chunks += other._chunks
+        self.rows += other.rows
+        other.__init__()
+
+    def __len__(self) -> int:
+        """Number of chunks stored"""
+        return self._chunks
+
+    def to_frame(self) -> pd.DataFrame:
+        """The combined frame, built on the stored arrays; the store is emptied"""
+        if not self._chunks:
+            return pd.DataFrame()
+        # An explicit dtype keeps pandas from re-inferring (and copying) the text columns
+        frame = pd.DataFrame({column: pd.Series(values, dtype=values.dtype, copy=False)
+                              for column, values in self._columns.items()}, copy=False)
+        self.__init__()
+        return frame
@@ -0,0 +1,261 @@
+"""
+Worker Pool
+Pre-forked analysis worker processes. The parent imports the analysis stack and preloads the
+preset hierarchies once, then forks, so every worker starts warm and shares that read-only data
+copy-on-write. Workers are replaced after a number of jobs or once their memory grows too large.
+"""
+
+import gc
+import logging
+import multiprocessing
+import pickle
+import queue as queue_module
+import signal
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from memory_guard import current_rss_bytes
+from metrics import REGISTRY
+from progress import NullProgressSink, ProgressSink, QueueProgressSink, relay_queue
+
+
+logger = logging.getLogger(__name__)
+
+MIB = 1024 * 1024
+
+
+class WorkerCrashed(RuntimeError):
+    """The worker process running a job exited before returning a result"""
+
+
+def warm_analysis_stack() -> None:
+    """Import everything an analysis needs and parse the presets, ahead of forking"""
+    import analysis_logic  # noqa: F401  (pandas, numpy, the pipeline modules)
+    import openpyxl.chart  # noqa: F401  (loaded lazily by create_excel_report otherwise)
+    import openpyxl.formatting.rule  # noqa: F401
+    import openpyxl.styles  # noqa: F401
+    import openpyxl.utils  # noqa: F401
+    import presets
+    presets.refresh()  # loads the presets unless the server already did
+
+
+# State of the current process when it is a pool worker
+_worker: Dict = {}
+
+
+def in_worker() -> bool:
+    return bool(_worker)
+
+
+def progress_sink(source: Optional[str] = None) -> ProgressSink:
+    """Progress sink that reaches the parent's WorkerPool.relay_progress (a no-op outside a worker)"""
+    if not _worker:
+        return NullProgressSink()
+    return QueueProgressSink(_worker['progress'], source)
+
+
+def cancel_requested() -> bool:
+    """Whether the parent asked to interrupt the job this worker is running"""
+    return bool(_worker) and _worker['cancel'].is_set()
+
+
+def _worker_main(conn, cancel_event, progress_queue, max_jobs: Optional[int], max_rss_bytes: Optional[int],
+                 warm: Optional[Callable]) -> None:
+    """
+    Run (fn, args, kwargs) tasks from conn and reply (status, value, retire, metric changes)
+    until retired; the parent merges the metrics each job recorded into its own registry
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C is handled by the server
+    _worker.update(cancel=cancel_event, progress=progress_queue)
+    if warm is not None:
+        warm()  # spawned workers share nothing with the parent
+    jobs = 0
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        fn, args, kwargs = task
+        cancel_event.clear()
+        before = REGISTRY.snapshot()
+        try:
+            status, value = 'ok', fn(*args, **kwargs)
+        except BaseException as e:  # JobCancelled derives from BaseException
+            status, value = 'error', e
+        jobs += 1
+        retire = (max_jobs is not None and jobs >= max_jobs) or \
+                 (max_rss_bytes is not None and current_rss_bytes() > max_rss_bytes)
+        changes = REGISTRY.changes(before)
+        try:
+            conn.send((status, value, retire, changes))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            conn.send(('error', RuntimeError(f"Job result could not be returned from the worker: {e}"), retire, changes))
+        if retire:
+            return
+
+
+class _WorkerSlot:
+    """One worker process and the parent thread that feeds it jobs and respawns it"""
+
+    def __init__(self, pool: 'WorkerPool', index: int):
+        self.pool = pool
+        self.index = index
+        self.cancel_event = pool.ctx.Event()
+        self.process = None
+        self.conn = None
+        self.current: Optional[Future] = None
+        self.jobs = 0
+        self.thread = threading.Thread(target=self._run, name=f"analysis-worker-{index}", daemon=True)
+
+    def spawn(self) -> None:
+        parent_conn, child_conn = self.pool.ctx.Pipe()
+        warm = self.pool.warm if self.pool.ctx.get_start_method() != 'fork' else None
+        self.process = self.pool.ctx.Process(
+            target=_worker_main, name=f"analysis-worker-{self.index}", daemon=True,
+            args=(child_conn, self.cancel_event, self.pool.progress_queue, self.pool.max_jobs,
+                  self.pool.max_rss_bytes, warm))
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.jobs = 0
+
+    def retire(self) -> None:
+        self.conn.close()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+    def _run(self) -> None:
+        while True:
+            item = self.pool.tasks.get()
+            if item is None:
+                self.stop()
+                return
+            future, task = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.current = future
+            try:
+                self.conn.send(task)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                self.current = None
+                future.set_exception(e)
+                continue
+            try:
+                status, value, retire, changes = self.conn.recv()
+            except (EOFError, OSError):
+                status, value, retire, changes = 'error', WorkerCrashed(
+                    f"Analysis worker {self.process.pid} exited with code {self.process.exitcode}"), True, {}
+            REGISTRY.merge(changes)
+            self.jobs += 1
+            if retire:
+                # Replaced before the result is handed out, so the next job finds a worker ready
+                logger.info("Recycling analysis worker %s after %d job(s)", self.process.pid, self.jobs)
+                self.retire()
+                self.pool.recycled += 1
+                self.spawn()
+            self.current = None
+            if status == 'ok':
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.retire()
+
+
+class WorkerPool:
+    """
+    Fixed number of pre-warmed worker processes running submitted functions
+
+    Functions, arguments and results cross the process boundary by pickling, so functions
+    must be importable module-level callables.
+    """
+
+    def __init__(self, workers: int, max_jobs_per_worker: Optional[int] = None,
+                 max_worker_rss_mb: Optional[float] = None, warm: Optional[Callable] = warm_analysis_stack):
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs_per_worker or None
+        self.max_rss_bytes = int(max_worker_rss_mb * MIB) if max_worker_rss_mb else None
+        self.warm = warm
+        # fork shares the warmed parent with the workers; elsewhere each worker warms itself
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.ctx = multiprocessing.get_context(start_method)
+        self.tasks: queue_module.Queue = queue_module.Queue()
+        self.progress_queue = None
+        self.slots: List[_WorkerSlot] = []
+        self.recycled = 0
+        self.started = False
+
+    def start(self) -> 'WorkerPool':
+        if self.started:
+            return self
+        if self.warm is not None and self.ctx.get_start_method() == 'fork':
+            self.warm()
+            # Keep the collector from touching (and so copying) the inherited objects in each worker
+            gc.collect()
+            gc.freeze()
+        self.progress_queue = self.ctx.Queue()
+        for index in range(self.workers):
+            slot = _WorkerSlot(self, index)
+            slot.spawn()
+            slot.thread.start()
+            self.slots.append(slot)
+        self.started = True
+        logger.info("Started %d analysis worker(s) (%s)", self.workers, self.ctx.get_start_method())
+        return self
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if not self.started:
+            raise RuntimeError("WorkerPool.start() must be called before submitting jobs")
+        future = Future()
+        self.tasks.put((future, (fn, args, kwargs)))
+        return future
+
+    def interrupt(self, future: Future) -> bool:
+        """
+        Ask the worker running `future` to stop at its next cancel_requested() check;
+        a job still waiting for a worker is cancelled outright
+        """
+        if future.cancel():
+            return True
+        for slot in self.slots:
+            if slot.current is future:
+                slot.cancel_event.set()
+                return True
+        return False
+
+    def relay_progress(self, sink_for: Callable[[Optional[str]], Optional[ProgressSink]]) -> int:
+        """Forward queued worker progress to the sink for each source, without blocking"""
+        if self.progress_queue is None:
+            return 0
+        return relay_queue(self.progress_queue, sink_for)
+
+    def stats(self) -> Dict:
+        return {
+            'workers': self.workers,
+            'pids': [slot.process.pid for slot in self.slots if slot.process is not None],
+            'busy': sum(1 for slot in self.slots if slot.current is not None),
+            'queued': self.tasks.qsize(),
+            'recycled': self.recycled,
+        }
+
+    def shutdown(self) -> None:
+        if not self.started:
+            return
+        for _ in self.slots:
+            self.tasks.put(None)
+        for slot in self.slots:
+            slot.thread.join(timeout=10)
+        self.slots = []
+        self.started = False
+        if gc.get_freeze_count():
+            gc.unfreeze()